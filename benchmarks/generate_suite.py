@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+'''
+
+    Write a synthetic slapaclsuite YAML file of a chosen size, for benchmarking.
+
+    The suite mixes plain tests with ones that use DN and peername
+    substitutions, several peernames, and several requestattrs, and every
+    expectation matches what the stub slapacl (stub_slapacl.py) will answer.
+
+'''
+import argparse
+import random
+import sys
+import yaml
+from stub_slapacl import verdict
+
+ATTRIBUTES = ['uid/read', 'cn/read', 'mail/read', 'sn/search', 'userPassword/auth',
+              'telephoneNumber/write', 'entry/add', 'objectClass/add', 'member/write']
+
+
+def generate_suite(test_count, stub_dir, config_dir='/etc/openldap/slapd.d', seed=0):
+    '''
+        Inputs: Integer   how many entries to put in the tests section
+                String+   directory holding the stub slapacl, used as scripting.path
+                String+   the -F argument to pass (the stub ignores it)
+                Integer   random seed, so the same arguments give the same suite
+        Returns: dict     a suite, ready to dump as YAML
+    '''
+    rng = random.Random(seed)
+    people = {f'person{x}': f'uid=person{x},ou=logins,dc=example' for x in range(200)}
+    hosts = {f'host{x}': f'10.{x // 250}.{x % 250}.1' for x in range(100)}
+
+    tests = []
+    for index in range(test_count):
+        test = {'description': f'synthetic test {index}'}
+
+        if rng.random() < 0.2:
+            authcdn = None
+        elif rng.random() < 0.5:
+            authcdn_key = rng.choice(sorted(people))
+            test['authcDN'] = f'SUB:{authcdn_key}'
+            authcdn = people[authcdn_key]
+        else:
+            authcdn = f'uid=user{rng.randrange(10000)},ou=logins,dc=example'
+            test['authcDN'] = authcdn
+
+        if rng.random() < 0.3:
+            requestdn_key = rng.choice(sorted(people))
+            test['requestDN'] = f'SUB:{requestdn_key}'
+            requestdn = people[requestdn_key]
+        else:
+            requestdn = f'uid=entry{rng.randrange(100000)},ou=people,dc=example'
+            test['requestDN'] = requestdn
+
+        attributes = rng.sample(ATTRIBUTES, rng.choice([1, 1, 1, 2, 3]))
+        test['requestattr'] = attributes[0] if len(attributes) == 1 else attributes
+
+        shape = rng.random()
+        if shape < 0.4:
+            peernames = [None]
+        elif shape < 0.7:
+            host = rng.choice(sorted(hosts))
+            test['peername'] = f'IPFOR:{host}'
+            peernames = [hosts[host]]
+        else:
+            peernames = [f'192.168.{rng.randrange(256)}.{rng.randrange(256)}'
+                         for _ in range(rng.choice([2, 3]))]
+            test['peername'] = peernames
+
+        if rng.random() < 0.1:
+            test['fetchentry'] = False
+        if rng.random() < 0.1:
+            test['ssf'] = rng.choice([56, 128, 256])
+
+        # One expectation covers the whole test, so only use the answers
+        # of tests whose checks all agree; flip the rest to one attribute.
+        answers = {verdict(authcdn, requestdn, attribute, peername)
+                   for attribute in attributes for peername in peernames}
+        if len(answers) > 1:
+            test['requestattr'] = attributes[0]
+            if len(peernames) > 1:
+                test['peername'] = peernames[0]
+                peernames = peernames[:1]
+            answers = {verdict(authcdn, requestdn, attributes[0], peernames[0])}
+        test['expects'] = answers.pop()
+        tests.append(test)
+
+    return {
+        'administrative': {
+            'name': f'synthetic-{test_count}',
+            'DN_substitutions_key': 'SUB:',
+            'DN_substitutions': people,
+            'peername_substitutions_key': 'IPFOR:',
+            'peername_substitutions': hosts,
+        },
+        'scripting': {
+            'executable': 'slapacl',
+            'path': [stub_dir],
+            'default_arguments': ['-F', config_dir],
+        },
+        'tests': tests,
+    }
+
+
+def main(prog_args=None):
+    ''' write a suite to a file '''
+    if prog_args is None:
+        prog_args = sys.argv
+    parser = argparse.ArgumentParser()
+    parser.description = 'Write a synthetic slapaclsuite test file'
+    parser.add_argument('--tests', type=int, default=1000, dest='tests',
+                        help='how many tests to write (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, dest='seed',
+                        help='random seed (default: 0)')
+    parser.add_argument('--stub-dir', required=True, dest='stub_dir',
+                        help='directory holding the stub slapacl')
+    parser.add_argument('output', help='YAML file to write')
+    options = parser.parse_args(prog_args[1:])
+
+    suite = generate_suite(options.tests, options.stub_dir, seed=options.seed)
+    with open(options.output, 'w') as output_fh:
+        yaml.safe_dump(suite, output_fh, default_flow_style=False, sort_keys=False)
+    return True
+
+
+if __name__ == '__main__':
+    if main():
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+'''
+
+    End-to-end benchmark of slapaclsuite against the stub slapacl.
+
+    Writes a synthetic suite, then times each phase of a run the way
+    `slapaclsuite` does it: ingest, validate, plan (generate the commands)
+    and run.  Results are printed as JSON, with the commit they were taken
+    on, so runs on different commits can be compared:
+
+        python3 benchmarks/run_benchmark.py --tests 10000 --jobs 8 > before.json
+
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import slapaclsuite  # noqa: E402 pylint: disable=wrong-import-position
+from generate_suite import generate_suite  # noqa: E402 pylint: disable=wrong-import-position
+from stub_slapacl import install_stub  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def git_commit():
+    ''' The commit we are benchmarking, if we can tell. '''
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return out.stdout.decode('ascii').strip()
+
+
+def peak_rss_kb(who=resource.RUSAGE_SELF):
+    ''' High-water mark of resident memory, in KiB (Linux reports ru_maxrss in KiB). '''
+    return resource.getrusage(who).ru_maxrss
+
+
+class PhaseTimer:
+    ''' Collects wall time, CPU time and peak RSS for each phase of a run. '''
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        ''' Time the body of a `with` block as the phase `name`. '''
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        yield
+        self.phases[name] = {
+            'wall_seconds': round(time.perf_counter() - wall_start, 6),
+            'cpu_seconds': round(time.process_time() - cpu_start, 6),
+            'peak_rss_kb': peak_rss_kb(),
+        }
+
+
+def run_benchmark(options, workdir):
+    '''
+        Inputs: argparse options (see main)
+                String+   scratch directory
+        Returns: dict     the benchmark report
+    '''
+    stub_dir = os.path.join(workdir, 'bin')
+    install_stub(stub_dir, latency=options.latency)
+    suite_file = os.path.join(workdir, 'suite.yaml')
+    suite = generate_suite(options.tests, stub_dir, seed=options.seed)
+    with open(suite_file, 'w') as output_fh:
+        yaml.safe_dump(suite, output_fh, default_flow_style=False, sort_keys=False)
+
+    timer = PhaseTimer()
+    with timer.phase('ingest'):
+        yaml_config = slapaclsuite.ingest_yaml_file(suite_file)
+    with timer.phase('validate'):
+        config_objects = slapaclsuite.validate_input(yaml_config)
+    with timer.phase('plan'):
+        command_count = slapaclsuite.count_commands(config_objects, batch=options.batch)
+        plan = slapaclsuite.generate_commands(config_objects, batch=options.batch)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {
+            'tests': options.tests,
+            'seed': options.seed,
+            'latency': options.latency,
+            'jobs': options.jobs,
+            'batch': options.batch,
+        },
+        'commands': command_count,
+    }
+    if options.no_run:
+        report['phases'] = timer.phases
+        return report
+
+    if options.run_limit is not None:
+        plan = plan[:options.run_limit]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            timer.phase('run'):
+        statuses = slapaclsuite.run_tests(iter(plan), jobs=options.jobs)
+    run_wall = timer.phases['run']['wall_seconds']
+    report['phases'] = timer.phases
+    report['commands_run'] = len(plan)
+    report['checks_run'] = len(statuses)
+    report['checks_passed'] = statuses.count('PASS')
+    report['throughput'] = {
+        'commands_per_second': round(len(plan) / run_wall, 3) if run_wall else None,
+        'checks_per_second': round(len(statuses) / run_wall, 3) if run_wall else None,
+    }
+    report['peak_child_rss_kb'] = peak_rss_kb(resource.RUSAGE_CHILDREN)
+    return report
+
+
+def main(prog_args=None):
+    ''' run one benchmark and print its report '''
+    if prog_args is None:
+        prog_args = sys.argv
+    parser = argparse.ArgumentParser()
+    parser.description = 'Benchmark slapaclsuite end to end against a stub slapacl'
+    parser.add_argument('--tests', type=int, default=1000, dest='tests',
+                        help='how many tests in the synthetic suite (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, dest='seed',
+                        help='random seed for the suite (default: 0)')
+    parser.add_argument('--latency', type=float, default=0.0, dest='latency',
+                        help='seconds each stub slapacl call takes (default: 0)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, dest='jobs',
+                        help='parallel slapacl calls (default: 1)')
+    parser.add_argument('--batch', action='store_true', default=False, dest='batch',
+                        help='batch requestattrs into one call')
+    parser.add_argument('--no-run', action='store_true', default=False, dest='no_run',
+                        help='stop after planning; do not run any commands')
+    parser.add_argument('--run-limit', type=int, default=None, dest='run_limit',
+                        help='only run the first N commands of the plan')
+    parser.add_argument('--output', default=None, dest='output',
+                        help='write the JSON report here instead of stdout')
+    options = parser.parse_args(prog_args[1:])
+
+    with tempfile.TemporaryDirectory(prefix='slapaclsuite-bench-') as workdir:
+        report = run_benchmark(options, workdir)
+    if options.output:
+        with open(options.output, 'w') as output_fh:
+            json.dump(report, output_fh, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print('')
+    return report.get('checks_passed') == report.get('checks_run')
+
+
+if __name__ == '__main__':
+    if main():
+        sys.exit(0)
+    sys.exit(1)
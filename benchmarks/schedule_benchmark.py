@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+'''
+
+    Benchmark of how long a parallel run takes, start to finish (its
+    makespan), with and without the longest-first schedule.
+
+    The stub slapacl is installed with some share of slow entries, then
+    the same plan is run:
+
+        plan                   in suite order, which also records each command's duration
+        plan_slowest_last      in suite order, but with the slow commands moved to the end
+        plan_shared_queue      in suite order, through the same shared queue as
+                               longest-first, so the two differ in nothing but the order
+        longest_first_guessed  longest first, with nothing but guesses to go on
+        longest_first          longest first, from the recorded durations
+
+    ideal_seconds is what no schedule can beat: the stub's sleeps spread
+    evenly over the jobs, or the longest one, whichever is longer.
+    Starting the stub's processes comes on top of that.
+
+        python3 benchmarks/schedule_benchmark.py --tests 500 --jobs 8 > schedule.json
+
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import slapaclsuite  # noqa: E402 pylint: disable=wrong-import-position
+from slapaclsuite.history import History  # noqa: E402 pylint: disable=wrong-import-position
+from generate_suite import generate_suite  # noqa: E402 pylint: disable=wrong-import-position
+from run_benchmark import git_commit  # noqa: E402 pylint: disable=wrong-import-position
+import stub_slapacl  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def schedule_benchmark(options, workdir):
+    '''
+        Inputs: argparse options (see main)
+                String+   scratch directory
+        Returns: dict     the benchmark report
+    '''
+    stub_dir = os.path.join(workdir, 'bin')
+    stub_slapacl.install_stub(stub_dir, latency=options.latency,
+                              slow_share=options.slow_share, slow_factor=options.slow_factor)
+    # The same settings here, to work out what the stub's sleeps add up to.
+    stub_slapacl.LATENCY = options.latency
+    stub_slapacl.SLOW_SHARE = options.slow_share
+    stub_slapacl.SLOW_FACTOR = options.slow_factor
+    suite = generate_suite(options.tests, stub_dir, seed=options.seed)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        config_objects = slapaclsuite.validate_input(suite)
+    plan = slapaclsuite.generate_commands(config_objects, batch=options.batch)
+
+    history = History(None)
+    makespans = {}
+
+    def run(name, commands, schedule=None, record=None):
+        ''' run the plan one way, and note how long it took '''
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+            slapaclsuite.run_tests(iter(commands), jobs=options.jobs, schedule=schedule,
+                                   record=record)
+            makespans[name] = round(time.perf_counter() - started, 6)
+
+    run('plan', plan, record=history.record)
+    run('plan_slowest_last', sorted(plan, key=history.estimate))
+    run('plan_shared_queue', plan, schedule=lambda x: 0)
+    run('longest_first_guessed', plan, schedule=History(None).estimate)
+    run('longest_first', plan, schedule=history.estimate)
+
+    delays = [stub_slapacl.delay(x[1]['script'][x[1]['script'].index('-b') + 1])
+              for x in plan]
+    ideal = max(sum(delays) / options.jobs, max(delays))
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {
+            'tests': options.tests,
+            'seed': options.seed,
+            'latency': options.latency,
+            'slow_share': options.slow_share,
+            'slow_factor': options.slow_factor,
+            'jobs': options.jobs,
+            'batch': options.batch,
+        },
+        'commands': len(plan),
+        'ideal_seconds': round(ideal, 6),
+        'makespan_seconds': makespans,
+    }
+
+
+def main(prog_args=None):
+    ''' run the benchmark and print its report '''
+    if prog_args is None:
+        prog_args = sys.argv
+    parser = argparse.ArgumentParser()
+    parser.description = 'Benchmark the longest-first schedule against the stub slapacl'
+    parser.add_argument('--tests', type=int, default=500, dest='tests',
+                        help='how many tests in the synthetic suite (default: 500)')
+    parser.add_argument('--seed', type=int, default=0, dest='seed',
+                        help='random seed for the suite (default: 0)')
+    parser.add_argument('--latency', type=float, default=0.01, dest='latency',
+                        help='seconds each ordinary stub slapacl call takes (default: 0.01)')
+    parser.add_argument('--slow-share', type=float, default=0.02, dest='slow_share',
+                        help='the share of requestDNs whose calls are slow (default: 0.02)')
+    parser.add_argument('--slow-factor', type=float, default=50.0, dest='slow_factor',
+                        help='how many times longer a slow call takes (default: 50)')
+    parser.add_argument('-j', '--jobs', type=int, default=8, dest='jobs',
+                        help='parallel slapacl calls (default: 8)')
+    parser.add_argument('--batch', action='store_true', default=False, dest='batch',
+                        help='batch requestattrs into one call')
+    parser.add_argument('--output', default=None, dest='output',
+                        help='write the JSON report here instead of stdout')
+    options = parser.parse_args(prog_args[1:])
+
+    with tempfile.TemporaryDirectory(prefix='slapaclsuite-bench-') as workdir:
+        report = schedule_benchmark(options, workdir)
+    if options.output:
+        with open(options.output, 'w') as output_fh:
+            json.dump(report, output_fh, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print('')
+    return True
+
+
+if __name__ == '__main__':
+    if main():
+        sys.exit(0)
+    sys.exit(1)
@@ -0,0 +1,127 @@
+'''
+
+    A stand-in for slapacl(8), for benchmarking slapaclsuite without an
+    OpenLDAP install.
+
+    It takes the same command line that slapaclsuite builds, waits for a
+    configurable time to stand in for slapacl's config parsing, and then
+    answers each requested attribute on stderr, the way slapacl does.
+    The answer is a fixed function of who is asking about what, so a
+    suite written with `verdict` below always passes.
+
+    install_stub() writes a copy of this file, with its latency set, as an
+    executable named `slapacl` that a suite can find through scripting.path.
+
+'''
+import os
+import stat
+import sys
+import time
+import zlib
+
+# install_stub() rewrites these lines.
+LATENCY = 0.0
+SLOW_SHARE = 0.0
+SLOW_FACTOR = 1.0
+
+# slapacl options that take an argument.
+OPTIONS_WITH_ARGUMENTS = ('-b', '-D', '-d', '-F', '-f', '-n', '-o', '-U', '-X')
+
+
+def verdict(authcdn, requestdn, attribute, peername=None):
+    '''
+        The stub's access policy: a fixed pseudo-random answer per question.
+        Inputs: None or String+   who is asking
+                String+           which entry
+                String+           attr[/access[:value]]
+                None or String+   which IP they ask from
+        Returns: "ALLOWED" or "DENIED", roughly three to one
+    '''
+    question = f'{authcdn}|{requestdn}|{attribute}|{peername}'.encode('utf-8')
+    if zlib.crc32(question) % 4:
+        return 'ALLOWED'
+    return 'DENIED'
+
+
+def delay(requestdn):
+    '''
+        How long the stub takes to answer about an entry.  A SLOW_SHARE of
+        entries, always the same ones, take SLOW_FACTOR times as long, the
+        way a big subtree or a regex ACL would.
+        Inputs: None or String+   which entry
+        Returns: Float   seconds
+    '''
+    if zlib.crc32(f'{requestdn}'.encode('utf-8')) % 10000 < SLOW_SHARE * 10000:
+        return LATENCY * SLOW_FACTOR
+    return LATENCY
+
+
+def main(argv):
+    ''' Answer like slapacl would. '''
+    authcdn = None
+    requestdn = None
+    peername = None
+    attributes = []
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in OPTIONS_WITH_ARGUMENTS:
+            value = next(args, None)
+            if value is None:
+                print(f'{argv[0]}: option {arg} needs an argument', file=sys.stderr)
+                return 1
+            if arg == '-D':
+                authcdn = value
+            elif arg == '-b':
+                requestdn = value
+            elif arg == '-o' and value.startswith('peername=IP='):
+                peername = value[len('peername=IP='):]
+        elif arg.startswith('-'):
+            continue
+        else:
+            attributes.append(arg)
+
+    if LATENCY:
+        time.sleep(delay(requestdn))
+
+    if authcdn is None:
+        print('authcDN: "cn=anonymous"', file=sys.stderr)
+    else:
+        print(f'authcDN: "{authcdn.lower()}"', file=sys.stderr)
+    for attribute in attributes or ['entry']:
+        (name, _, access) = attribute.partition('/')
+        access = access.partition(':')[0] or 'read'
+        answer = verdict(authcdn, requestdn, attribute, peername)
+        print(f'{access} access to {name}: {answer}', file=sys.stderr)
+    return 0
+
+
+def install_stub(directory, latency=0.0, slow_share=0.0, slow_factor=1.0):
+    '''
+        Write an executable `slapacl` stub into a directory.
+        Inputs: String+   directory to write into (created if need be)
+                Float     seconds each call should take
+                Float     the share of requestDNs whose calls are slow, 0 to 1
+                Float     how many times longer a slow call takes
+        Returns: String+  the path of the stub
+
+        slapaclsuite runs slapacl with only scripting.path in its environment,
+        so the stub names this interpreter outright rather than relying on
+        finding python3 on the PATH.
+    '''
+    with open(os.path.abspath(__file__), 'r') as source_fh:
+        source = source_fh.read()
+    source = source.replace('\nLATENCY = 0.0\n', f'\nLATENCY = {float(latency)!r}\n', 1)
+    source = source.replace('\nSLOW_SHARE = 0.0\n', f'\nSLOW_SHARE = {float(slow_share)!r}\n', 1)
+    source = source.replace('\nSLOW_FACTOR = 1.0\n', f'\nSLOW_FACTOR = {float(slow_factor)!r}\n',
+                            1)
+    os.makedirs(directory, exist_ok=True)
+    stub_path = os.path.join(directory, 'slapacl')
+    with open(stub_path, 'w') as stub_fh:
+        stub_fh.write(f'#!{sys.executable}\n')
+        stub_fh.write(source)
+    os.chmod(stub_path, os.stat(stub_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return stub_path
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+'''
+
+    Benchmark of validate_input alone.
+
+    Builds a synthetic suite in memory (no YAML, no slapacl), then
+    validates it several times and reports the best run, so the figure is
+    about the validators and not about parsing or the machine being busy.
+    Results are printed as JSON, with the commit they were taken on:
+
+        python3 benchmarks/validate_benchmark.py --tests 100000 > before.json
+
+'''
+import argparse
+import contextlib
+import copy
+import json
+import os
+import platform
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import slapaclsuite  # noqa: E402 pylint: disable=wrong-import-position
+from generate_suite import generate_suite  # noqa: E402 pylint: disable=wrong-import-position
+from run_benchmark import git_commit  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def validate_benchmark(options):
+    '''
+        Inputs: argparse options (see main)
+        Returns: dict     the benchmark report
+    '''
+    suite = generate_suite(options.tests, '/usr/sbin', seed=options.seed)
+    timings = []
+    for _ in range(options.repeat):
+        # validate_input may rewrite what it is given, so each run gets a fresh copy.
+        suite_copy = copy.deepcopy(suite)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+            slapaclsuite.validate_input(suite_copy, jobs=options.jobs)
+            timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {
+            'tests': options.tests,
+            'seed': options.seed,
+            'repeat': options.repeat,
+            'jobs': options.jobs,
+        },
+        'best_seconds': round(best, 6),
+        'all_seconds': [round(x, 6) for x in timings],
+        'tests_per_second': round(options.tests / best, 1) if best else None,
+    }
+
+
+def main(prog_args=None):
+    ''' run the benchmark and print its report '''
+    if prog_args is None:
+        prog_args = sys.argv
+    parser = argparse.ArgumentParser()
+    parser.description = 'Benchmark validate_input on a synthetic suite'
+    parser.add_argument('--tests', type=int, default=100000, dest='tests',
+                        help='how many tests in the synthetic suite (default: 100000)')
+    parser.add_argument('--seed', type=int, default=0, dest='seed',
+                        help='random seed for the suite (default: 0)')
+    parser.add_argument('--repeat', type=int, default=5, dest='repeat',
+                        help='how many times to validate it; the best run counts (default: 5)')
+    parser.add_argument('--jobs', type=int, default=1, dest='jobs',
+                        help='how many processes to validate in (default: 1)')
+    parser.add_argument('--output', default=None, dest='output',
+                        help='write the JSON report here instead of stdout')
+    options = parser.parse_args(prog_args[1:])
+
+    report = validate_benchmark(options)
+    if options.output:
+        with open(options.output, 'w') as output_fh:
+            json.dump(report, output_fh, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print('')
+    return True
+
+
+if __name__ == '__main__':
+    if main():
+        sys.exit(0)
+    sys.exit(1)
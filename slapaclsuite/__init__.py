@@ -1,13 +1,35 @@
 '''
     This export set covers the basic flow of a run.
     ingest_yaml_file  - read in the test cases
+    load_suite        - read in and validate test cases spread over several files.
     validate_input    - validate the user-defined test cases are good, and slightly massage them
                         into a form where they will be consistent.
     generate_commands - make the commands that we will run.
+    iter_commands     - the same, one command at a time, for big suites.
+    count_commands    - how many commands there will be, without making them.
     run_tests         - run those commands.
+    iter_results      - run those commands, and yield a Result for each check as it is known.
+    report_results    - print Results for people to read, as run_tests does.
+    EarlyStop         - when to give up on a run that is failing.
+    ResultCache       - remember slapacl answers between runs, for run_tests.
+    SuiteCache        - remember validated test files between runs.
+    run_incremental   - generate_commands + run_tests, for only the tests that changed.
+    run_impact        - generate_commands + run_tests, for only the checks an olcAccess
+                        change between two slapd.d trees can affect.
+    Timings           - where the time in a run went.
 '''
 from .readfile import ingest_yaml_file
+from .suite import load_suite
 from .yaml_input_validator import validate_input
-from .commands import generate_commands, run_tests
+from .commands import generate_commands, iter_commands, count_commands, run_tests, \
+    iter_results, report_results
+from .results import Result, EarlyStop
+from .cache import ResultCache, SuiteCache
+from .incremental import run_incremental
+from .impact import run_impact
+from .timings import Timings, timed_run
 
-__all__ = ['ingest_yaml_file', 'validate_input', 'generate_commands', 'run_tests']
+__all__ = ['ingest_yaml_file', 'load_suite', 'validate_input', 'generate_commands', 'iter_commands',
+           'count_commands', 'run_tests', 'iter_results', 'report_results', 'Result',
+           'EarlyStop',
+           'ResultCache', 'SuiteCache', 'run_incremental', 'run_impact', 'Timings', 'timed_run']
@@ -8,13 +8,156 @@
     https://www.openldap.org/doc/admin24/access-control.html
 
 '''
+import os
 import sys
 import argparse
+import collections
 import slapaclsuite
+from slapaclsuite.incremental import default_state_file
+from slapaclsuite.cache import default_cache_dir
+from slapaclsuite.native import NativeBackend, Unsupported, report_coverage
+from slapaclsuite.sample import STRATEGIES, Sampler
+from slapaclsuite.shard import Shard, merge_results
+from slapaclsuite.history import History, default_history_file, last_failed, plan_shards, \
+    prioritize
+
+# Exit statuses.
+EXIT_OK = 0
+EXIT_FAILED = 1      # a check did not pass, or the input was bad
+EXIT_STOPPED = 3     # the run was stopped early by --maxfail or --breaker
+
+
+def _positive_int(value):
+    ''' argparse type for options that need a count of at least 1 '''
+    try:
+        retval = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not an integer')
+    if retval < 1:
+        raise argparse.ArgumentTypeError(f'"{value}" must be 1 or greater')
+    return retval
+
+
+def _non_negative_int(value):
+    ''' argparse type for options where 0 turns something off '''
+    try:
+        retval = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not an integer')
+    if retval < 0:
+        raise argparse.ArgumentTypeError(f'"{value}" must be 0 or greater')
+    return retval
+
+
+def _fraction(value):
+    ''' argparse type: a number more than 0 and at most 1 '''
+    try:
+        retval = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not a number')
+    if not 0 < retval <= 1:
+        raise argparse.ArgumentTypeError(f'"{value}" must be more than 0 and at most 1')
+    return retval
+
+
+def _shard(value):
+    ''' argparse type: INDEX/COUNT, with 1 <= INDEX <= COUNT '''
+    (index, _, count) = value.partition('/')
+    try:
+        retval = (int(index), int(count))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not INDEX/COUNT, like 2/4')
+    if not 1 <= retval[0] <= retval[1]:
+        raise argparse.ArgumentTypeError(f'"{value}" needs 1 <= INDEX <= COUNT')
+    return retval
+
+
+def _record_with(recorders):
+    '''
+        Inputs: [callable]*   things that want each Result of a run
+        Returns: None, or one callable for run_tests' record= that hands a Result to all of them
+    '''
+    if not recorders:
+        return None
+    if len(recorders) == 1:
+        return recorders[0]
+
+    def record(result):
+        ''' hand the result on to each '''
+        for recorder in recorders:
+            recorder(result)
+    return record
+
+
+def _history(options):
+    '''
+        Returns: None, or the History a run should keep its durations in
+    '''
+    if options.history_file:
+        return History(options.history_file, backend=options.backend)
+    if options.no_cache:
+        return None
+    return History(default_history_file(options.cache_dir), backend=options.backend)
+
+
+def _load_suite(options, timings):
+    '''
+        Read and validate the test files named on the command line.
+        Returns: None if they could not be read, or the validated config
+    '''
+    paths = options.test_yaml_file
+    cache_dir = None if options.no_cache else (options.cache_dir or default_cache_dir())
+    if len(paths) > 1 or os.path.isdir(paths[0]):
+        try:
+            return slapaclsuite.load_suite(paths, cache_dir=cache_dir, jobs=options.jobs,
+                                           verbose=options.verbose,
+                                           refresh=options.refresh_cache, timings=timings,
+                                           validate_jobs=options.validate_jobs)
+        except Exception as fileread_err:  # pylint: disable=broad-except
+            print(fileread_err, file=sys.stderr)
+            return None
+
+    suite_cache = None
+    suite_key = None
+    if cache_dir is not None:
+        # An unchanged test file need not be read or validated again.
+        suite_cache = slapaclsuite.SuiteCache(cache_dir)
+        with timings.phase('ingest'):
+            suite_key = suite_cache.key(paths[0])
+            if suite_key is not None and not options.refresh_cache:
+                config_objects = suite_cache.get(suite_key)
+                if config_objects is not None and \
+                        not config_objects['administrative'].tables_changed():
+                    if options.verbose:
+                        print(f'# {paths[0]} is unchanged, using its validated suite '
+                              f'from the cache')
+                    return config_objects
+    try:
+        with timings.phase('ingest'):
+            yaml_config = slapaclsuite.ingest_yaml_file(paths[0])
+        if isinstance(yaml_config, dict) and yaml_config.get('include'):
+            # The files it includes are cached one by one, not in its entry.
+            return slapaclsuite.load_suite(paths, cache_dir=cache_dir, jobs=options.jobs,
+                                           verbose=options.verbose,
+                                           refresh=options.refresh_cache, timings=timings,
+                                           validate_jobs=options.validate_jobs)
+    except Exception as fileread_err:  # pylint: disable=broad-except
+        print(fileread_err, file=sys.stderr)
+        return None
+    with timings.phase('validate'):
+        config_objects = slapaclsuite.validate_input(
+            yaml_config, verbose=options.verbose, jobs=options.validate_jobs,
+            cache_dir=cache_dir, base_dir=os.path.dirname(os.path.abspath(paths[0])))
+    if suite_key is not None:
+        suite_cache.put(suite_key, config_objects)
+    return config_objects
 
 
 def main(prog_args=None):
-    ''' main function '''
+    '''
+        main function
+        Returns: Integer   exit status: EXIT_OK, EXIT_FAILED or EXIT_STOPPED
+    '''
     if prog_args is None:
         prog_args = sys.argv
     parser = argparse.ArgumentParser()
@@ -29,23 +172,396 @@ def main(prog_args=None):
                         default=False,
                         dest='verbose',
                         help='explain what we are doing')
+    parser.add_argument('--progress',
+                        action='store_true',
+                        default=False,
+                        dest='progress',
+                        help='show progress and an estimated time left on stderr')
+    parser.add_argument('--batch',
+                        action='store_true',
+                        default=False,
+                        dest='batch',
+                        help='check all requestattrs of a test in one slapacl call')
+    parser.add_argument('-j', '--jobs',
+                        type=_positive_int,
+                        default=os.cpu_count() or 1,
+                        dest='jobs',
+                        help='how many slapacl checks to run at once (default: number of CPUs)')
+    parser.add_argument('--validate-jobs',
+                        type=_positive_int,
+                        default=1,
+                        dest='validate_jobs',
+                        metavar='N',
+                        help='validate a large tests section in chunks over N processes '
+                             '(default: 1; pickling the chunks costs more than it saves '
+                             'unless there are many tests and several cores)')
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--no-cache',
+                             action='store_true',
+                             default=False,
+                             dest='no_cache',
+                             help='always run slapacl, do not use or update the result cache')
+    cache_group.add_argument('--refresh-cache',
+                             action='store_true',
+                             default=False,
+                             dest='refresh_cache',
+                             help='run slapacl for every check, and rebuild the result cache')
+    parser.add_argument('--cache-dir',
+                        default=None,
+                        dest='cache_dir',
+                        help='where to keep the result cache (default: ~/.cache/slapaclsuite)')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        default=False,
+                        dest='incremental',
+                        help='only re-run tests that are new, changed, or failed last time')
+    parser.add_argument('--state-file',
+                        default=None,
+                        dest='state_file',
+                        help='where --incremental keeps its state (default: in the cache dir)')
+    parser.add_argument('--timings',
+                        action='store_true',
+                        default=False,
+                        dest='timings',
+                        help='report where the time went: per phase, and per slapacl call')
+    parser.add_argument('--timings-json',
+                        default=None,
+                        dest='timings_json',
+                        metavar='FILE',
+                        help='write the --timings report to FILE as JSON')
+    parser.add_argument('--slowest',
+                        type=_positive_int,
+                        default=10,
+                        dest='slowest',
+                        help='how many of the slowest checks --timings lists (default: 10)')
+    parser.add_argument('--maxfail',
+                        type=_positive_int,
+                        default=None,
+                        dest='maxfail',
+                        help='stop the run after this many checks have not passed')
+    parser.add_argument('--breaker',
+                        type=_non_negative_int,
+                        default=10,
+                        dest='breaker',
+                        help='stop the run if the first this-many slapacl calls all fail with '
+                             'the same error (default: 10, 0 to never stop)')
+    parser.add_argument('--backend',
+                        choices=['slapacl', 'native'],
+                        default='slapacl',
+                        dest='backend',
+                        help='run slapacl for every check, or evaluate the olcAccess rules '
+                             'of the -F slapd.d in-process where we can (default: slapacl)')
+    parser.add_argument('--cross-check',
+                        type=_positive_int,
+                        default=None,
+                        dest='cross_check',
+                        metavar='N',
+                        help='with --backend native, re-check N random answers with slapacl')
+    parser.add_argument('--acl-coverage',
+                        action='store_true',
+                        default=False,
+                        dest='acl_coverage',
+                        help='report which olcAccess rules of the -F slapd.d the tests\' '
+                             'requestDNs reach, and run nothing')
+    parser.add_argument('--impact',
+                        nargs=2,
+                        default=None,
+                        dest='impact',
+                        metavar=('BASELINE', 'CANDIDATE'),
+                        help='run only the checks that the olcAccess differences between two '
+                             'slapd.d trees can affect, against CANDIDATE')
+    parser.add_argument('--sample',
+                        choices=list(STRATEGIES),
+                        default=None,
+                        dest='sample',
+                        help='run a reproducible subset of the checks: a random fraction, '
+                             'stratified (every test, and every attribute of the suite, at '
+                             'least once), or pairwise')
+    parser.add_argument('--sample-fraction',
+                        type=_fraction,
+                        default=0.1,
+                        dest='sample_fraction',
+                        help='the share of checks --sample random/stratified keeps '
+                             '(default: 0.1)')
+    parser.add_argument('--sample-seed',
+                        type=_non_negative_int,
+                        default=0,
+                        dest='sample_seed',
+                        help='the seed --sample picks with; the same seed picks the same '
+                             'checks (default: 0)')
+    parser.add_argument('--shard',
+                        type=_shard,
+                        default=None,
+                        dest='shard',
+                        metavar='INDEX/COUNT',
+                        help='run only shard INDEX of COUNT of the checks, for splitting a '
+                             'suite over several machines')
+    parser.add_argument('--shard-by',
+                        choices=['hash', 'duration'],
+                        default='hash',
+                        dest='shard_by',
+                        help='split --shard by a hash of each command, or into shards of '
+                             'even expected duration, from the --history-file (default: hash)')
+    parser.add_argument('--history-file',
+                        default=None,
+                        dest='history_file',
+                        metavar='FILE',
+                        help='where to keep how long each command took, and how it ended '
+                             '(default: in the cache dir; none with --no-cache)')
+    parser.add_argument('--schedule',
+                        choices=['plan', 'longest-first'],
+                        default='plan',
+                        dest='schedule',
+                        help='with --jobs, start checks in suite order, or the ones expected '
+                             'to take longest first, from the --history-file (default: plan)')
+    parser.add_argument('--failed-first',
+                        action='store_true',
+                        default=False,
+                        dest='failed_first',
+                        help='run the checks that did not pass last time before the rest')
+    parser.add_argument('--changed-first',
+                        action='store_true',
+                        default=False,
+                        dest='changed_first',
+                        help='run new and changed checks before the rest (after the failed '
+                             'ones, with --failed-first)')
+    parser.add_argument('--last-failed',
+                        action='store_true',
+                        default=False,
+                        dest='last_failed',
+                        help='run only the checks that did not pass last time')
+    parser.add_argument('--results-jsonl',
+                        default=None,
+                        dest='results_jsonl',
+                        metavar='FILE',
+                        help='write every check\'s result to FILE as JSON lines, for '
+                             'slapaclsuite-merge')
     parser.add_argument('test_yaml_file',
+                        nargs='+',
                         metavar='your_test_file.yaml',
-                        help='YAML file that defines our tests')
+                        help='YAML file that defines our tests; or several, or directories '
+                             'of them, that together make one suite')
     options = parser.parse_args(prog_args[1:])
+    if options.cross_check and options.backend != 'native':
+        parser.error('--cross-check needs --backend native')
+    if options.impact and options.incremental:
+        parser.error('--impact and --incremental can not be used together')
+    if options.sample and (options.impact or options.incremental):
+        parser.error('--sample can not be used with --impact or --incremental')
+    if (options.shard or options.results_jsonl) and (options.impact or options.incremental):
+        parser.error('--shard and --results-jsonl can not be used with --impact or '
+                     '--incremental')
+    if options.shard_by == 'duration' and options.shard and not options.history_file:
+        parser.error('--shard-by duration needs a --history-file that every shard shares, '
+                     'so they all deal out the commands the same way')
+    ordering = options.failed_first or options.changed_first or options.last_failed
+    if options.last_failed and (options.shard or options.results_jsonl):
+        parser.error('--last-failed runs only part of the plan, so its results can not be '
+                     'sharded or merged')
+    if ordering and (options.impact or options.incremental):
+        parser.error('--failed-first, --changed-first and --last-failed can not be used with '
+                     '--impact or --incremental')
+    if (options.failed_first or options.changed_first) and options.schedule == 'longest-first':
+        parser.error('--failed-first and --changed-first run checks in an order of their own, '
+                     'so they can not be used with --schedule longest-first')
+    if ordering and options.no_cache and not options.history_file:
+        parser.error('--failed-first, --changed-first and --last-failed need the history of '
+                     'the last run: leave out --no-cache, or give --history-file')
 
+    timings = slapaclsuite.Timings()
+    config_objects = _load_suite(options, timings)
+    if config_objects is None:
+        return EXIT_FAILED
+    if not (options.timings or options.timings_json):
+        # Nobody will look, so do not spend the time and memory on it.
+        timings = None
+    index_dir = None
+    if not options.no_cache:
+        index_dir = options.cache_dir or default_cache_dir()
+    if options.acl_coverage:
+        if report_coverage(config_objects, cache_dir=index_dir):
+            return EXIT_OK
+        return EXIT_FAILED
+    if options.no_cache:
+        cache = None
+    else:
+        cache = slapaclsuite.ResultCache(options.cache_dir, refresh=options.refresh_cache)
+    stop = slapaclsuite.EarlyStop(maxfail=options.maxfail, breaker=options.breaker)
+    backend = None
+    if options.backend == 'native':
+        backend = NativeBackend(sample_size=options.cross_check or 0, index_dir=index_dir)
+    shard = None
+    results_fh = None
+    history = _history(options)
+    # Whether this run went through the whole plan, for pruning the history.
+    complete = False
     try:
-        yaml_config = slapaclsuite.ingest_yaml_file(options.test_yaml_file)
-    except Exception as fileread_err:  # pylint: disable=broad-except
-        print(fileread_err, file=sys.stderr)
-        return False
-    config_objects = slapaclsuite.validate_input(yaml_config, verbose=options.verbose)
-    commands = slapaclsuite.generate_commands(config_objects)
-    slapaclsuite.run_tests(commands, verbose=options.verbose, noop=options.noop)
-    return True
+        if options.impact:
+            (baseline_dir, candidate_dir) = options.impact
+            try:
+                statuses = slapaclsuite.run_impact(config_objects, baseline_dir, candidate_dir,
+                                                   verbose=options.verbose, noop=options.noop,
+                                                   jobs=options.jobs, cache=cache,
+                                                   batch=options.batch,
+                                                   progress=options.progress,
+                                                   timings=timings, stop=stop,
+                                                   backend=backend, index_dir=index_dir)
+            except Unsupported as err:
+                print(f'--impact: {err}', file=sys.stderr)
+                return EXIT_FAILED
+        elif options.incremental:
+            state_file = options.state_file
+            if state_file is None:
+                state_file = default_state_file(options.test_yaml_file, options.cache_dir)
+            statuses = slapaclsuite.run_incremental(config_objects, state_file,
+                                                    verbose=options.verbose, noop=options.noop,
+                                                    jobs=options.jobs, cache=cache,
+                                                    batch=options.batch,
+                                                    progress=options.progress,
+                                                    timings=timings, stop=stop,
+                                                    backend=backend)
+        else:
+            total = None
+            sample = None
+            if options.sample:
+                sample = Sampler(options.sample, fraction=options.sample_fraction,
+                                 seed=options.sample_seed)
+                print(f'# sample: to run the same checks again, use {sample.describe()}')
+            commands = slapaclsuite.iter_commands(config_objects, batch=options.batch,
+                                                  sample=sample)
+            if options.shard or options.results_jsonl:
+                if options.results_jsonl and not options.noop:
+                    results_fh = open(options.results_jsonl, 'w')
+                (index, count) = options.shard or (1, 1)
+                assignment = None
+                if options.shard_by == 'duration' and count > 1:
+                    # Every machine works out the same plan, from the history file they
+                    # share; merging checks that they did.
+                    commands = list(commands)
+                    (assignment, loads) = plan_shards(commands, count, history.estimate)
+                    print(f'# shard {index}/{count}: expected to take {loads[index - 1]:.1f}s; '
+                          f'the longest shard {max(loads):.1f}s')
+                shard = Shard(index, count, results_fh, assignment=assignment,
+                              backend=options.backend)
+                commands = shard.select(commands)
+            if options.last_failed:
+                commands = list(last_failed(commands, history))
+                if not commands:
+                    print('# last-failed: nothing failed the last time it ran')
+            if options.failed_first or options.changed_first:
+                commands = prioritize(commands, history, failed_first=options.failed_first,
+                                      changed_first=options.changed_first)
+            if options.progress and (sample is not None or shard is not None or ordering):
+                # Only making the sample, the shard or the selection tells how big it is.
+                commands = list(commands)
+                total = len(commands)
+            elif options.progress:
+                total = slapaclsuite.count_commands(config_objects, batch=options.batch)
+            record = _record_with([x.record for x in (shard, history) if x is not None])
+            schedule = None
+            if options.schedule == 'longest-first':
+                schedule = (history or History(None)).estimate
+            if timings is None:
+                statuses = slapaclsuite.run_tests(commands, verbose=options.verbose,
+                                                  noop=options.noop, jobs=options.jobs,
+                                                  cache=cache, total=total, stop=stop,
+                                                  backend=backend, record=record,
+                                                  schedule=schedule)
+            else:
+                statuses = slapaclsuite.timed_run(timings, slapaclsuite.run_tests, commands,
+                                                  verbose=options.verbose, noop=options.noop,
+                                                  jobs=options.jobs, cache=cache, total=total,
+                                                  stop=stop, backend=backend, record=record,
+                                                  schedule=schedule)
+            if shard is not None:
+                shard.finish(stop)
+                if options.shard:
+                    print(f'# shard {shard.index}/{shard.count}: {shard.selected} of '
+                          f'{shard.commands} commands')
+            complete = not (sample or options.shard or options.last_failed or stop.reason)
+    finally:
+        if cache is not None:
+            cache.close()
+        if results_fh is not None:
+            results_fh.close()
+        if history is not None:
+            history.save(complete=complete)
+    if options.timings:
+        timings.report(slowest=options.slowest)
+    if options.timings_json:
+        timings.write_json(options.timings_json, slowest=options.slowest)
+    disagreements = []
+    if backend is not None and not options.noop:
+        if options.verbose or backend.fallbacks:
+            backend.report()
+        if options.cross_check:
+            disagreements = backend.cross_check()
+            print(f'# cross-check: {len(backend.sample) - len(disagreements)} of '
+                  f'{len(backend.sample)} sampled commands agree with slapacl')
+            for (script, native, real) in disagreements:
+                print(f'DISAGREE # {" ".join(script)}')
+                print(f'# native gave {native}, slapacl gave '
+                      f'{"an error" if real is None else real}')
+    if stop.reason is not None:
+        return EXIT_STOPPED
+    if disagreements:
+        return EXIT_FAILED
+    if any(status != 'PASS' for status in statuses):
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def merge_main(prog_args=None):
+    '''
+        Put the --results-jsonl files of every shard of a run back together,
+        and report on them as one run.
+        Returns: Integer   exit status, as main would have given for the whole run
+    '''
+    if prog_args is None:
+        prog_args = sys.argv
+    parser = argparse.ArgumentParser(prog='slapaclsuite-merge')
+    parser.description = 'Merge the results of the shards of a slapaclsuite run'
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        default=False,
+                        dest='verbose',
+                        help='list the checks that passed, too')
+    parser.add_argument('--history-file',
+                        default=None,
+                        dest='history_file',
+                        metavar='FILE',
+                        help='add how long each command took to this history file, for '
+                             'the next --shard-by duration')
+    parser.add_argument('results_file',
+                        nargs='+',
+                        metavar='results.jsonl',
+                        help='the --results-jsonl file of each shard')
+    options = parser.parse_args(prog_args[1:])
+
+    try:
+        (summary, results) = merge_results(options.results_file)
+    except (OSError, ValueError) as err:
+        print(err, file=sys.stderr)
+        return EXIT_FAILED
+    if options.history_file:
+        history = History(options.history_file, backend=summary['backend'])
+        for result in results:
+            history.record(result)
+        history.save(complete=not summary['stopped'])
+    statuses = slapaclsuite.report_results(results, verbose=options.verbose)
+    for reason in summary['stopped']:
+        print(f'# {reason}')
+    counts = collections.Counter(statuses)
+    print(f'# {summary["shards"]} shards, {summary["commands"]} commands, '
+          f'{len(statuses)} checks: ' +
+          ', '.join(f'{counts[x]} {x}' for x in ['PASS', 'FAIL', 'ERROR', 'UNKNOWN']
+                    if counts[x]))
+    if summary['stopped']:
+        return EXIT_STOPPED
+    if any(status != 'PASS' for status in statuses):
+        return EXIT_FAILED
+    return EXIT_OK
 
 
 if __name__ == '__main__':  # pragma: no cover
-    if main():
-        sys.exit(0)
-    sys.exit(1)
+    sys.exit(main())
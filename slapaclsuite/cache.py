@@ -0,0 +1,317 @@
+'''
+
+    An on-disk cache of slapacl answers.
+
+    If neither the slapd config nor the slapacl binary has changed, asking
+    slapacl the same question again gets the same answer back, so we can
+    skip spawning the process and replay the answer we recorded last time.
+
+    Likewise, an unchanged test file validates to the same suite, so that
+    is kept too, and a run can skip reading the YAML and validating it.
+
+'''
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+def default_cache_dir():
+    '''
+        Where we keep caches when we are not told otherwise.
+        Returns: String+   $XDG_CACHE_HOME/slapaclsuite, or ~/.cache/slapaclsuite
+    '''
+    base_dir = os.environ.get('XDG_CACHE_HOME')
+    if not base_dir:
+        base_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'slapaclsuite')
+
+
+def config_location(script):
+    '''
+        Find the slapd config that a slapacl command line points at.
+        Inputs: [String+]+   the command to run
+        Returns: None or String+   the argument to -F (slapd.d) or -f (slapd.conf)
+    '''
+    for index, arg in enumerate(script):
+        if arg in ('-F', '-f'):
+            if index + 1 < len(script):
+                return script[index + 1]
+            return None
+        if len(arg) > 2 and arg[:2] in ('-F', '-f'):
+            return arg[2:]
+    return None
+
+
+def fingerprint_path(location):
+    '''
+        Hash a config file, or every file under a config directory.
+        Inputs: None or String+
+        Returns: String+   hex digest that changes when any file's name or contents change
+    '''
+    digest = hashlib.sha256()
+    if location is None:
+        digest.update(b'no-config')
+    elif os.path.isdir(location):
+        for (dirpath, dirnames, filenames) in os.walk(location):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                full_path = os.path.join(dirpath, filename)
+                digest.update(os.path.relpath(full_path, location).encode('utf-8'))
+                digest.update(b'\0')
+                with open(full_path, 'rb') as input_fh:
+                    digest.update(input_fh.read())
+                digest.update(b'\0')
+    elif os.path.isfile(location):
+        with open(location, 'rb') as input_fh:
+            digest.update(input_fh.read())
+    else:
+        digest.update(b'missing:' + location.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fingerprint_binary(executable, path):
+    '''
+        Where the binary is, and enough of its stat() to notice an upgrade.
+        Inputs: String+   the executable, as the scripting section names it
+                String*   the PATH it is run under
+        Returns: String+
+    '''
+    resolved = shutil.which(executable, path=path)
+    if resolved is None:
+        return executable
+    stat = os.stat(resolved)
+    return f'{os.path.realpath(resolved)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+class ResultCache:
+    '''
+        A size-bounded, least-recently-used store of slapacl stderr,
+        keyed on everything that decides what slapacl will answer:
+        the slapd config, the slapacl binary, and the exact command line.
+
+        Entries are kept in an sqlite file so they survive between runs.
+        The cache is safe to share between the worker threads of run_tests.
+
+        Note that slapacl also reads the directory data when it fetches the
+        requestDN (the default), so a change to an entry that an ACL depends
+        on (e.g. group membership) is not noticed.  --refresh-cache is the
+        way out when that matters.
+    '''
+    filename = 'results.sqlite'
+    # How many changes to hold before committing them to disk.
+    commit_every = 100
+
+    def __init__(self, directory=None, max_entries=100000, refresh=False):
+        '''
+            Inputs: None or String+   directory to keep the cache in
+                    Integer           how many answers to keep before evicting the oldest
+                    Bool              if True, ignore what is stored, but store fresh answers
+        '''
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._connection = None
+        self._entries = 0
+        self._uncommitted = 0
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        ''' Open (and if need be, create) the cache on first use. '''
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(os.path.join(self.directory, self.filename),
+                                               check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                     '(key TEXT PRIMARY KEY, stderr BLOB, last_used REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS results_last_used '
+                                     'ON results (last_used)')
+            self._entries = self._connection.execute(
+                'SELECT COUNT(*) FROM results').fetchone()[0]
+        return self._connection
+
+    def _fingerprint(self, kind, name, builder):
+        ''' Memoize fingerprints: they do not change during a run. '''
+        memo_key = (kind, name)
+        if memo_key not in self._fingerprints:
+            self._fingerprints[memo_key] = builder()
+        return self._fingerprints[memo_key]
+
+    def key(self, script, path):
+        '''
+            Inputs: [String+]+   the command to run
+                    String*      the PATH it will be run under
+            Returns: String+     the cache key for that command
+        '''
+        location = config_location(script)
+        with self._lock:
+            config_fp = self._fingerprint(
+                'config', location, lambda: fingerprint_path(location))
+            binary_fp = self._fingerprint(
+                'binary', (script[0], path), lambda: fingerprint_binary(script[0], path))
+        identity = json.dumps([config_fp, binary_fp, script])
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''
+            Inputs: String+   a key from .key()
+            Returns: None or bytes   the stderr slapacl gave for this key
+        '''
+        if self.refresh:
+            return None
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute('SELECT stderr FROM results WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE results SET last_used = ? WHERE key = ?',
+                               (time.time(), key))
+            self._changed()
+        return row[0]
+
+    def put(self, key, stderr):
+        '''
+            Record an answer, evicting the least recently used entries if we are full.
+            Inputs: String+   a key from .key()
+                    bytes     the stderr slapacl gave
+        '''
+        with self._lock:
+            connection = self._connect()
+            existing = connection.execute('SELECT 1 FROM results WHERE key = ?',
+                                          (key,)).fetchone()
+            connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                               (key, stderr, time.time()))
+            if existing is None:
+                self._entries += 1
+            if self._entries > self.max_entries:
+                # Trim a little extra so we are not evicting on every insert.
+                excess = self._entries - int(self.max_entries * 0.9)
+                connection.execute('DELETE FROM results WHERE key IN '
+                                   '(SELECT key FROM results ORDER BY last_used LIMIT ?)',
+                                   (excess,))
+                self._entries -= excess
+            self._changed()
+
+    def _changed(self):
+        ''' Count a change, and commit once enough of them have piled up. '''
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self._connection.commit()
+            self._uncommitted = 0
+
+    def flush(self):
+        ''' Commit anything not yet written to disk. '''
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        ''' Close the cache file, if we opened it. '''
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
+
+
+class SuiteCache:
+    '''
+        Validated suites (the dict validate_input returns), or the validated
+        parts of suites, keyed on the contents of the test file they came
+        from, and on the code that validated them.  Only the most recently
+        used are kept.
+    '''
+    subdirectory = 'suites'
+    max_entries = 200
+
+    def __init__(self, directory=None):
+        '''
+            Inputs: None or String+   the cache directory (suites go in a subdirectory)
+        '''
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = os.path.join(directory, self.subdirectory)
+
+    @staticmethod
+    def _code_fingerprint():
+        ''' The validator source: a change there may change what a file validates to. '''
+        validator_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'yaml_input_validator')
+        digest = hashlib.sha256()
+        for filename in sorted(os.listdir(validator_dir)):
+            if filename.endswith('.py'):
+                with open(os.path.join(validator_dir, filename), 'rb') as input_fh:
+                    digest.update(input_fh.read())
+        return digest.hexdigest()
+
+    def key(self, filename, kind='suite'):
+        '''
+            Inputs: String+   a test file
+                    String+   what is kept for it: 'suite', the whole validated suite,
+                              or 'file', one file's part of a suite (see suite.load_suite)
+            Returns: None or String+   the cache key, or None if the file can not be read
+        '''
+        digest = hashlib.sha256(f'{kind}:{self._code_fingerprint()}'.encode('utf-8'))
+        try:
+            with open(os.path.abspath(os.path.expanduser(filename)), 'rb') as input_fh:
+                for block in iter(lambda: input_fh.read(1 << 20), b''):
+                    digest.update(block)
+        except (OSError, TypeError):
+            return None
+        return digest.hexdigest()
+
+    def _filename(self, key):
+        ''' Where the suite for `key` is kept. '''
+        return os.path.join(self.directory, f'{key}.pickle')
+
+    def get(self, key):
+        '''
+            Inputs: String+   a key from .key()
+            Returns: None or dict   the validated suite, if we have it
+        '''
+        try:
+            with open(self._filename(key), 'rb') as input_fh:
+                suite = pickle.load(input_fh)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if not isinstance(suite, dict):
+            return None
+        # Mark it as recently used, so pruning keeps it.
+        try:
+            os.utime(self._filename(key))
+        except OSError:
+            pass
+        return suite
+
+    def put(self, key, suite):
+        '''
+            Keep a validated suite, dropping the oldest ones if there are too many.
+            Not being able to write it is not an error: it only costs time next run.
+            Inputs: String+   a key from .key()
+                    dict      what validate_input returned
+        '''
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            (handle, temp_name) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as output_fh:
+                pickle.dump(suite, output_fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, self._filename(key))
+            kept = sorted((entry for entry in os.scandir(self.directory)
+                           if entry.name.endswith('.pickle')),
+                          key=lambda x: x.stat().st_mtime, reverse=True)
+            for entry in kept[self.max_entries:]:
+                os.remove(entry.path)
+        except OSError:
+            pass
@@ -4,116 +4,494 @@
     commands that will be run.
 
 '''
-import copy
+import collections
+import concurrent.futures
+import itertools
 import re
 # import shlex
 import subprocess
+import sys
+import time
+from .plan import CommandEntry
+from .results import Result, PASS, FAIL, ERROR, UNKNOWN
 
+# slapacl answers each attribute it is asked about with a line ending in this.
+ANSWER_RE = re.compile(b' (ALLOWED|DENIED)$', re.MULTILINE)
 
-def generate_commands(config):
+# How many finished answers per job _ordered_map may hold while one before
+# them is still running.
+ORDERED_BUFFER = 64
+
+
+def generate_commands(config, batch=False, sample=None):
+    '''
+        The list form of iter_commands, below.
+    '''
+    return list(iter_commands(config, batch=batch, sample=sample))
+
+
+def count_commands(config, batch=False):
+    '''
+        Input:   config hash, as for generate_commands
+        Returns: Integer   how many commands generate_commands / iter_commands would give
+
+        This only looks at the validated tests; nothing is rendered or built,
+        so it is cheap enough to call just to size a progress display.
+    '''
+    if config['tests'].inputs is None:
+        raise RuntimeError('Can not count unvalidated tests')
+    return sum(tester.command_count(batch=batch) for tester in config['tests'].inputs)
+
+
+def iter_commands(config, batch=False, sample=None):
     '''
         Input: config hash consisting of
                { 'administrative': currently-unused administrative object,
                  'scripting':      scripting object,
                  'tests':          tests object, }
+               batch: put every requestattr of a test into one slapacl call
+               sample: None for every check, or a sample.Sampler choosing which to make
 
-        Returns: list of tuples.
-                 Each tuple is ("printable description", hash)
-                 Each hash consists of
-                 { 'script':  array-of-strings suitable for subprocess to run,
-                   'path':    PATH to use to find the script above,
-                   'expects': "ALLOWED" or "DENIED" - what we expect from the test. }
+        Yields: tuples, one at a time.
+                Each tuple is ("printable description", hash)
+                Each hash consists of
+                { 'script':  array-of-strings suitable for subprocess to run,
+                  'path':    PATH to use to find the script above,
+                  'expects': "ALLOWED" or "DENIED" - what we expect from the test. }
+                In batch mode, each hash also has
+                { 'checks':  list of printable descriptions, one per requestattr
+                             at the end of 'script', in the same order. }
 
-        This creates a list of the inputs needed for run_tests below:
+        This creates the inputs needed for run_tests below:
         what we're going to run, and what we expect back from each test.
+        They are built as they are asked for, so a run can start on the first
+        command before the rest exist, and the whole set never has to be in
+        memory at once.
+
+        slapacl will take several attributes in one call and answer for each
+        of them in turn, so batching spends one process (and one parse of the
+        slapd config) on each peername of a test, rather than on each
+        peername/requestattr pair.
     '''
     scripting_config = config['scripting'].render()
-    tests_config = config['tests'].render()
 
-    base_script = [scripting_config['executable']]
-    base_script.extend(scripting_config['default_arguments'])
+    # Shared by every command we hand out.
+    prefix = (scripting_config['executable'],) + tuple(scripting_config['default_arguments'])
     path = scripting_config['path']
+    env = {'PATH': ':'.join(path)}
+
+    testers = itertools.repeat(None)
+    if sample is not None:
+        testers = config['tests'].inputs
+        sample.prepare((x.content_hash(), x.sizes(), x.inputs['requestattr']) for x in testers)
+
+    for (tester, entry) in zip(testers, config['tests'].iter_render()):
 
-    retval = list()
-    for entry in tests_config:
+        requestattrs = [(requestattr_label, tuple(requestattr_value))
+                        for (requestattr_label, requestattr_value) in entry['requestattr']]
+        dimensions = (entry['authcDN'], entry['requestDN'], entry['peername'], requestattrs)
 
-        for peername_tuple in entry['peername']:
-            (peername_label, peername_value) = peername_tuple
-            for requestattr_tuple in entry['requestattr']:
-                (requestattr_label, requestattr_value) = requestattr_tuple
+        # Every authcDN/requestDN/peername/requestattr combination (or the sample's
+        # choice of them), one at a time: a test of many authcDNs against many
+        # requestDNs is never expanded whole.
+        if sample is None:
+            combinations = itertools.product(*(range(len(x)) for x in dimensions))
+        else:
+            combinations = sample.combinations(tester.content_hash(),
+                                               tuple(len(x) for x in dimensions))
+
+        for ((authc, request, peername), group) in itertools.groupby(
+                combinations, key=lambda x: x[:3]):
+            (authc_label, authc_value) = entry['authcDN'][authc]
+            (request_label, request_value) = entry['requestDN'][request]
+            (peername_label, peername_value) = entry['peername'][peername]
+            # Single DNs have no label, so leave no gap for one.
+            description = ' '.join(x for x in [entry['description'], authc_label,
+                                               request_label] if x)
 
-                output_description = \
-                    f'{entry["description"]} {requestattr_label} {peername_label}'
+            # Shared by every requestattr of this combination.
+            options = tuple(authc_value + entry['fetchentry'] + request_value + entry['ssf'] +
+                            peername_value)
 
-                script = copy.copy(base_script)
-                for item in ['authcDN', 'fetchentry', 'requestDN', 'ssf']:
-                    script.extend(entry[item])
+            if batch:
+                checks = []
+                attributes = []
+                for combination in group:
+                    (requestattr_label, requestattr_value) = requestattrs[combination[3]]
+                    checks.append(f'{description} {requestattr_label} {peername_label}')
+                    attributes.extend(requestattr_value)
 
-                script.extend(peername_value)
-                script.extend(requestattr_value)
+                yield (f'{description} {peername_label}',
+                       CommandEntry(prefix, options, tuple(attributes), path, env,
+                                    entry['expects'], checks))
+                continue
 
-                retval.append((output_description, {
-                    'script': script,
-                    'path': path,
-                    'expects': entry['expects'],
-                    }))
+            for combination in group:
+                (requestattr_label, requestattr_value) = requestattrs[combination[3]]
+                output_description = f'{description} {requestattr_label} {peername_label}'
 
-    return retval
+                yield (output_description,
+                       CommandEntry(prefix, options, requestattr_value, path, env,
+                                    entry['expects']))
 
 
-def run_tests(commands, verbose=False, noop=False):
+def _environment(entry):
+    '''
+        The environment to run a command under.  Entries from iter_commands
+        carry one, shared by all of them; a plain hash only has its path.
     '''
-        Input:   list of commands above
-        Returns: nothing
+    env = getattr(entry, 'env', None)
+    if env is None:
+        env = {'PATH': ':'.join(entry['path'])}
+    return env
+
+
+def _printable(entry):
+    ''' The command line of an entry, as one string, for people to read. '''
+    printable = getattr(entry, 'printable', None)
+    if printable is None:
+        # use this in py3.8:
+        # printable = shlex.join(entry['script'])
+        printable = ' '.join(entry['script'])
+    return printable
+
+
+def _execute(script, env):
+    '''
+        Run one slapacl command.
+        Inputs: [String+]+   the command to run
+                dict         the environment to run it under (just a PATH)
+        Returns: subprocess.CompletedProcess on success,
+                 subprocess.CalledProcessError if the command failed
+
+        The error is returned rather than raised so this can be handed to a
+        worker pool and the outcome inspected back in the calling thread.
+    '''
+    try:
+        # Oddly enough, the answers from slapacl are on stderr.
+        return subprocess.run(script, env=env,
+                              check=True,
+                              stdout=None,
+                              stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError as exec_err:
+        return exec_err
+
+
+def _ordered_map(func, items, jobs=1):
+    '''
+        Inputs:  callable applied to each item
+                 iterable of items
+                 Integer   how many workers to run at once
+        Yields:  (item, func(item)) tuples, in the same order as `items`
+
+        With more than one job, this runs `func` in a bounded pool of threads.
+        Threads are enough here: the real work happens in child processes.
+        A few items per job are kept queued, so a worker that finishes
+        always has the next one waiting, and `items` is consumed as we go
+        rather than all up front.  A slow item at the head does not stop
+        the others: answers after it are held, up to ORDERED_BUFFER per job,
+        until it is done and they can be handed out in order.  Closing this
+        generator early leaves little work behind.
+    '''
+    if jobs <= 1:
+        for item in items:
+            yield (item, func(item))
+        return
+
+    items = iter(items)
+    buffer = ORDERED_BUFFER * jobs
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Every item submitted and not yet handed out, in order; and those
+        # of them still queued or running.
+        pending = collections.deque()
+        running = set()
+        exhausted = False
+        try:
+            while True:
+                while pending and pending[0][1].done():
+                    (done_item, future) = pending.popleft()
+                    yield (done_item, future.result())
+                running = {x for x in running if not x.done()}
+                while not exhausted and len(running) < jobs * 2 and \
+                        len(pending) - len(running) < buffer:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = executor.submit(func, item)
+                    pending.append((item, future))
+                    running.add(future)
+                if not pending:
+                    return
+                if not pending[0][1].done():
+                    # The head is still queued or running, so it is in `running`.
+                    concurrent.futures.wait(running,
+                                            return_when=concurrent.futures.FIRST_COMPLETED)
+        finally:
+            # If we are abandoned part way, drop what has not started yet;
+            # leaving the `with` waits only for what is already running.
+            for (_, future) in pending:
+                future.cancel()
+
+
+def _scheduled_map(func, items, jobs, cost):
+    '''
+        Inputs:  callable applied to each item
+                 iterable of items
+                 Integer   how many workers to run at once
+                 callable giving the expected cost of an item
+        Yields:  (item, func(item)) tuples, in the same order as `items`
+
+        Like _ordered_map, but the items are started costliest first, so a
+        slow one is not left to start last and hold up the end of the run.
+        Each idle worker takes the next item off the pool's one shared
+        queue, so no worker sits idle while another has work waiting.
+        Every item is read up front to be sorted, and answers are held
+        until those before them in `items` are handed out.
+    '''
+    items = list(items)
+    costs = [cost(x) for x in items]
+    futures = [None] * len(items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            # sorted() is stable: equal costs start in plan order.
+            for index in sorted(range(len(items)), key=lambda x: -costs[x]):
+                futures[index] = executor.submit(func, items[index])
+            for (item, future) in zip(items, futures):
+                yield (item, future.result())
+        finally:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+
+
+def _execute_cached(script, env, cache):
+    '''
+        Like _execute, but answer from the ResultCache `cache` when we can,
+        and record fresh answers there for next time.
+        Returns: (result as from _execute, Bool: was it answered from the cache?)
+    '''
+    key = cache.key(script, env['PATH'])
+    stderr = cache.get(key)
+    if stderr is not None:
+        return (subprocess.CompletedProcess(args=script, returncode=0, stderr=stderr), True)
+    result = _execute(script, env)
+    # Only remember answers we understood; errors may be transient.
+    if not isinstance(result, subprocess.CalledProcessError) and \
+            ANSWER_RE.search(result.stderr):
+        cache.put(key, result.stderr)
+    return (result, False)
+
+
+class _Progress:
+    '''
+        Report how far through a run we are, and a guess at how long is left,
+        on stderr.  On a terminal the line is redrawn in place at most once a
+        second; otherwise a line is written every 10% so logs stay readable.
+    '''
+
+    def __init__(self, total, stream=None):
+        self.total = total
+        self.stream = sys.stderr if stream is None else stream
+        self.done = 0
+        self.started = time.monotonic()
+        self.last_shown = None
+        self.interactive = hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+    def step(self):
+        ''' Count one more command finished, and maybe say so. '''
+        self.done += 1
+        now = time.monotonic()
+        if self.interactive:
+            due = self.last_shown is None or now - self.last_shown >= 1
+        else:
+            due = self.done * 10 // self.total != (self.done - 1) * 10 // self.total
+        if due or self.done == self.total:
+            self.last_shown = now
+            self.show(now)
+
+    def show(self, now):
+        ''' Write the progress line. '''
+        elapsed = now - self.started
+        remaining = elapsed / self.done * (self.total - self.done)
+        eta = time.strftime('%H:%M:%S', time.gmtime(remaining))
+        line = (f'# progress: {self.done}/{self.total} commands '
+                f'({100 * self.done // self.total}%), ETA {eta}')
+        if self.interactive:
+            end = '\n' if self.done == self.total else ''
+            print(f'\r{line}', end=end, file=self.stream, flush=True)
+        else:
+            print(line, file=self.stream, flush=True)
+
+
+def iter_results(commands, jobs=1, cache=None, total=None, timings=None, stop=None,
+                 backend=None, schedule=None):
+    '''
+        Input:   commands above, as a list or straight from iter_commands
+                 jobs: how many slapacl processes may run at the same time
+                 cache: None, or a ResultCache to answer repeated checks from
+                 total: None, or how many commands there are (see count_commands),
+                        to show progress and an ETA on stderr
+                 timings: None, or a Timings to record how long each command took
+                 stop: None, or an EarlyStop to decide when to give up on the run
+                 backend: None to run slapacl, or something with an execute(script, env)
+                          that answers in its place, like native.NativeBackend.
+                          The cache is not used for a backend's answers.
+                 schedule: None to start commands in the order given, or a callable
+                           giving the expected cost of a command (like
+                           history.History.estimate), to start the costliest first
+                           when there is more than one job.  That reads every
+                           command up front, and holds answers until their turn.
+        Yields:  a Result for each check, in the same order as `commands`,
+                 no matter how many jobs run in parallel.
+                 A batched command gives one Result per requestattr.
+
+        Results are handed out as their commands finish, so a consumer can
+        deal with each one and let it go; nothing is kept for the whole run.
+        When `stop` says to, the rest of the commands are not run, and the
+        results end after the command that tripped it.
+    '''
+    def run_one(tuple_entry):
+        ''' worker: run the command for one entry, and time it '''
+        entry = tuple_entry[1]
+        started = time.perf_counter()
+        if backend is not None:
+            (result, cached) = (backend.execute(entry['script'], _environment(entry)), False)
+        elif cache is None:
+            (result, cached) = (_execute(entry['script'], _environment(entry)), False)
+        else:
+            (result, cached) = _execute_cached(entry['script'], _environment(entry), cache)
+        return (result, time.perf_counter() - started, cached)
+
+    def command_results(tuple_entry, result, seconds, cached):
+        ''' the Results for one finished command '''
+        (description, entry) = tuple_entry
+        expects = entry['expects']
+        checks = entry.get('checks', [description])
+        argv = entry['script']
+
+        if isinstance(result, subprocess.CalledProcessError):
+            return [Result(check_description, description, argv, expects, None,
+                           ERROR, seconds, result.stderr, cached, position)
+                    for (position, check_description) in enumerate(checks)]
+
+        # One answer line per attribute asked about, in the order asked.
+        answers = ANSWER_RE.findall(result.stderr)
+        if len(answers) < len(checks):
+            # Maybe the format changed.  Probably coding work needed.
+            return [Result(check_description, description, argv, expects, None,
+                           UNKNOWN, seconds, result.stderr, cached, position)
+                    for (position, check_description) in enumerate(checks)]
+
+        retval = []
+        for (position, (check_description, answer)) in enumerate(zip(checks, answers)):
+            answer = answer.decode('utf-8')
+            retval.append(Result(check_description, description, argv, expects, answer,
+                                 PASS if answer == expects else FAIL, seconds, None, cached,
+                                 position))
+        return retval
+
+    progress = _Progress(total) if total else None
+    if schedule is not None and jobs > 1:
+        outcomes = _scheduled_map(run_one, commands, jobs, schedule)
+    else:
+        outcomes = _ordered_map(run_one, commands, jobs)
+    try:
+        for tuple_entry, (result, seconds, cached) in outcomes:
+            if progress is not None:
+                progress.step()
+            if timings is not None:
+                timings.record_command(tuple_entry[0], seconds, cached=cached)
+            stopping = False
+            for check_result in command_results(tuple_entry, result, seconds, cached):
+                if stop is not None and stop.check(check_result):
+                    stopping = True
+                yield check_result
+            if stopping:
+                break
+    finally:
+        # Do not leave queued commands to run once nobody wants their answers.
+        outcomes.close()
+        if cache is not None:
+            cache.flush()
+
+
+def report_results(results, verbose=False):
+    '''
+        Input:   Results, as from iter_results
+        Returns: list of Strings, the status of each result, in order
+
+        Prints results to stdout for human interpretation: failures and
+        problems always, passes only when verbose.
+    '''
+    statuses = []
+    for result in results:
+        statuses.append(result.status)
+        if result.status == PASS:
+            if verbose:
+                print(f'PASS # {result.description}')
+        elif result.status == FAIL:
+            print(f'FAIL # {result.description}')
+            print(' '.join(result.argv))
+            print(f'# expected "{result.expected}", but got "{result.actual}"')
+        elif result.position == 0:
+            # Problems belong to the command, so say so once, not once per check.
+            print(f'# {result.command}')
+            if result.status == ERROR:
+                print('Execution error when running:')
+                print(' '.join(result.argv))
+            else:
+                print('Unable to determine answer from `slapacl`:')
+                print(' '.join(result.argv))
+                print(result.stderr.decode('utf-8'))
+    return statuses
+
+
+def _recorded(results, record):
+    ''' Hand each result to `record` on its way past. '''
+    for result in results:
+        record(result)
+        yield result
+
+
+def run_tests(commands, verbose=False, noop=False, jobs=1, cache=None, total=None,
+              timings=None, stop=None, backend=None, record=None, schedule=None):
+    '''
+        Input:   commands above, as a list or straight from iter_commands
+                 record: None, or a callable given each Result as it is known,
+                         such as shard.Shard.record
+                 the rest as for iter_results
+        Returns: list of Strings, one per check, in order:
+                 'PASS', 'FAIL', 'ERROR' (slapacl failed to run),
+                 or 'UNKNOWN' (we could not read slapacl's answer).
+                 A batched command counts one check per requestattr.
+                 Nothing runs in noop mode, so that returns [].
+                 If `stop` ended the run early, the list is short.
 
         This function accepts the command structure from `generate_commands`
         above, then iterates over them, running the command and checking the
         result for 'did the test do what we expect'
 
-        Prints results to stdout for human interpretation.
-        I did consider making a structured return that was then parsed into
-        human text, but I couldn't then imagine a suitable use case to make
-        it worth the design.  Feel free to adapt this if that changes.
+        Prints results to stdout for human interpretation, in the same order
+        as `commands`, no matter how many jobs run in parallel.
+        This is report_results over iter_results; use iter_results directly
+        for the structured form.
     '''
-    for tuple_entry in commands:
-        (description, entry) = tuple_entry
-        script = entry['script']
-        expects = entry['expects']
-        path = ':'.join(entry['path'])
-        # use this in py3.8:
-        # printable_command = shlex.join(script)
-        printable_command = ' '.join(script)
-        if noop:
+    if noop:
+        for tuple_entry in commands:
+            (description, entry) = tuple_entry
             print(f'# {description}')
-            print(printable_command)
-            print(f'# expects: {expects}')
+            print(_printable(entry))
+            print(f'# expects: {entry["expects"]}')
             print('')
-            continue
+        return []
 
-        try:
-            # Oddly enough, the answers from slapacl are on stderr.
-            result = subprocess.run(script, env={'PATH': path},
-                                    check=True,
-                                    stdout=None,
-                                    stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            print(f'# {description}')
-            print('Execution error when running:')
-            print(printable_command)
-            continue
-        match = re.search(b' (ALLOWED|DENIED)$', result.stderr, re.MULTILINE)
-        if not match:
-            # Maybe the format changed.  Probably coding work needed.
-            print(f'# {description}')
-            print('Unable to determine answer from `slapacl`:')
-            print(printable_command)
-            print(result.stderr.decode('utf-8'))
-            continue
-        result = match.group(1).decode('utf-8')
-        if result == expects:
-            if verbose:
-                print(f'PASS # {description}')
-        else:
-            print(f'FAIL # {description}')
-            print(printable_command)
-            print(f'# expected "{expects}", but got "{result}"')
+    results = iter_results(commands, jobs=jobs, cache=cache, total=total, timings=timings,
+                           stop=stop, backend=backend, schedule=schedule)
+    if record is not None:
+        results = _recorded(results, record)
+    statuses = report_results(results, verbose=verbose)
+    if stop is not None and stop.reason is not None:
+        print(f'# {stop.reason}')
+    return statuses
@@ -0,0 +1,27 @@
+'''
+
+    Taking DNs apart, for the parts of slapaclsuite that need to: the
+    native evaluator, and substitution tables read from LDIF.
+
+'''
+
+
+def split_unescaped(text, separator):
+    ''' Split on `separator`, except where it is escaped with a backslash. '''
+    parts = []
+    current = []
+    escaped = False
+    for char in text:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == '\\':
+            current.append(char)
+            escaped = True
+        elif char == separator:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current))
+    return parts
@@ -0,0 +1,296 @@
+'''
+
+    How long each command took in earlier runs, how it ended last time,
+    and what to expect of commands we have not timed yet.
+
+    Checks differ a lot in cost: one that fetches a big entry, or meets a
+    regex ACL, can take fifty times as long as one that does not.  Shards
+    split by hash (see shard.py) get whatever mix of those the hash deals
+    them, so the last one to finish can run long after the others.  With
+    a history of durations, plan_shards deals out the longest commands
+    first, each to the shard with the least work so far (LPT), and the
+    shards end up close to even.
+
+    The statuses let a run put what failed last time (prioritize), or
+    only that (last_failed), first: when working on a fix, the checks it
+    is meant to fix report back within seconds, not at the end of the run.
+
+    Durations are kept per backend: the native one answers in microseconds
+    what slapacl takes milliseconds for, and neither says anything about
+    the other.  A command that has not run for PRUNE_AFTER runs of the
+    whole plan is dropped, so the file does not grow with every test ever
+    removed from the suite.  Runs of part of the plan (a sample, a shard,
+    --last-failed, or a run stopped early) do not count: they leave out
+    commands that are still there.
+
+'''
+import hashlib
+import heapq
+import json
+import os
+import statistics
+from .cache import default_cache_dir
+from .results import PASS, FAIL
+from .shard import command_key, result_key
+
+# How much of a command's remembered duration a new timing replaces.
+SMOOTHING = 0.5
+
+# What a command is guessed to take when nothing has been timed at all.
+DEFAULT_SECONDS = 0.05
+
+# How much longer than the rest we guess a command takes when slapacl
+# fetches the entry (no -u), for each -o option (peername, ssf), and for
+# each requestattr of a batch after the first.
+FETCHENTRY_FACTOR = 3.0
+OPTION_FACTOR = 0.2
+ATTRIBUTE_FACTOR = 0.3
+
+# How many runs of the whole plan (that recorded anything) a command may
+# go unseen in before what we know of it is dropped.
+PRUNE_AFTER = 20
+
+
+def default_history_file(cache_dir=None):
+    '''
+        Inputs: None or String+   the cache directory
+        Returns: String+   where to keep the history, when we are not told
+    '''
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, 'history.json')
+
+
+def _history_key(key):
+    ''' A command_key, short enough to keep a great many of. '''
+    return hashlib.blake2b(key, digest_size=10).hexdigest()
+
+
+def guess_cost(tuple_entry, base=DEFAULT_SECONDS):
+    '''
+        Guess how long a command we have never timed will take.
+        Inputs: (String+, hash)   a command, as from iter_commands
+                Float   what a plain command takes
+        Returns: Float   seconds
+    '''
+    entry = tuple_entry[1]
+    script = entry['script']
+    cost = base
+    if '-u' not in script:
+        cost *= FETCHENTRY_FACTOR
+    cost *= 1 + OPTION_FACTOR * script.count('-o')
+    checks = entry.get('checks')
+    if checks:
+        cost *= 1 + ATTRIBUTE_FACTOR * (len(checks) - 1)
+    return cost
+
+
+class History:
+    '''
+        The durations of commands in earlier runs, and the status each
+        ended with the last time it ran, kept in a JSON file.
+
+        Hand .record to run_tests (record=) to time a run, then .save().
+        Only commands slapacl (or a backend) answered are timed; answers
+        from the result cache, and errors, say nothing about the cost.
+    '''
+
+    def __init__(self, filename, backend='slapacl'):
+        '''
+            Inputs: None or String+   the history file; None for one kept in memory only
+                    String+   the backend the run answers checks with: durations are
+                              read and recorded for that backend only
+        '''
+        self.filename = filename
+        self.backend = backend
+        self._backends = None
+        self._statuses = None
+        self._seen = None
+        self._runs = 0
+        self._base = None
+        self.recorded = 0
+
+    def _load(self):
+        ''' Read the history file, the first time anything in it is wanted. '''
+        self._backends = {}
+        self._statuses = {}
+        self._seen = {}
+        if self.filename is not None:
+            try:
+                with open(self.filename, 'r') as input_fh:
+                    history = json.load(input_fh)
+                backends = history.get('durations', {})
+                statuses = history.get('statuses', {})
+                seen = history.get('seen', {})
+                runs = history.get('runs', 0)
+            except (IOError, ValueError, AttributeError):
+                (backends, statuses, seen, runs) = ({}, {}, {}, 0)
+            if isinstance(backends, dict):
+                self._backends = {x: y for (x, y) in backends.items() if isinstance(y, dict)}
+            if isinstance(statuses, dict):
+                self._statuses = statuses
+            if isinstance(seen, dict):
+                self._seen = seen
+            if isinstance(runs, int):
+                self._runs = runs
+        self._backends.setdefault(self.backend, {})
+
+    @property
+    def durations(self):
+        ''' dict(String+: Float)   seconds per command, with this backend '''
+        if self._backends is None:
+            self._load()
+        return self._backends[self.backend]
+
+    @property
+    def statuses(self):
+        '''
+            dict(String+: String+)   per command, PASS if every check of it passed
+            last time, or the status of the first check that did not
+        '''
+        if self._statuses is None:
+            self._load()
+        return self._statuses
+
+    @property
+    def seen(self):
+        ''' dict(String+: Integer)   per command, the last run it was recorded in '''
+        if self._seen is None:
+            self._load()
+        return self._seen
+
+    def __len__(self):
+        return len(self.durations)
+
+    def record(self, result):
+        '''
+            Remember how a check's command ended, and how long it took.
+            Inputs: Result   as run_tests hands them to record=
+        '''
+        key = _history_key(result_key(result))
+        if result.position == 0 or self.statuses.get(key) == PASS:
+            self.statuses[key] = result.status
+        self.seen[key] = self._runs + 1
+        self.recorded += 1
+        if result.position != 0 or result.cached or result.status not in (PASS, FAIL):
+            return
+        old = self.durations.get(key)
+        if old is None:
+            self.durations[key] = result.duration
+        else:
+            self.durations[key] = old + SMOOTHING * (result.duration - old)
+        self._base = None
+
+    def status(self, tuple_entry):
+        '''
+            Inputs: (String+, hash)   a command, as from iter_commands
+            Returns: None if it has never run (so it is new, or was changed),
+                     or how it ended last time: PASS, FAIL, ERROR or UNKNOWN
+        '''
+        return self.statuses.get(_history_key(command_key(tuple_entry)))
+
+    def estimate(self, tuple_entry):
+        '''
+            Inputs: (String+, hash)   a command, as from iter_commands
+            Returns: Float   how long it should take: what it took before,
+                             or a guess scaled to what commands take here
+        '''
+        seconds = self.durations.get(_history_key(command_key(tuple_entry)))
+        if seconds is not None:
+            return seconds
+        if self._base is None:
+            self._base = DEFAULT_SECONDS
+            if self.durations:
+                # Most commands are plain ones, so the median is near what a plain one takes.
+                self._base = statistics.median(self.durations.values())
+        return guess_cost(tuple_entry, self._base)
+
+    def save(self, complete=True):
+        '''
+            Write the history file, if anything was recorded, in a single step
+            so an interrupted run can not leave half a file behind.
+            Inputs: Bool   did the run go through the whole plan?  Only then does it
+                           count towards PRUNE_AFTER, and commands not seen in the last
+                           PRUNE_AFTER such runs are left out.
+        '''
+        if self.filename is None or not self.recorded:
+            return
+        if complete:
+            self._runs += 1
+            stale = [x for (x, run) in self.seen.items() if run <= self._runs - PRUNE_AFTER]
+            for key in stale:
+                del self.seen[key]
+            for table in [self.statuses] + list(self._backends.values()):
+                for key in [x for x in table if x not in self.seen]:
+                    del table[key]
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, exist_ok=True)
+        temp_file = f'{self.filename}.tmp'
+        with open(temp_file, 'w') as output_fh:
+            json.dump({'durations': {x: y for (x, y) in self._backends.items() if y},
+                       'statuses': self.statuses, 'seen': self.seen, 'runs': self._runs},
+                      output_fh, separators=(',', ':'))
+        os.replace(temp_file, self.filename)
+        self._base = None
+        self.recorded = 0
+
+
+def plan_shards(commands, count, estimate):
+    '''
+        Deal commands out to shards (or workers) so their total costs are
+        as even as we can cheaply make them: longest first, each to the
+        shard with the least work so far.  The same commands and estimates
+        always give the same plan, so every machine of a sharded run can
+        work it out for itself.
+        Inputs: [(String+, hash)]   commands, as from iter_commands
+                Integer   how many shards
+                callable giving the cost of a command (such as History.estimate)
+        Returns: (dict(bytes: Integer), [Float])   the shard, from 1 to count, of each
+                                                    command_key; and each shard's total cost
+    '''
+    costs = sorted(((estimate(x), command_key(x)) for x in commands),
+                   key=lambda x: (-x[0], x[1]))
+    loads = [(0.0, shard) for shard in range(1, count + 1)]
+    assignment = {}
+    for (cost, key) in costs:
+        if key in assignment:
+            # The same command twice: run both where the first goes.
+            continue
+        (load, shard) = heapq.heappop(loads)
+        assignment[key] = shard
+        heapq.heappush(loads, (load + cost, shard))
+    totals = [0.0] * count
+    for (load, shard) in loads:
+        totals[shard - 1] = load
+    return (assignment, totals)
+
+
+def prioritize(commands, history, failed_first=False, changed_first=False):
+    '''
+        Put the commands most likely to tell us something first.
+        Inputs: commands, as from iter_commands
+                History
+                Bool   first the commands that did not pass last time
+                Bool   then the ones that have never run: new tests, and changed ones
+        Returns: [(String+, hash)]   every command; otherwise in plan order
+    '''
+    def rank(tuple_entry):
+        ''' lower runs sooner '''
+        status = history.status(tuple_entry)
+        if failed_first and status not in (None, PASS):
+            return 0
+        if changed_first and status is None:
+            return 1
+        return 2
+    return sorted(commands, key=rank)
+
+
+def last_failed(commands, history):
+    '''
+        Inputs: commands, as from iter_commands
+                History
+        Yields: only the commands that did not pass the last time they ran
+    '''
+    for tuple_entry in commands:
+        if history.status(tuple_entry) not in (None, PASS):
+            yield tuple_entry
@@ -0,0 +1,204 @@
+'''
+
+    Change-impact runs: only run the checks an olcAccess change can affect.
+
+    Given the slapd.d a suite passes against (the baseline) and an edited
+    copy of it (the candidate), compare their olcAccess rules database by
+    database.  slapd steps over a rule that does not cover the entry and
+    attribute being checked, so a check can only get a different answer if
+    a rule that was added or removed covers it.  Only those checks are run,
+    against the candidate; every other check is carried over.
+
+    Only olcAccess rules, suffixes and rootdns are compared.  Any other
+    change to the config (schema, overlays, limits ...) goes unnoticed.
+
+'''
+import difflib
+from .commands import iter_commands, run_tests
+from .plan import CommandEntry
+from .timings import timed_run
+from .native import Request, Unsupported, load_index
+from .native.acl import normalize_dn
+from .native.backend import parse_command
+
+
+class AccessDiff:
+    '''
+        The olcAccess differences between two slapd.d trees.
+
+        everything: None, or why no check can be ruled out
+        changed:    database index -> None if the whole database changed, or
+                    ({positions removed from the baseline's rules},
+                     {positions added to the candidate's rules})
+                    where positions count over rules_for(), so a change to
+                    the frontend shows up in every database.
+    '''
+
+    def __init__(self, baseline, candidate):
+        '''
+            Inputs: RuleIndex   the config the suite passes against
+                    RuleIndex   the config with the change under review
+        '''
+        self.baseline = baseline
+        self.candidate = candidate
+        self.everything = None
+        self.changed = {}
+        old_databases = baseline.config.databases + [baseline.config.frontend]
+        new_databases = candidate.config.databases + [candidate.config.frontend]
+        if _layout(old_databases) != _layout(new_databases):
+            self.everything = 'the databases or their suffixes differ'
+            return
+        for (old, new) in zip(old_databases, new_databases):
+            if new is None:
+                continue
+            if old.rootdn != new.rootdn:
+                self.changed[new.index] = None
+                continue
+            matcher = difflib.SequenceMatcher(None,
+                                              [x.text for x in baseline.rules_for(old)],
+                                              [x.text for x in candidate.rules_for(new)],
+                                              autojunk=False)
+            removed = set()
+            added = set()
+            for (tag, old_start, old_end, new_start, new_end) in matcher.get_opcodes():
+                if tag != 'equal':
+                    removed.update(range(old_start, old_end))
+                    added.update(range(new_start, new_end))
+            if removed or added:
+                self.changed[new.index] = (removed, added)
+
+    def describe(self):
+        '''
+            Returns: [String+]   one line per database that changed, for people to read
+        '''
+        if self.everything is not None:
+            return [self.everything]
+        lines = []
+        for database in self.candidate.config.databases + [self.candidate.config.frontend]:
+            if database is None or database.index not in self.changed:
+                continue
+            label = f'{database.kind}{{{database.index}}}'
+            change = self.changed[database.index]
+            if change is None:
+                lines.append(f'{label}: rootdn changed')
+            else:
+                lines.append(f'{label}: {len(change[0])} rules removed, '
+                             f'{len(change[1])} added')
+        return lines
+
+    def affects(self, script):
+        '''
+            Could the answer to this slapacl command line differ between the two?
+            Inputs: [String+]+   a command, as iter_commands builds it
+            Returns: Bool   False only if no added or removed rule can cover any
+                            check in it
+
+            A changed rule that covers the check's entry and attribute counts,
+            whoever its "by" clauses are for: a rule that covers a check and
+            has no clause for its client still stops evaluation there.
+        '''
+        if self.everything is not None:
+            return True
+        if not self.changed:
+            return False
+        try:
+            parsed = parse_command(script)
+            ndn = normalize_dn(parsed['base'])
+            old_database = self.baseline.database_for(ndn)
+            new_database = self.candidate.database_for(ndn)
+        except Unsupported:
+            return True
+        if new_database.index not in self.changed:
+            return False
+        change = self.changed[new_database.index]
+        if change is None:
+            return True
+        for (attribute, access, _) in parsed['attributes']:
+            try:
+                request = Request.build(parsed['authc'], parsed['base'], attribute, access,
+                                        ssf=parsed['ssf'], peername=parsed['peername'])
+            except Unsupported:
+                return True
+            for (index, database, positions) in [(self.baseline, old_database, change[0]),
+                                                 (self.candidate, new_database, change[1])]:
+                rules = index.rules_for(database)
+                for position in positions.intersection(index.candidates(database, ndn)):
+                    try:
+                        if rules[position].applies(request):
+                            return True
+                    except Unsupported:
+                        return True
+        return False
+
+
+def _layout(databases):
+    ''' What has to match between two configs for their rules to be compared. '''
+    return [None if x is None else (x.index, x.kind, x.suffixes) for x in databases]
+
+
+def retarget(entry, directory):
+    '''
+        Inputs: CommandEntry, as from iter_commands
+                String+   a slapd.d directory
+        Returns: CommandEntry   the same command, run against `directory`
+    '''
+    prefix = [entry.prefix[0]]
+    arguments = iter(entry.prefix[1:])
+    for arg in arguments:
+        if arg in ('-F', '-f'):
+            next(arguments, None)
+        elif arg[:2] not in ('-F', '-f'):
+            prefix.append(arg)
+    prefix[1:1] = ['-F', directory]
+    return CommandEntry(tuple(prefix), entry.options, entry.attributes, entry.path,
+                        entry.env, entry.expects, entry.checks)
+
+
+def run_impact(config, baseline_dir, candidate_dir, verbose=False, noop=False, jobs=1,
+               cache=None, batch=False, progress=False, timings=None, stop=None,
+               backend=None, index_dir=None):
+    '''
+        Input:   validated config, as from validate_input
+                 baseline_dir: the slapd.d the suite passes against
+                 candidate_dir: the slapd.d with the olcAccess change under review
+                 index_dir: None, or where to keep rule indexes (see native.index)
+                 the rest are passed through to iter_commands / run_tests
+        Returns: list of Strings, one per check that was run (as run_tests does).
+                 Carried-over checks are not run, and not in the list.
+        Raises:  Unsupported if either slapd.d can not be read
+
+        The selected commands are run with -F pointing at `candidate_dir`,
+        whatever default_arguments says.
+    '''
+    diff = AccessDiff(load_index(baseline_dir, index_dir), load_index(candidate_dir, index_dir))
+    for line in diff.describe():
+        print(f'# impact: {line}')
+
+    carried = []
+
+    def selected(commands):
+        ''' the commands the diff may affect, retargeted at the candidate '''
+        for (description, entry) in commands:
+            if diff.affects(entry['script']):
+                yield (description, retarget(entry, candidate_dir))
+            else:
+                carried.extend(entry.get('checks', [description]))
+
+    commands = selected(iter_commands(config, batch=batch))
+    total = None
+    if progress:
+        commands = list(commands)
+        total = len(commands)
+    if timings is None:
+        statuses = run_tests(commands, verbose=verbose, noop=noop, jobs=jobs, cache=cache,
+                             total=total, stop=stop, backend=backend)
+    else:
+        statuses = timed_run(timings, run_tests, commands, verbose=verbose, noop=noop,
+                             jobs=jobs, cache=cache, total=total, stop=stop, backend=backend)
+    if verbose:
+        for description in carried:
+            print(f'CARRIED # {description}')
+    if not noop:
+        print(f'# impact: {len(statuses)} checks run against "{candidate_dir}", '
+              f'{len(carried)} carried over')
+    return statuses
@@ -0,0 +1,149 @@
+'''
+
+    Incremental runs: only re-run the tests whose definitions changed.
+
+    We keep a state file holding each test's content hash and the statuses
+    its checks got last time.  A test is re-run when it is new, when its
+    definition changed, or when any of its checks did not pass.  Every
+    other test reports the verdicts it got last time.
+
+'''
+import hashlib
+import json
+import os
+from .cache import config_location, default_cache_dir, fingerprint_binary, fingerprint_path
+from .commands import iter_commands, count_commands, run_tests
+from .timings import timed_run
+from .yaml_input_validator.tests import TestsSectionValidator
+
+
+def default_state_file(test_yaml_file, cache_dir=None):
+    '''
+        Where to keep incremental state for a test file, when we are not told.
+        Inputs: String+ or [String+]+   the YAML file (or files and directories)
+                                        the tests came from
+                None or String+  the cache directory
+        Returns: String+  a file in the cache directory, named for that YAML file
+    '''
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if isinstance(test_yaml_file, str):
+        test_yaml_file = [test_yaml_file]
+    full_path = '\0'.join(os.path.abspath(os.path.expanduser(x)) for x in test_yaml_file)
+    name = hashlib.sha1(full_path.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'incremental-{name}.json')
+
+
+def suite_fingerprint(scripting_config):
+    '''
+        Changing how we run slapacl, the slapd config it reads, or the slapacl
+        binary itself (an upgrade), can change the answer to any test.  This
+        fingerprints all three, the binary as the result cache does, so that
+        such a change sends every test back through slapacl.
+        Inputs: dict    rendered scripting section
+        Returns: String+
+    '''
+    location = config_location(scripting_config['default_arguments'])
+    binary = fingerprint_binary(scripting_config['executable'],
+                                ':'.join(scripting_config['path']))
+    identity = json.dumps([scripting_config, fingerprint_path(location), binary],
+                          sort_keys=True)
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def load_state(state_file):
+    '''
+        Inputs: String+   state file from a previous run
+        Returns: dict     its contents, or {} if there is no usable state
+    '''
+    try:
+        with open(state_file, 'r') as input_fh:
+            state = json.load(input_fh)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(state, dict):
+        return {}
+    return state
+
+
+def save_state(state_file, state):
+    '''
+        Write the state file, replacing the old one in a single step so an
+        interrupted run can not leave a half-written file behind.
+        Inputs: String+   where to write
+                dict      what to write
+    '''
+    directory = os.path.dirname(os.path.abspath(state_file))
+    os.makedirs(directory, exist_ok=True)
+    temp_file = f'{state_file}.tmp'
+    with open(temp_file, 'w') as output_fh:
+        json.dump(state, output_fh, separators=(',', ':'))
+    os.replace(temp_file, state_file)
+
+
+def run_incremental(config, state_file, verbose=False, noop=False, jobs=1, cache=None,
+                    batch=False, progress=False, timings=None, stop=None, backend=None):
+    '''
+        Input:   validated config, as from validate_input
+                 state_file: where the previous run's state is, and this run's will go
+                 progress: show progress of the tests being re-run on stderr
+                 timings: None, or a Timings to record the generate and run phases in
+                 stop: None, or an EarlyStop; tests it keeps from finishing are
+                       left out of the state, so they run again next time
+                 the rest are passed through to iter_commands / run_tests
+        Returns: list of Strings, one per check, in test order (as run_tests does).
+                 Tests that were not re-run give the statuses they had last time.
+
+        In noop mode the state file is left alone.
+    '''
+    testers = config['tests'].inputs
+    suite = suite_fingerprint(config['scripting'].render())
+    previous = load_state(state_file)
+    if previous.get('suite') == suite:
+        previous_tests = previous.get('tests', {})
+    else:
+        previous_tests = {}
+
+    hashes = [tester.content_hash() for tester in testers]
+    rerun = []
+    to_run = []
+    for (tester, test_hash) in zip(testers, hashes):
+        old_statuses = previous_tests.get(test_hash)
+        changed = old_statuses is None or any(x != 'PASS' for x in old_statuses)
+        rerun.append(changed)
+        if changed:
+            to_run.append(tester)
+
+    subset = TestsSectionValidator()
+    subset.inputs = to_run
+    subset_config = dict(config, tests=subset)
+    total = count_commands(subset_config, batch=batch) if progress else None
+    commands = iter_commands(subset_config, batch=batch)
+    if timings is None:
+        statuses = run_tests(commands, verbose=verbose, noop=noop, jobs=jobs, cache=cache,
+                             total=total, stop=stop, backend=backend)
+    else:
+        statuses = timed_run(timings, run_tests, commands, verbose=verbose, noop=noop,
+                             jobs=jobs, cache=cache, total=total, stop=stop, backend=backend)
+    if noop:
+        return statuses
+
+    fresh_statuses = iter(statuses)
+    new_tests = {}
+    retval = []
+    for (tester, test_hash, changed) in zip(testers, hashes, rerun):
+        if changed:
+            test_statuses = [next(fresh_statuses, None) for _ in range(tester.check_count())]
+            if None in test_statuses:
+                # The run stopped early, before this test finished.
+                retval.extend(x for x in test_statuses if x is not None)
+                continue
+        else:
+            test_statuses = previous_tests[test_hash]
+            if verbose:
+                print(f'PASS # {tester.inputs["description"]} (unchanged, not re-run)')
+        new_tests[test_hash] = test_statuses
+        retval.extend(test_statuses)
+
+    save_state(state_file, {'suite': suite, 'tests': new_tests})
+    return retval
@@ -0,0 +1,24 @@
+'''
+    An in-process stand-in for slapacl.
+
+    Rather than spawn slapacl (and have it parse the whole slapd config and
+    schema) for every check, read the olcAccess rules out of the slapd.d
+    tree once, and decide each check in Python.
+
+    load_config    - read the databases and their olcAccess rules from a slapd.d
+    parse_access   - parse one olcAccess value
+    evaluate       - decide one check against a loaded config
+    load_index     - load_config, with the rules indexed by DN, and kept on disk
+    rule_coverage  - which rules a set of DNs fall under
+    NativeBackend  - run slapacl command lines with the above, falling back
+                     to the real slapacl for anything it can not decide.
+    Unsupported    - raised for anything we can not decide in-process.
+'''
+from .acl import Unsupported, parse_access
+from .config import load_config
+from .evaluate import Request, evaluate
+from .index import RuleIndex, load_index, rule_coverage, report_coverage
+from .backend import NativeBackend
+
+__all__ = ['Unsupported', 'parse_access', 'load_config', 'Request', 'evaluate',
+           'RuleIndex', 'load_index', 'rule_coverage', 'report_coverage', 'NativeBackend']
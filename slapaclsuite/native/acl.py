@@ -0,0 +1,556 @@
+'''
+
+    Parse olcAccess values (see slapd.access(5)) into rules we can evaluate.
+
+    Not every part of the access language is supported.  Anything we do
+    not understand is kept as a placeholder that raises Unsupported when
+    a check actually reaches it, so a rule we can not read only matters to
+    the checks it could decide; those go to the real slapacl instead.
+
+    Supported:
+        to:  *, dn[.base|exact|one|onelevel|sub|subtree|children|regex]=, attrs=
+        by:  *, anonymous, users, self, dn[.<style as above>]=,
+             peername.ip=, peername.exact=, peername.regex=, ssf=
+        access levels (none .. manage), =/+/- privileges, stop/continue/break
+    A dn= or peername= without a style is taken as exact, unless it looks
+    like a regular expression, which we leave to slapacl.
+'''
+import re
+from ..dn import split_unescaped
+
+
+class Unsupported(Exception):
+    ''' Part of a check that we can not decide in-process. '''
+
+
+# Privileges, by their letters in slapd.access(5).  'w' (write) is add and delete.
+_PRIVILEGE_LETTERS = {
+    'm': 'm', 'w': 'az', 'a': 'a', 'z': 'z', 'r': 'r',
+    's': 's', 'c': 'c', 'x': 'x', 'd': 'd', '0': '',
+}
+
+# What each access level grants: each level includes the ones below it.
+LEVELS = {
+    'none': frozenset(),
+    'disclose': frozenset('d'),
+    'auth': frozenset('xd'),
+    'compare': frozenset('cxd'),
+    'search': frozenset('scxd'),
+    'read': frozenset('rscxd'),
+    'add': frozenset('arscxd'),
+    'delete': frozenset('zrscxd'),
+    'write': frozenset('azrscxd'),
+    'manage': frozenset('mazrscxd'),
+}
+
+# What a check for each access level needs.
+NEEDED = {
+    'disclose': frozenset('d'),
+    'auth': frozenset('x'),
+    'compare': frozenset('c'),
+    'search': frozenset('s'),
+    'read': frozenset('r'),
+    'add': frozenset('a'),
+    'delete': frozenset('z'),
+    'write': frozenset('az'),
+    'manage': frozenset('m'),
+}
+
+_CONTROLS = ('stop', 'continue', 'break')
+
+# Enough to tell a regular expression from a plain DN.
+_REGEX_CHARS = re.compile(r'[*+?()\[\]{}|^$]|\\[^,=+<>#;"\\ ]')
+
+# Short and long names of common attributes, so attrs=commonName covers cn.
+_ATTRIBUTE_ALIASES = {
+    'commonname': 'cn', 'surname': 'sn', 'givenname': 'gn', 'userid': 'uid',
+    'domaincomponent': 'dc', 'organizationname': 'o', 'organizationalunitname': 'ou',
+    'countryname': 'c', 'localityname': 'l', 'stateorprovincename': 'st',
+    'rfc822mailbox': 'mail', 'streetaddress': 'street',
+}
+
+
+def canonical_attribute(name):
+    ''' An attribute name, lowercased, with no options, and its alias resolved. '''
+    name = name.split(';', 1)[0].strip().lower()
+    return _ATTRIBUTE_ALIASES.get(name, name)
+
+
+def normalize_dn(dn):
+    '''
+        A DN in one canonical form, so that DNs can be compared as strings.
+        Inputs: String
+        Returns: String   lowercased, with no spaces around separators
+
+        This folds case in every value, which is right for the usual
+        (case-insensitive) naming attributes.
+    '''
+    if not dn.strip():
+        return ''
+    rdns = []
+    for rdn in split_unescaped(dn, ','):
+        avas = []
+        for ava in split_unescaped(rdn, '+'):
+            (name, _, value) = ava.partition('=')
+            avas.append(f'{name.strip().lower()}={" ".join(value.split()).lower()}')
+        rdns.append('+'.join(avas))
+    return ','.join(rdns)
+
+
+def tokenize(text):
+    '''
+        Split an olcAccess value into words, as slapd does:
+        on whitespace, except inside double quotes, which are removed.
+    '''
+    tokens = []
+    current = []
+    in_word = False
+    quoted = False
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char == '\\' and index + 1 < len(text):
+            if text[index + 1] == '"':
+                current.append('"')
+            else:
+                current.append(text[index:index + 2])
+            in_word = True
+            index += 2
+            continue
+        if char == '"':
+            quoted = not quoted
+            in_word = True
+        elif char.isspace() and not quoted:
+            if in_word:
+                tokens.append(''.join(current))
+                current = []
+                in_word = False
+        else:
+            current.append(char)
+            in_word = True
+        index += 1
+    if quoted:
+        raise ValueError('unbalanced quotes')
+    if in_word:
+        tokens.append(''.join(current))
+    return tokens
+
+
+def _dn_style(key):
+    '''
+        The style of a dn[.style] key.
+        Returns: String+   base, one, sub, children or regex; or None for no style
+    '''
+    (_, _, style) = key.partition('.')
+    style = style.lower()
+    if not style:
+        return None
+    styles = {'base': 'base', 'baseobject': 'base', 'exact': 'base',
+              'one': 'one', 'onelevel': 'one',
+              'sub': 'sub', 'subtree': 'sub',
+              'children': 'children', 'regex': 'regex'}
+    if style not in styles:
+        raise Unsupported(f'dn style "{style}"')
+    return styles[style]
+
+
+class DNPattern:
+    '''
+        A dn[.style]=pattern, from either side of an access rule.
+    '''
+
+    def __init__(self, key, pattern):
+        style = _dn_style(key)
+        if style is None:
+            if pattern == '*':
+                style = 'regex'
+                pattern = '.*'
+            elif _REGEX_CHARS.search(pattern):
+                raise Unsupported(f'{key}={pattern}: no style, and it looks like a regex')
+            else:
+                style = 'base'
+        self.style = style
+        if style == 'regex':
+            if re.search(r'\$\d|\$\{', pattern):
+                raise Unsupported(f'{key}={pattern}: substitutions from the "to" clause')
+            if '[:' in pattern:
+                raise Unsupported(f'{key}={pattern}: POSIX character classes')
+            try:
+                self.pattern = re.compile(pattern, re.IGNORECASE)
+            except re.error:
+                raise Unsupported(f'{key}={pattern}: not a regex we can read')
+        else:
+            self.pattern = normalize_dn(pattern)
+
+    def matches(self, ndn):
+        ''' Does this pattern cover the normalized DN `ndn`? '''
+        style = self.style
+        pattern = self.pattern
+        if style == 'regex':
+            return pattern.search(ndn) is not None
+        if style == 'base':
+            return ndn == pattern
+        if style == 'sub':
+            return not pattern or ndn == pattern or ndn.endswith(',' + pattern)
+        if style == 'children':
+            if not pattern:
+                return ndn != ''
+            return ndn.endswith(',' + pattern)
+        # one level: the parent is exactly the pattern
+        parts = split_unescaped(ndn, ',')
+        if not ndn:
+            return False
+        return ','.join(parts[1:]) == pattern
+
+
+class _Unsupported:
+    ''' A part of a rule we could not read: it can not be evaluated. '''
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def matches(self, _request):
+        ''' Always: we can not tell. '''
+        raise Unsupported(self.reason)
+
+
+class What:
+    '''
+        The "to" part of an access rule: which entries and attributes it covers.
+    '''
+
+    def __init__(self, tokens):
+        self.dn = None
+        self.attrs = None
+        self.attr_sets = None
+        self.unsupported = None
+        for token in tokens:
+            (key, sep, value) = token.partition('=')
+            lkey = key.lower()
+            if token == '*':
+                continue
+            if not sep:
+                raise Unsupported(f'to {token}')
+            if lkey == 'dn' or lkey.startswith('dn.'):
+                self.dn = DNPattern(key, value)
+            elif lkey in ('attrs', 'attr'):
+                attrs = set()
+                for name in value.split(','):
+                    if name[:1] in ('@', '!'):
+                        self.attr_sets = f'attrs={value}: objectClass attribute sets'
+                    attrs.add(canonical_attribute(name))
+                self.attrs = frozenset(attrs)
+            else:
+                # filter=, val=, and whatever else: these need entry data.
+                self.unsupported = f'to ... {token}'
+
+    def matches(self, request):
+        ''' Does this "to" cover the entry and attribute of `request`? '''
+        if self.dn is not None and not self.dn.matches(request.dn):
+            return False
+        if self.attrs is not None and request.attribute not in self.attrs:
+            if self.attr_sets is not None:
+                # It may be in the objectClass's set; that needs the schema.
+                raise Unsupported(self.attr_sets)
+            return False
+        if self.unsupported is not None:
+            raise Unsupported(self.unsupported)
+        return True
+
+
+class _Who:
+    '''
+        One condition of a "by" clause.  Calling it with a request says if
+        the client in that request meets it.  These are classes rather than
+        closures so that parsed rules can be pickled (see native.index).
+    '''
+
+    def __call__(self, request):
+        raise NotImplementedError
+
+
+class _Anyone(_Who):
+    ''' by * '''
+
+    def __call__(self, request):
+        return True
+
+
+class _Anonymous(_Who):
+    ''' by anonymous '''
+
+    def __call__(self, request):
+        return request.authc == ''
+
+
+class _Users(_Who):
+    ''' by users '''
+
+    def __call__(self, request):
+        return request.authc != ''
+
+
+class _Self(_Who):
+    ''' by self '''
+
+    def __call__(self, request):
+        return request.authc != '' and request.authc == request.dn
+
+
+class _DN(_Who):
+    ''' by dn[.style]=pattern '''
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def __call__(self, request):
+        return self.pattern.matches(request.authc)
+
+
+class _SSF(_Who):
+    ''' by ssf=N '''
+
+    def __init__(self, needed):
+        self.needed = needed
+
+    def __call__(self, request):
+        return request.ssf >= self.needed
+
+
+class _PeerIP(_Who):
+    ''' by peername.ip=address[%mask][{port}] '''
+
+    def __init__(self, address, mask, port):
+        self.address = address
+        self.mask = mask
+        self.port = port
+
+    def __call__(self, request):
+        if request.peername is None or not request.peername.startswith('IP='):
+            return False
+        (peer, _, peer_port) = request.peername[3:].partition(':')
+        try:
+            peer_int = _ipv4(peer)
+        except ValueError:
+            return False
+        if self.port and peer_port != self.port:
+            return False
+        return peer_int & self.mask == self.address & self.mask
+
+
+class _PeerRegex(_Who):
+    ''' by peername.regex=pattern '''
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def __call__(self, request):
+        return request.peername is not None and self.pattern.search(request.peername) is not None
+
+
+class _PeerExact(_Who):
+    ''' by peername.exact=value '''
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, request):
+        return request.peername == self.value
+
+
+class _UnsupportedWho(_Who):
+    ''' A condition we could not read: evaluating it raises Unsupported. '''
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __call__(self, request):
+        raise Unsupported(self.reason)
+
+
+def _peername(key, value):
+    '''
+        A who condition on the client's address.
+        Returns: _Who
+    '''
+    (_, _, style) = key.partition('.')
+    style = style.lower()
+    if style == 'ip':
+        (address, _, port) = value.partition('{')
+        (address, _, mask) = address.partition('%')
+        try:
+            address_int = _ipv4(address)
+            mask_int = _ipv4(mask) if mask else 0xffffffff
+        except ValueError:
+            raise Unsupported(f'{key}={value}: not an IPv4 address')
+        return _PeerIP(address_int, mask_int, port.rstrip('}'))
+    if style == 'regex':
+        try:
+            return _PeerRegex(re.compile(value))
+        except re.error:
+            raise Unsupported(f'{key}={value}: not a regex we can read')
+    if style == 'exact' or (not style and not _REGEX_CHARS.search(value)):
+        return _PeerExact(value)
+    raise Unsupported(f'{key}={value}')
+
+
+def _ipv4(text):
+    ''' Dotted quad to an integer.  Raises ValueError if it is not one. '''
+    parts = text.split('.')
+    if len(parts) != 4:
+        raise ValueError(text)
+    retval = 0
+    for part in parts:
+        octet = int(part)
+        if not 0 <= octet <= 255:
+            raise ValueError(text)
+        retval = retval * 256 + octet
+    return retval
+
+
+def _who(token):
+    '''
+        One condition of a "by" clause.
+        Returns: _Who
+    '''
+    (key, sep, value) = token.partition('=')
+    lkey = key.lower()
+    if token == '*':
+        return _Anyone()
+    if token == 'anonymous':
+        return _Anonymous()
+    if token == 'users':
+        return _Users()
+    if token == 'self':
+        return _Self()
+    if sep and (lkey == 'dn' or lkey.startswith('dn.')):
+        if ',' in key:
+            raise Unsupported(f'by {token}: dn modifiers')
+        return _DN(DNPattern(key, value))
+    if sep and (lkey == 'peername' or lkey.startswith('peername.')):
+        return _peername(key, value)
+    if sep and lkey == 'ssf':
+        try:
+            return _SSF(int(value))
+        except ValueError:
+            raise Unsupported(f'by {token}')
+    raise Unsupported(f'by {token}')
+
+
+def _access(token):
+    '''
+        The access a "by" clause gives.
+        Returns: (String, frozenset)   '=', '+' or '-', and the privileges
+    '''
+    if token in LEVELS:
+        return ('=', LEVELS[token])
+    if token[:1] in ('=', '+', '-') and token[1:]:
+        privileges = set()
+        for letter in token[1:]:
+            if letter not in _PRIVILEGE_LETTERS:
+                raise Unsupported(f'access "{token}"')
+            privileges.update(_PRIVILEGE_LETTERS[letter])
+        return (token[0], frozenset(privileges))
+    raise Unsupported(f'access "{token}"')
+
+
+class By:
+    '''
+        One "by" clause: who it is for, what access it gives them,
+        and what to do next.
+    '''
+
+    def __init__(self, tokens):
+        self.control = 'stop'
+        if tokens and tokens[-1] in _CONTROLS:
+            self.control = tokens[-1]
+            tokens = tokens[:-1]
+        if len(tokens) < 2:
+            raise Unsupported('by ' + ' '.join(tokens))
+        (self.operation, self.privileges) = _access(tokens[-1])
+        self.who = []
+        for token in tokens[:-1]:
+            try:
+                self.who.append(_who(token))
+            except Unsupported as err:
+                self.who.append(_UnsupportedWho(str(err)))
+
+    def matches(self, request):
+        ''' Is this clause for the client in `request`? '''
+        return all(who(request) for who in self.who)
+
+    def apply(self, mask):
+        ''' The privileges after this clause has been applied to `mask`. '''
+        if self.operation == '=':
+            return self.privileges
+        if self.operation == '+':
+            return mask | self.privileges
+        return mask - self.privileges
+
+
+class AccessRule:
+    '''
+        One olcAccess value.
+        text: String+   what it came from
+    '''
+
+    def __init__(self, text, what, bys):
+        self.text = text
+        self.what = what
+        self.bys = bys
+
+    def applies(self, request):
+        ''' Does this rule cover the entry and attribute of `request`? '''
+        return self.what.matches(request)
+
+    def mask(self, request, mask):
+        '''
+            Run the "by" clauses for `request`.
+            Inputs: Request, frozenset: the privileges so far
+            Returns: (String, frozenset)   'stop' or 'break', and the privileges now
+        '''
+        for by in self.bys:
+            if not by.matches(request):
+                continue
+            mask = by.apply(mask)
+            if by.control == 'continue':
+                continue
+            return (by.control, mask)
+        # slapd ends every rule with an implicit "by * none stop": a client
+        # that continues past the last clause is left with nothing.
+        return ('stop', LEVELS['none'])
+
+
+def parse_access(text):
+    '''
+        Inputs: String+   an olcAccess value, with or without its {N} prefix
+        Returns: AccessRule
+
+        A rule we can not read at all still comes back, as one that raises
+        Unsupported for any check it is asked about.
+    '''
+    body = re.sub(r'^\{-?\d+\}', '', text.strip())
+    try:
+        tokens = tokenize(body)
+    except ValueError as err:
+        return AccessRule(text, _Unsupported(f'{text}: {err}'), [])
+    if not tokens or tokens[0].lower() != 'to' or 'by' not in tokens:
+        return AccessRule(text, _Unsupported(f'can not read "{text}"'), [])
+
+    by_indexes = [index for (index, token) in enumerate(tokens) if token == 'by']
+    try:
+        what = What(tokens[1:by_indexes[0]])
+    except Unsupported as err:
+        return AccessRule(text, _Unsupported(str(err)), [])
+    bys = []
+    for (start, end) in zip(by_indexes, by_indexes[1:] + [len(tokens)]):
+        try:
+            bys.append(By(tokens[start + 1:end]))
+        except Unsupported as err:
+            # A clause we can not read may or may not be for this client, and
+            # everything after it depends on that.  Give up on the rest.
+            broken = By(['*', 'none'])
+            broken.who = [_UnsupportedWho(str(err))]
+            bys.append(broken)
+            break
+    return AccessRule(text, what, bys)
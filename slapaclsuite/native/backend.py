@@ -0,0 +1,202 @@
+'''
+
+    Run slapacl command lines in-process.
+
+'''
+import collections
+import random
+import subprocess
+import sys
+import threading
+from ..commands import ANSWER_RE, _execute
+from .acl import Unsupported
+from .index import load_index
+from .evaluate import Request, evaluate
+
+# slapacl options that take a value.
+_VALUE_OPTIONS = ('-b', '-D', '-F', '-f', '-o', '-U', '-X', '-d')
+
+
+def parse_command(script):
+    '''
+        Pull a slapacl command line apart.
+        Inputs: [String+]+   the command, as iter_commands builds it
+        Returns: dict   config_dir, authc, base, ssf, peername,
+                        and attributes: [(attribute, access, value or None)]
+        Raises: Unsupported for anything we do not evaluate in-process
+    '''
+    parsed = {'config_dir': None, 'authc': '', 'base': None, 'ssf': 0,
+              'peername': None, 'attributes': []}
+    index = 1
+    while index < len(script):
+        arg = script[index]
+        index += 1
+        if not arg.startswith('-') or arg == '-':
+            parsed['attributes'].append(_parse_attribute(arg))
+            continue
+        if arg in ('-u', '-v'):
+            # -u: do not fetch the entry.  Nothing we evaluate needs it.
+            continue
+        option = arg[:2]
+        if option not in _VALUE_OPTIONS:
+            raise Unsupported(f'slapacl option {arg}')
+        if len(arg) > 2:
+            value = arg[2:]
+        elif index < len(script):
+            value = script[index]
+            index += 1
+        else:
+            raise Unsupported(f'slapacl option {arg} with no value')
+        if option == '-F':
+            parsed['config_dir'] = value
+        elif option == '-b':
+            parsed['base'] = value
+        elif option == '-D':
+            parsed['authc'] = value
+        elif option == '-o':
+            (name, _, setting) = value.partition('=')
+            if name == 'ssf':
+                try:
+                    parsed['ssf'] = int(setting)
+                except ValueError:
+                    raise Unsupported(f'-o {value}')
+            elif name == 'peername':
+                parsed['peername'] = setting
+            else:
+                raise Unsupported(f'-o {name}')
+        elif option == '-f':
+            raise Unsupported('slapd.conf (-f) configs')
+        elif option in ('-U', '-X'):
+            raise Unsupported(f'slapacl option {option}')
+        # -d only changes what slapacl logs.
+    if parsed['config_dir'] is None:
+        raise Unsupported('no -F config directory')
+    if parsed['base'] is None:
+        raise Unsupported('no -b DN')
+    if not parsed['attributes']:
+        raise Unsupported('no attributes to check')
+    return parsed
+
+
+def _parse_attribute(arg):
+    ''' attr[/access][:value], as slapacl takes them. '''
+    (attribute_access, _, value) = arg.partition(':')
+    (attribute, _, access) = attribute_access.partition('/')
+    if not access:
+        raise Unsupported(f'"{arg}" asks for no particular access')
+    return (attribute, access, value or None)
+
+
+class NativeBackend:
+    '''
+        Answers slapacl command lines by evaluating the olcAccess rules of
+        the slapd.d they name, in this process.  Anything it can not decide
+        (see native.acl for what it can) is run by the real slapacl instead.
+
+        execute() has the same contract as commands._execute, so this drops
+        in wherever slapacl would be spawned, and run_tests is none the wiser.
+
+        sample_size: how many in-process answers to keep, at random, for
+                     cross_check() to compare against the real slapacl.
+        index_dir:   where to keep rule indexes between runs (see native.index),
+                     or None to build them afresh each time.
+    '''
+
+    def __init__(self, fallback=None, sample_size=0, seed=None, index_dir=None):
+        '''
+            Inputs: None or callable(script, env)   runs the real slapacl
+                                                   (default: commands._execute)
+                    Integer   how many answers to keep for cross_check
+                    None or Integer   seed for picking them
+                    None or String+   where to keep rule indexes
+        '''
+        self.fallback = _execute if fallback is None else fallback
+        self.sample_size = sample_size
+        self.index_dir = index_dir
+        self.answered = 0
+        self.fallbacks = collections.Counter()
+        self.sample = []
+        self._random = random.Random(seed)
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def _config(self, directory):
+        ''' Load a slapd.d once, and remember it, or why it could not be loaded. '''
+        with self._lock:
+            if directory not in self._configs:
+                try:
+                    self._configs[directory] = load_index(directory, self.index_dir)
+                except Unsupported as err:
+                    self._configs[directory] = err
+                except (OSError, ValueError) as err:
+                    self._configs[directory] = Unsupported(f'reading "{directory}": {err}')
+            config = self._configs[directory]
+        if isinstance(config, Unsupported):
+            raise config
+        return config
+
+    def answer(self, script):
+        '''
+            Inputs: [String+]+   a slapacl command line
+            Returns: bytes   what slapacl would have said on stderr
+            Raises: Unsupported
+        '''
+        parsed = parse_command(script)
+        config = self._config(parsed['config_dir'])
+        lines = [f'authcDN: "{parsed["authc"]}"']
+        for (attribute, access, value) in parsed['attributes']:
+            request = Request.build(parsed['authc'], parsed['base'], attribute, access,
+                                    ssf=parsed['ssf'], peername=parsed['peername'])
+            verdict = 'ALLOWED' if evaluate(config, request) else 'DENIED'
+            shown = attribute if value is None else f'{attribute}="{value}"'
+            lines.append(f'{access} access to {shown}: {verdict}')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def execute(self, script, env):
+        '''
+            Inputs/Returns: as commands._execute
+        '''
+        try:
+            stderr = self.answer(script)
+        except Unsupported as err:
+            with self._lock:
+                self.fallbacks[str(err)] += 1
+            return self.fallback(script, env)
+        with self._lock:
+            self.answered += 1
+            if self.sample_size:
+                # Reservoir sampling: every answer is equally likely to be kept.
+                if len(self.sample) < self.sample_size:
+                    self.sample.append((script, env, stderr))
+                else:
+                    slot = self._random.randrange(self.answered)
+                    if slot < self.sample_size:
+                        self.sample[slot] = (script, env, stderr)
+        return subprocess.CompletedProcess(args=script, returncode=0, stderr=stderr)
+
+    def cross_check(self):
+        '''
+            Run the sampled commands through the real slapacl.
+            Returns: [(script, [native answers], [slapacl answers] or None on error)]
+                     the ones where the two disagree
+        '''
+        mismatches = []
+        for (script, env, stderr) in self.sample:
+            native = [x.decode('utf-8') for x in ANSWER_RE.findall(stderr)]
+            result = self.fallback(script, env)
+            if isinstance(result, subprocess.CalledProcessError):
+                mismatches.append((script, native, None))
+                continue
+            real = [x.decode('utf-8') for x in ANSWER_RE.findall(result.stderr)]
+            if real != native:
+                mismatches.append((script, native, real))
+        return mismatches
+
+    def report(self, stream=None):
+        ''' Say how much was answered in-process, and why the rest was not. '''
+        if stream is None:
+            stream = sys.stdout
+        print(f'# native backend: {self.answered} commands answered in-process, '
+              f'{sum(self.fallbacks.values())} by slapacl', file=stream)
+        for (reason, count) in self.fallbacks.most_common(10):
+            print(f'#   {count} x {reason}', file=stream)
@@ -0,0 +1,173 @@
+'''
+
+    Read the parts of a slapd.d (cn=config) tree that decide access:
+    each database's suffixes, rootdn and olcAccess rules, plus the
+    frontend's olcAccess rules, which apply after every database's own.
+
+'''
+import base64
+import os
+import re
+from .acl import Unsupported, normalize_dn, parse_access
+
+# olcDatabase: {1}mdb, olcAccess: {0}to * by * read
+_ORDERED_RE = re.compile(r'^\{(-?\d+)\}(.*)$', re.DOTALL)
+
+
+def _ordered(value):
+    '''
+        Split the {N} ordering prefix that cn=config puts on values.
+        Returns: (Integer or None, String)
+    '''
+    match = _ORDERED_RE.match(value)
+    if match is None:
+        return (None, value)
+    return (int(match.group(1)), match.group(2))
+
+
+def read_ldif(filename):
+    '''
+        Read the entries of an LDIF file.
+        Inputs: String+   filename
+        Returns: [dict]   one per entry: lowercased attribute name -> [String values]
+
+        Enough of LDIF for slapd.d: comments, folded lines, and base64 (::) values.
+    '''
+    with open(filename, 'rb') as input_fh:
+        text = input_fh.read().decode('utf-8')
+
+    # Unfold: a line starting with one space continues the one before.
+    lines = []
+    for line in text.splitlines():
+        if line.startswith(' ') and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+
+    entries = []
+    current = None
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        if not line.strip():
+            current = None
+            continue
+        (name, sep, value) = line.partition(':')
+        if not sep:
+            raise ValueError(f'{filename}: can not parse LDIF line "{line}"')
+        if value.startswith(':'):
+            value = base64.b64decode(value[1:].strip()).decode('utf-8')
+        else:
+            value = value.lstrip(' ')
+        if current is None:
+            current = {}
+            entries.append(current)
+        current.setdefault(name.lower(), []).append(value)
+    return entries
+
+
+class Database:
+    '''
+        One slapd database, as far as access control cares.
+        index:    Integer   its {N} in the config; -1 is the frontend
+        kind:     String+   mdb, config, frontend, ...
+        suffixes: [String]  normalized
+        rootdn:   None or String+, normalized
+        access:   [AccessRule]   its own rules, in order
+    '''
+
+    def __init__(self, index, kind, suffixes, rootdn, access):
+        self.index = index
+        self.kind = kind
+        self.suffixes = suffixes
+        self.rootdn = rootdn
+        self.access = access
+
+    def holds(self, ndn):
+        ''' Is the normalized DN `ndn` in one of this database's suffixes? '''
+        for suffix in self.suffixes:
+            if ndn == suffix or not suffix or ndn.endswith(',' + suffix):
+                return True
+        return False
+
+
+class SlapdConfig:
+    '''
+        The databases of a slapd config, in config order, and the frontend.
+    '''
+
+    def __init__(self, databases, frontend):
+        self.databases = databases
+        self.frontend = frontend
+
+    def database_for(self, ndn):
+        '''
+            The database that holds the normalized DN `ndn`.
+            Like slapd, the first database (in config order) whose suffix fits wins.
+            The root DSE ("") belongs to the frontend.
+            Raises: Unsupported if no database holds it.
+        '''
+        if not ndn and self.frontend is not None:
+            return self.frontend
+        for database in self.databases:
+            if database.holds(ndn):
+                return database
+        raise Unsupported(f'no database holds "{ndn}"')
+
+    def rules_for(self, database):
+        ''' The rules that apply in `database`: its own, then the frontend's. '''
+        if self.frontend is None or database is self.frontend:
+            return database.access
+        return database.access + self.frontend.access
+
+    def lookup(self, ndn):
+        '''
+            Returns: (Database, [AccessRule])   the database holding `ndn`, and the
+                     rules that may cover it, in order.  Here that is all of them;
+                     native.index.RuleIndex narrows them down.
+        '''
+        database = self.database_for(ndn)
+        return (database, self.rules_for(database))
+
+
+def load_config(directory):
+    '''
+        Read a slapd.d tree.
+        Inputs: String+   the directory slapacl's -F names
+        Returns: SlapdConfig
+        Raises: Unsupported if there is no usable config there
+    '''
+    if not os.path.isdir(directory):
+        raise Unsupported(f'"{directory}" is not a slapd.d directory')
+    databases = []
+    frontend = None
+    for (dirpath, dirnames, filenames) in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith('.ldif'):
+                continue
+            for entry in read_ldif(os.path.join(dirpath, filename)):
+                if 'olcdatabase' not in entry:
+                    continue
+                (index, kind) = _ordered(entry['olcdatabase'][0])
+                if index is None:
+                    index = len(databases)
+                rules = sorted((_ordered(value) for value in entry.get('olcaccess', [])),
+                               key=lambda x: -1 if x[0] is None else x[0])
+                access = [parse_access(rule) for (_, rule) in rules]
+                rootdn = entry.get('olcrootdn', [None])[0]
+                database = Database(index, kind,
+                                    [normalize_dn(x) for x in entry.get('olcsuffix', [])],
+                                    None if rootdn is None else normalize_dn(rootdn),
+                                    access)
+                if kind == 'frontend':
+                    frontend = database
+                else:
+                    databases.append(database)
+    if not databases and frontend is None:
+        raise Unsupported(f'no databases found under "{directory}"')
+    for database in databases:
+        if database.kind == 'config' and not database.suffixes:
+            database.suffixes = ['cn=config']
+    databases.sort(key=lambda x: x.index)
+    return SlapdConfig(databases, frontend)
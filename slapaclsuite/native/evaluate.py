@@ -0,0 +1,62 @@
+'''
+
+    Decide a single check the way slapd's access control would.
+
+'''
+import collections
+from .acl import LEVELS, NEEDED, Unsupported, canonical_attribute, normalize_dn
+
+_REQUEST_FIELDS = ('authc', 'dn', 'attribute', 'access', 'ssf', 'peername')
+
+
+class Request(collections.namedtuple('Request', _REQUEST_FIELDS)):
+    '''
+        One check.
+        authc:     String    normalized DN of who is asking; '' is anonymous
+        dn:        String    normalized DN of the entry asked about
+        attribute: String+   canonical attribute name (see canonical_attribute)
+        access:    String+   the access level asked for: read, write, auth, ...
+        ssf:       Integer   security strength of the connection
+        peername:  None or String   e.g. IP=10.1.2.3
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, authc_dn, request_dn, attribute, access, ssf=0, peername=None):
+        ''' A Request from un-normalized values, as a command line gives them. '''
+        if access not in NEEDED:
+            raise Unsupported(f'access level "{access}"')
+        return cls(normalize_dn(authc_dn or ''), normalize_dn(request_dn),
+                   canonical_attribute(attribute), access, ssf, peername)
+
+
+def evaluate(config, request):
+    '''
+        Inputs: SlapdConfig, as from load_config, or a RuleIndex over one
+                Request
+        Returns: Bool   is the access allowed?
+        Raises: Unsupported if the rules that decide this are ones we can not evaluate
+
+        The database holding the entry is the first whose suffix fits.  Its
+        rootdn may do anything.  Otherwise its rules, then the frontend's,
+        are tried in order; the first rule that covers the entry and attribute
+        decides, unless it says `break`, in which case the next one that
+        covers it goes on from there.  If there are no rules at all, everyone
+        may read (except in cn=config, where nobody may).
+    '''
+    (database, rules) = config.lookup(request.dn)
+    if database.rootdn is not None and request.authc == database.rootdn:
+        return True
+    if not config.rules_for(database):
+        if database.kind == 'config':
+            return False
+        return NEEDED[request.access] <= LEVELS['read']
+
+    mask = LEVELS['none']
+    for rule in rules:
+        if not rule.applies(request):
+            continue
+        (control, mask) = rule.mask(request, mask)
+        if control != 'break':
+            break
+    return NEEDED[request.access] <= mask
@@ -0,0 +1,265 @@
+'''
+
+    An index from DNs to the olcAccess rules that may cover them.
+
+    Trying every rule of a big ACL set on every check adds up.  Nearly all
+    "to" clauses name a DN and a scope (base, one, subtree, children), so
+    the rules are filed in a trie of DN components, read from the suffix
+    outward: looking up a DN walks down its own components and picks up
+    only the rules filed along that path whose scope fits.  Rules that do
+    not name a DN, or name it by regex, can not be filed that way, and are
+    kept on a side list that every lookup goes through, trying the regexes.
+
+    Building the index means parsing the whole slapd.d, so an index can be
+    saved to disk, keyed on a fingerprint of the config and of the code
+    that parsed it, and reused until either changes.
+
+'''
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+from ..cache import config_location, fingerprint_path
+from ..dn import split_unescaped
+from .acl import Unsupported, What, normalize_dn
+from .config import load_config
+
+
+def dn_components(ndn):
+    ''' The RDNs of a normalized DN, suffix first. '''
+    if not ndn:
+        return []
+    return list(reversed(split_unescaped(ndn, ',')))
+
+
+class _Node:
+    ''' One DN component of the trie. '''
+    __slots__ = ('children', 'rules')
+
+    def __init__(self):
+        self.children = {}
+        # (position of the rule, its dn style)
+        self.rules = []
+
+    def __getstate__(self):
+        return (self.children, self.rules)
+
+    def __setstate__(self, state):
+        (self.children, self.rules) = state
+
+
+class RuleIndex:
+    '''
+        A SlapdConfig, with its rules filed for fast lookup by DN.
+        It answers the same lookup/rules_for/database_for as SlapdConfig,
+        so evaluate() takes either.
+    '''
+    memo_size = 100000
+
+    def __init__(self, config):
+        '''
+            Inputs: SlapdConfig, as from load_config
+        '''
+        self.config = config
+        # database index -> (trie root, [(position, None or DNPattern) on the side list])
+        self._tables = {}
+        for database in config.databases + [config.frontend]:
+            if database is not None:
+                self._tables[database.index] = self._build(config.rules_for(database))
+        self._memo = {}
+
+    @staticmethod
+    def _build(rules):
+        ''' File the rules of one database. '''
+        root = _Node()
+        side = []
+        for (position, rule) in enumerate(rules):
+            what = rule.what
+            if not isinstance(what, What) or what.dn is None:
+                side.append((position, None))
+                continue
+            if what.dn.style == 'regex':
+                side.append((position, what.dn))
+                continue
+            node = root
+            for component in dn_components(what.dn.pattern):
+                node = node.children.setdefault(component, _Node())
+            node.rules.append((position, what.dn.style))
+        return (root, side)
+
+    def __getstate__(self):
+        # The memo is only good for this process's run.
+        return {'config': self.config, '_tables': self._tables}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._memo = {}
+
+    def database_for(self, ndn):
+        ''' As SlapdConfig.database_for. '''
+        return self.config.database_for(ndn)
+
+    def rules_for(self, database):
+        ''' As SlapdConfig.rules_for. '''
+        return self.config.rules_for(database)
+
+    def candidates(self, database, ndn):
+        '''
+            Inputs: Database, and a normalized DN that it holds
+            Returns: [Integer]   positions, among rules_for(database), of the rules
+                                 whose "to" DN may cover `ndn`, in rule order
+        '''
+        (root, side) = self._tables[database.index]
+        components = dn_components(ndn)
+        depth_wanted = len(components)
+        found = [position for (position, pattern) in side
+                 if pattern is None or pattern.matches(ndn)]
+        node = root
+        depth = 0
+        while True:
+            for (position, style) in node.rules:
+                if style == 'sub' or \
+                        (style == 'base' and depth == depth_wanted) or \
+                        (style == 'children' and depth < depth_wanted) or \
+                        (style == 'one' and depth == depth_wanted - 1):
+                    found.append(position)
+            if depth == depth_wanted:
+                break
+            node = node.children.get(components[depth])
+            if node is None:
+                break
+            depth += 1
+        found.sort()
+        return found
+
+    def lookup(self, ndn):
+        '''
+            Returns: (Database, [AccessRule])   the database holding `ndn`, and
+                     only the rules that may cover it, in order
+        '''
+        memo = self._memo.get(ndn)
+        if memo is not None:
+            return memo
+        database = self.config.database_for(ndn)
+        rules = self.config.rules_for(database)
+        retval = (database, [rules[x] for x in self.candidates(database, ndn)])
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[ndn] = retval
+        return retval
+
+
+def _code_fingerprint():
+    '''
+        The source of the native backend, and the DN helpers it uses: a change
+        there may change the rules a config is parsed into.
+    '''
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = [os.path.join('native', x)
+               for x in os.listdir(os.path.join(package_dir, 'native')) if x.endswith('.py')]
+    digest = hashlib.sha256()
+    for filename in sorted(sources + ['dn.py']):
+        with open(os.path.join(package_dir, filename), 'rb') as input_fh:
+            digest.update(input_fh.read())
+    return digest.hexdigest()
+
+
+def load_index(directory, cache_dir=None):
+    '''
+        Inputs: String+   a slapd.d directory
+                None or String+   where to keep built indexes; None to always build afresh
+        Returns: RuleIndex
+        Raises: Unsupported, as load_config
+    '''
+    if cache_dir is None:
+        return RuleIndex(load_config(directory))
+    fingerprint = hashlib.sha256(f'{_code_fingerprint()}:{fingerprint_path(directory)}'
+                                 .encode('utf-8')).hexdigest()
+    index_dir = os.path.join(cache_dir, 'native')
+    filename = os.path.join(index_dir, f'index-{fingerprint}.pickle')
+    try:
+        with open(filename, 'rb') as index_fh:
+            index = pickle.load(index_fh)
+        if isinstance(index, RuleIndex):
+            return index
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        pass
+    index = RuleIndex(load_config(directory))
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        (handle, temp_name) = tempfile.mkstemp(dir=index_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as index_fh:
+            pickle.dump(index, index_fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_name, filename)
+    except OSError:
+        # Not being able to save it only costs time next run.
+        pass
+    return index
+
+
+def rule_coverage(index, request_dns):
+    '''
+        Which rules the given DNs fall under.
+        Inputs: RuleIndex
+                iterable of String+   requestDNs, as a suite gives them
+        Returns: ([(Database, Integer, AccessRule, Integer)], [String])
+                 every rule of every database: where it is, its position among the
+                 rules that apply there, the rule, and how many of the DNs it may
+                 cover; and the DNs that no database holds.
+
+        "May cover" is by DN alone: a rule that also names attributes is
+        counted for any DN in its scope.
+    '''
+    counts = collections.Counter()
+    unplaced = []
+    for (dn, count) in collections.Counter(request_dns).items():
+        ndn = normalize_dn(dn)
+        try:
+            database = index.database_for(ndn)
+        except Unsupported:
+            unplaced.append(dn)
+            continue
+        for position in index.candidates(database, ndn):
+            counts[(database.index, position)] += count
+    rows = []
+    config = index.config
+    for database in config.databases + [config.frontend]:
+        if database is None:
+            continue
+        for (position, rule) in enumerate(config.rules_for(database)):
+            rows.append((database, position, rule, counts[(database.index, position)]))
+    return (rows, unplaced)
+
+
+def report_coverage(config, cache_dir=None, stream=None):
+    '''
+        Print which olcAccess rules the requestDNs of a suite reach.
+        Inputs: validated config, as from validate_input
+                None or String+   where to keep built indexes
+        Returns: Bool   False if there was no slapd.d to look at
+    '''
+    scripting_config = config['scripting'].render()
+    location = config_location([scripting_config['executable']] +
+                               scripting_config['default_arguments'])
+    try:
+        index = load_index(location, cache_dir) if location else None
+    except Unsupported as err:
+        print(f'# acl coverage: {err}', file=stream)
+        return False
+    if index is None:
+        print('# acl coverage: default_arguments name no -F slapd.d', file=stream)
+        return False
+    request_dns = (value[1] for entry in config['tests'].iter_render()
+                   for (_, value) in entry['requestDN'])
+    (rows, unplaced) = rule_coverage(index, request_dns)
+    reached = sum(1 for row in rows if row[3])
+    print(f'# acl coverage: {reached} of {len(rows)} olcAccess rules are reached by '
+          f'some test\'s requestDN', file=stream)
+    for (database, position, rule, count) in rows:
+        label = 'COVERED' if count else 'UNCOVERED'
+        print(f'{label} # {database.kind}{{{database.index}}} rule {position}: '
+              f'{count} DNs: {rule.text}', file=stream)
+    for dn in unplaced:
+        print(f'# no database holds requestDN "{dn}"', file=stream)
+    return True
@@ -0,0 +1,100 @@
+'''
+
+    Compact objects for the command plan that iter_commands builds.
+
+    A big suite turns into a great many commands, and nearly all of each
+    command is shared with its neighbours: every command starts with the
+    same slapacl binary and default arguments, runs under the same PATH,
+    and every requestattr of a test/peername shares the same options.
+    These objects keep one copy of each shared piece and refer to it.
+
+'''
+import collections.abc
+
+
+class CommandEntry(collections.abc.Mapping):
+    '''
+        One command to run, and what we expect back from it.
+
+        This reads like the hash generate_commands has always handed out:
+        entry['script'], entry['path'], entry['expects'], and, for batched
+        commands, entry['checks'].  It also compares equal to such a hash.
+        Underneath, the script is kept in three shared pieces and only
+        put together when it is asked for.
+    '''
+    __slots__ = ('prefix', 'options', 'attributes', 'path', 'env', 'expects', 'checks')
+
+    def __init__(self, prefix, options, attributes, path, env, expects, checks=None):
+        '''
+            Inputs: (String+)+    executable and default arguments, shared by every command
+                    (String+)*    test options (-D, -b, -o ...), shared by a test/peername
+                    (String+)+    the requestattr argument(s) for this command
+                    [String+]*    the PATH entries, shared by every command
+                    dict          the environment to run under, shared by every command
+                    String+       "ALLOWED" or "DENIED"
+                    None or [String+]+   batched commands: a description per requestattr
+        '''
+        setter = object.__setattr__
+        setter(self, 'prefix', prefix)
+        setter(self, 'options', options)
+        setter(self, 'attributes', attributes)
+        setter(self, 'path', path)
+        setter(self, 'env', env)
+        setter(self, 'expects', expects)
+        setter(self, 'checks', checks)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    @property
+    def script(self):
+        ''' The full command line, as a fresh list. '''
+        return list(self.prefix + self.options + self.attributes)
+
+    @property
+    def printable(self):
+        ''' The command line as one string, for people to read. '''
+        # use this in py3.8:
+        # return shlex.join(self.script)
+        return ' '.join(self.script)
+
+    def _keys(self):
+        ''' The keys this entry answers to. '''
+        if self.checks is None:
+            return ('script', 'path', 'expects')
+        return ('script', 'path', 'expects', 'checks')
+
+    def __getitem__(self, key):
+        if key == 'script':
+            return self.script
+        if key == 'path':
+            return self.path
+        if key == 'expects':
+            return self.expects
+        if key == 'checks' and self.checks is not None:
+            return self.checks
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # Mapping.get goes through a KeyError for missing keys; run_tests asks
+        # every entry for 'checks', so answer that one without the exception.
+        if key == 'checks':
+            return default if self.checks is None else self.checks
+        return super().get(key, default)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+    def __reduce__(self):
+        # __setattr__ is blocked, so pickle through the constructor instead.
+        return (type(self), (self.prefix, self.options, self.attributes, self.path,
+                             self.env, self.expects, self.checks))
@@ -4,6 +4,9 @@
 import os
 import yaml
 
+# libyaml's loader is many times faster on big suites; it is not always built.
+_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 def ingest_yaml_file(filename):
     '''
@@ -16,6 +19,6 @@ def ingest_yaml_file(filename):
     full_path = os.path.abspath(os.path.expanduser(filename))
     with open(full_path, 'r') as input_fh:
         file_contents = input_fh.read()
-    yaml_contents = yaml.safe_load(file_contents)
+    yaml_contents = yaml.load(file_contents, Loader=_LOADER)
 
     return yaml_contents
@@ -0,0 +1,98 @@
+'''
+
+    Structured results, for programs that want to consume a run as it
+    happens rather than read the text run_tests prints.
+
+'''
+import collections
+
+# The statuses a check can end up with.
+PASS = 'PASS'
+FAIL = 'FAIL'
+ERROR = 'ERROR'
+UNKNOWN = 'UNKNOWN'
+
+_RESULT_FIELDS = ('description', 'command', 'argv', 'expected', 'actual', 'status',
+                  'duration', 'stderr', 'cached', 'position')
+
+
+class Result(collections.namedtuple('Result', _RESULT_FIELDS)):
+    '''
+        The outcome of one check: one requestattr of one test/peername.
+
+        description: String+   what the check is, as run_tests prints it
+        command:     String+   the description of the command that ran it.  The same
+                               as `description`, except for batched commands, where
+                               several checks share one command.
+        argv:        [String+]+   the command line that was run
+        expected:    "ALLOWED" or "DENIED"
+        actual:      "ALLOWED", "DENIED", or None if there was no answer
+        status:      PASS, FAIL, ERROR (slapacl failed to run),
+                     or UNKNOWN (we could not read slapacl's answer)
+        duration:    Float   seconds the command took; shared by the checks of a batch
+        stderr:      None, or bytes: what slapacl said, for ERROR and UNKNOWN results
+        cached:      Bool    if the answer came from the ResultCache
+        position:    Integer   this check's place among the checks of its command
+    '''
+    __slots__ = ()
+
+    def as_dict(self):
+        ''' This result as a hash of plain values, ready for json.dumps. '''
+        retval = self._asdict()
+        if self.stderr is not None:
+            retval['stderr'] = self.stderr.decode('utf-8', errors='replace')
+        return dict(retval)
+
+
+class EarlyStop:
+    '''
+        Decides when a run should give up, so that a broken setup does not
+        spawn slapacl for every check in the suite only to fail them all.
+
+        maxfail: stop once this many checks have not passed.
+        breaker: stop once the first this-many commands have all failed
+                 (ERROR or UNKNOWN) in the same way.  Nothing ever passing
+                 that way means a broken config, path or binary, not broken ACLs.
+        Either may be None (or 0) to not stop for that reason.
+
+        After a run, .reason says why it stopped, or is None if it did not.
+    '''
+
+    def __init__(self, maxfail=None, breaker=10):
+        self.maxfail = maxfail
+        self.breaker = breaker
+        self.reason = None
+        self.failures = 0
+        self.commands = 0
+        self._signature = None
+        self._same_so_far = True
+
+    @staticmethod
+    def signature(result):
+        ''' What a failure to get an answer looked like, to compare one to another. '''
+        return (result.status, (result.stderr or b'').strip())
+
+    def check(self, result):
+        '''
+            Inputs:  Result   the next result of the run
+            Returns: Bool     True if the run should stop once this result's command is done
+        '''
+        if result.status != PASS:
+            self.failures += 1
+            if self.maxfail and self.failures >= self.maxfail and self.reason is None:
+                self.reason = f'stopped after {self.failures} failures (--maxfail)'
+        if result.position == 0 and self.breaker and self._same_so_far:
+            # Counted per command: the checks of a batched command fail together.
+            self.commands += 1
+            if result.status in (ERROR, UNKNOWN):
+                signature = self.signature(result)
+                if self._signature is None:
+                    self._signature = signature
+                self._same_so_far = signature == self._signature
+            else:
+                self._same_so_far = False
+            if self._same_so_far and self.commands >= self.breaker:
+                stderr = self._signature[1].decode('utf-8', errors='replace')
+                self.reason = (f'stopped: the first {self.commands} commands all failed '
+                               f'the same way ({self._signature[0]}): {stderr}')
+        return self.reason is not None
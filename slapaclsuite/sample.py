@@ -0,0 +1,154 @@
+'''
+
+    Sampled runs: a reproducible subset of a suite's checks.
+
+    Each test varies over up to four dimensions (authcDN, requestDN,
+    peername, requestattr) and its checks are every combination of them.
+    A Sampler picks some of those combinations, test by test:
+
+    random      each combination is kept with probability `fraction`
+    stratified  as random, but every test keeps at least one combination,
+                and every attribute named in any test's requestattrs is
+                checked at least once in the suite
+    pairwise    enough combinations that every pair of values of two
+                dimensions is checked together at least once (all-pairs);
+                a test with no more than two dimensions of more than one
+                value keeps every combination
+
+    What random and pairwise pick for a test depends only on the seed and
+    that test's content, so the same seed gives the same sample, and adding
+    or editing other tests does not change it.  So does what stratified
+    picks at random; the one check of each attribute goes to whichever test
+    offers the combination with the lowest seeded hash, across the whole
+    suite (see prepare), so it does not depend on the order of the tests,
+    but a test added that offers a lower one takes it over.
+
+'''
+import hashlib
+import itertools
+import random
+import re
+
+STRATEGIES = ('random', 'stratified', 'pairwise')
+
+# 'cn/read', 'cn:value', 'cn' -> 'cn'
+_ATTRIBUTE_RE = re.compile(r'[/:]')
+
+
+class Sampler:
+    '''
+        Chooses which combinations of each test to run.
+        Hand one to iter_commands (sample=).
+    '''
+
+    def __init__(self, strategy, fraction=0.1, seed=0):
+        '''
+            Inputs: String+   one of STRATEGIES
+                    Float     the share of combinations random and stratified keep, (0, 1]
+                    Integer   the seed
+        '''
+        if strategy not in STRATEGIES:
+            raise ValueError(f'sample strategy must be one of {", ".join(STRATEGIES)}')
+        if not 0 < fraction <= 1:
+            raise ValueError('sample fraction must be more than 0 and at most 1')
+        self.strategy = strategy
+        self.fraction = fraction
+        self.seed = seed
+        # test_key: the combinations stratified adds to it, to cover an attribute
+        self._covering = {}
+
+    def describe(self):
+        ''' Returns: String+   how to get this sample again '''
+        if self.strategy == 'pairwise':
+            return f'--sample pairwise --sample-seed {self.seed}'
+        return (f'--sample {self.strategy} --sample-fraction {self.fraction} '
+                f'--sample-seed {self.seed}')
+
+    def prepare(self, tests):
+        '''
+            Look over the whole suite before sampling it.  For stratified, this
+            finds which test checks each attribute: for every attribute of every
+            test, one combination is drawn from the seed and the test's content,
+            and of all those for an attribute, the one with the lowest seeded
+            hash is the one to run.  Nothing is rendered to find them.
+            Inputs: iterable of (String+, (Integer+), [String+]+)   each test's
+                    content_hash and sizes, as combinations takes them, and its
+                    requestattrs
+        '''
+        self._covering = {}
+        if self.strategy != 'stratified':
+            return
+        best = {}
+        for (test_key, sizes, requestattrs) in tests:
+            for (position, requestattr) in enumerate(requestattrs):
+                attribute = _ATTRIBUTE_RE.split(requestattr, 1)[0].lower()
+                chooser = random.Random(f'{self.seed}:{test_key}:{position}')
+                combination = tuple(chooser.randrange(x) for x in sizes[:3]) + (position,)
+                rank = hashlib.blake2b(f'{self.seed}:{test_key}:{combination}'.encode('utf-8'),
+                                       digest_size=8).digest()
+                if attribute not in best or (rank, test_key) < best[attribute][:2]:
+                    best[attribute] = (rank, test_key, combination)
+        for (_, test_key, combination) in best.values():
+            self._covering.setdefault(test_key, []).append(combination)
+
+    def combinations(self, test_key, sizes):
+        '''
+            Inputs: String+   identifies the test by its content (its content_hash)
+                    (Integer+)   the number of authcDNs, requestDNs, peernames, requestattrs
+            Returns: iterable of (Integer)   index tuples into those dimensions, in the
+                                             order the full product would give them
+        '''
+        chooser = random.Random(f'{self.seed}:{test_key}')
+        full = itertools.product(*(range(x) for x in sizes))
+        if self.strategy == 'random':
+            return (x for x in full if chooser.random() < self.fraction)
+        if self.strategy == 'pairwise':
+            return sorted(set(all_pairs(sizes, chooser)))
+
+        chosen = [x for x in full if chooser.random() < self.fraction]
+        if not chosen:
+            chosen.append(tuple(chooser.randrange(x) for x in sizes))
+        chosen.extend(self._covering.get(test_key, []))
+        return sorted(set(chosen))
+
+
+def all_pairs(sizes, chooser):
+    '''
+        A covering array of strength two, built greedily (in the manner of IPOG).
+        Inputs: (Integer+)   how many values each dimension has
+                random.Random   to fill in values no pair needed
+        Returns: [(Integer)]   rows in which every pair of values of every two
+                               dimensions appears at least once
+    '''
+    varying = [x for (x, size) in enumerate(sizes) if size > 1]
+    if len(varying) <= 2:
+        return list(itertools.product(*(range(x) for x in sizes)))
+
+    (first, second) = varying[:2]
+    rows = [{first: x, second: y} for x in range(sizes[first]) for y in range(sizes[second])]
+    for (done, dimension) in enumerate(varying[2:], 2):
+        earlier = varying[:done]
+        uncovered = {(other, x, y) for other in earlier
+                     for x in range(sizes[other]) for y in range(sizes[dimension])}
+        # Grow each row by the value that covers the most pairs still missing.
+        for row in rows:
+            best = max(range(sizes[dimension]),
+                       key=lambda y, row=row: sum((other, row[other], y) in uncovered
+                                                  for other in earlier if other in row))
+            row[dimension] = best
+            uncovered.difference_update((other, row[other], best)
+                                        for other in earlier if other in row)
+        # Then add rows for what is left, sharing a row where the pairs allow.
+        extra = []
+        for (other, x, y) in sorted(uncovered):
+            for row in extra:
+                if row[dimension] == y and other not in row:
+                    row[other] = x
+                    break
+            else:
+                extra.append({other: x, dimension: y})
+        rows.extend(extra)
+
+    return [tuple(row[x] if x in row else (chooser.randrange(size) if size > 1 else 0)
+                  for (x, size) in enumerate(sizes))
+            for row in rows]
@@ -0,0 +1,244 @@
+'''
+
+    Sharded runs: one suite split over several machines, and put back
+    together afterwards.
+
+    Each command goes to a shard by a hash of what it is (its description
+    and command line), not by where it falls in the plan, so adding or
+    removing tests only moves the commands that were added or removed.
+
+    A shard can write its results as JSON lines: one line per check, each
+    with the index of its command in the whole plan, then a last line that
+    says which shard this was, how big the whole plan was, how it was
+    dealt out to the shards, which backend answered the checks, and
+    whether the run was stopped early.
+    merge_results reads every shard's file back, checks that they are all
+    there, all of the same plan dealt out the same way, and that every
+    command ran exactly once, and puts the checks back in suite order.
+
+'''
+import collections
+import hashlib
+import json
+from .results import Result
+
+# A shard's results file: what its last line says.
+_SUMMARY_FIELDS = ('shard', 'shards', 'plan', 'assignment', 'backend', 'commands', 'stopped')
+
+
+def command_key(tuple_entry):
+    '''
+        Inputs: (String+, hash)   a command, as from iter_commands
+        Returns: bytes   what identifies the command, the same in every run
+    '''
+    (description, entry) = tuple_entry
+    return '\0'.join([description, entry['expects']] + entry['script']).encode('utf-8')
+
+
+def result_key(result):
+    '''
+        Inputs: Result   a check
+        Returns: bytes   the command_key of the command that ran it
+    '''
+    return '\0'.join([result.command, result.expected] + result.argv).encode('utf-8')
+
+
+def shard_of(tuple_entry, count):
+    '''
+        Inputs: (String+, hash)   a command, as from iter_commands
+                Integer   how many shards there are
+        Returns: Integer   which shard it belongs to, from 1 to count
+    '''
+    digest = hashlib.blake2b(command_key(tuple_entry), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % count + 1
+
+
+class Shard:
+    '''
+        One shard of a run: picks its commands out of the plan, and keeps
+        a results file for merge_results, if it is given one.
+
+            shard = Shard(2, 4, output_fh)
+            statuses = run_tests(shard.select(commands), record=shard.record, ...)
+            shard.finish(stop)
+    '''
+
+    def __init__(self, index=1, count=1, output_fh=None, assignment=None, backend='slapacl'):
+        '''
+            Inputs: Integer   this shard, from 1 to count
+                    Integer   how many shards the plan is split into
+                    None, or a text file to write results to as JSON lines
+                    None to shard by shard_of, or dict(bytes: Integer): the shard of
+                    each command_key, worked out some other way (see history.plan_shards)
+                    String+   the backend that answers the checks, for the summary
+        '''
+        if not 1 <= index <= count:
+            raise ValueError(f'shard {index} of {count} does not exist')
+        self.index = index
+        self.count = count
+        self.output_fh = output_fh
+        self.assignment = assignment
+        self.backend = backend
+        self.commands = 0
+        self.selected = 0
+        self._plan = hashlib.sha256()
+        self._assignment = hashlib.sha256()
+        self._indexes = collections.defaultdict(collections.deque)
+        self._command = None
+        self._selecting = None
+
+    def select(self, commands):
+        '''
+            Inputs: commands, as from iter_commands
+            Returns: iterator of the ones that belong to this shard, in plan order
+
+            Every command of the plan is looked at, so that afterwards we know
+            how big the plan was, and can tell it apart from another plan, or
+            from the same plan dealt out to the shards another way.
+        '''
+        self._selecting = self._select(commands)
+        return self._selecting
+
+    def _select(self, commands):
+        ''' The generator behind select. '''
+        for tuple_entry in commands:
+            key = command_key(tuple_entry)
+            self._plan.update(hashlib.sha256(key).digest())
+            plan_index = self.commands
+            self.commands += 1
+            shard = 1
+            if self.count > 1:
+                if self.assignment is None:
+                    shard = shard_of(tuple_entry, self.count)
+                else:
+                    shard = self.assignment[key]
+            self._assignment.update(shard.to_bytes(4, 'little'))
+            if shard != self.index:
+                continue
+            self.selected += 1
+            self._indexes[key].append(plan_index)
+            yield tuple_entry
+
+    def record(self, result):
+        '''
+            Write one Result to the results file, if there is one.
+            The commands may have been run in another order than they were
+            selected in, but the checks of each must come together.
+        '''
+        if result.position == 0:
+            self._command = self._indexes[result_key(result)].popleft()
+        if self.output_fh is not None:
+            line = dict(result.as_dict(), index=self._command)
+            self.output_fh.write(json.dumps(line, sort_keys=True) + '\n')
+
+    def finish(self, stop=None):
+        '''
+            End the results file with this shard's summary line.
+            Inputs: None, or the EarlyStop the run used
+        '''
+        if self.output_fh is None:
+            return
+        if self._selecting is not None:
+            # A run stopped early did not get to the end of the plan; the
+            # summary is of the whole plan all the same, so the shards agree.
+            for _ in self._selecting:
+                pass
+        summary = {'shard': self.index, 'shards': self.count,
+                   'plan': self._plan.hexdigest(), 'assignment': self._assignment.hexdigest(),
+                   'backend': self.backend, 'commands': self.commands,
+                   'stopped': None if stop is None else stop.reason}
+        self.output_fh.write(json.dumps({'summary': summary}, sort_keys=True) + '\n')
+        self.output_fh.flush()
+
+
+def read_results(filename):
+    '''
+        Inputs: String+   a results file written through a Shard
+        Returns: (dict, [(Integer, Result)])   its summary, and its results,
+                                               each with its command's place in the plan
+        Raises: ValueError if it is not a whole results file
+    '''
+    summary = None
+    results = []
+    with open(filename, 'r') as input_fh:
+        for (line_number, line) in enumerate(input_fh, 1):
+            if summary is not None:
+                raise ValueError(f'{filename}: line {line_number}: results after the summary.')
+            try:
+                record = json.loads(line)
+                if 'summary' in record:
+                    summary = {key: record['summary'][key] for key in _SUMMARY_FIELDS}
+                    continue
+                plan_index = record.pop('index')
+                if record['stderr'] is not None:
+                    record['stderr'] = record['stderr'].encode('utf-8')
+                results.append((plan_index, Result(**record)))
+            except (ValueError, TypeError, KeyError) as err:
+                raise ValueError(f'{filename}: line {line_number}: '
+                                 f'not a result line ({err}).')
+    if summary is None:
+        raise ValueError(f'{filename}: no summary line; did that shard finish?')
+    return (summary, results)
+
+
+def merge_results(filenames):
+    '''
+        Inputs: [String+]+   the results file of every shard of one run
+        Returns: (dict, [Result])   what the run was, and every check, in plan order
+                 The dict has 'shards', 'plan', 'assignment', 'backend', 'commands',
+                 and 'stopped': the reasons any shard was stopped early.
+        Raises: ValueError if the files are not every shard of the same plan, dealt out
+                the same way, once each, or between them did not run every command
+                of the plan once (unless a shard was stopped early)
+    '''
+    summaries = {}
+    merged = []
+    for filename in filenames:
+        (summary, results) = read_results(filename)
+        if summaries:
+            first = next(iter(summaries.values()))
+            if (summary['shards'], summary['plan']) != (first['shards'], first['plan']):
+                raise ValueError(f'{filename}: is from a different plan or shard count '
+                                 f'than the other results files.')
+            if summary['assignment'] != first['assignment']:
+                # Shards planned by duration from different histories.
+                raise ValueError(f'{filename}: dealt the commands out to the shards '
+                                 f'differently than the other results files did; did '
+                                 f'every shard use the same --history-file?')
+            if summary['backend'] != first['backend']:
+                raise ValueError(f'{filename}: ran with --backend {summary["backend"]}, the '
+                                 f'other results files with --backend {first["backend"]}.')
+        if summary['shard'] in summaries:
+            raise ValueError(f'{filename}: shard {summary["shard"]} is given twice.')
+        summaries[summary['shard']] = summary
+        merged.extend(results)
+
+    if not summaries:
+        raise ValueError('No results files to merge.')
+    first = next(iter(summaries.values()))
+    missing = sorted(set(range(1, first['shards'] + 1)) - set(summaries))
+    if missing:
+        raise ValueError(f'Missing the results of shard(s) '
+                         f'{", ".join(str(x) for x in missing)} of {first["shards"]}.')
+    merged.sort(key=lambda x: (x[0], x[1].position))
+    stopped = [f'shard {shard}: {summary["stopped"]}'
+               for (shard, summary) in sorted(summaries.items()) if summary['stopped']]
+    ran = collections.Counter(plan_index for (plan_index, result) in merged
+                              if result.position == 0)
+    twice = sorted(x for (x, count) in ran.items() if count > 1)
+    if twice:
+        raise ValueError(f'Command(s) {", ".join(str(x) for x in twice[:10])} of the plan '
+                         f'ran more than once.')
+    outside = sorted(x for x in ran if not 0 <= x < first['commands'])
+    if outside:
+        raise ValueError(f'Command(s) {", ".join(str(x) for x in outside[:10])} are not '
+                         f'in a plan of {first["commands"]} commands.')
+    if not stopped and len(ran) != first['commands']:
+        never = sorted(set(range(first['commands'])) - set(ran))
+        raise ValueError(f'Command(s) {", ".join(str(x) for x in never[:10])} of the plan '
+                         f'never ran.')
+    return ({'shards': first['shards'], 'plan': first['plan'],
+             'assignment': first['assignment'], 'backend': first['backend'],
+             'commands': first['commands'],
+             'stopped': stopped},
+            [result for (_, result) in merged])
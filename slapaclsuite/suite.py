@@ -0,0 +1,239 @@
+'''
+
+    Suites spread over several YAML files.
+
+    Each team can keep its own tests in its own file.  A suite is any mix
+    of files and directories (every *.yaml / *.yml under it), and any file
+    may name more with an `include:` list, relative to itself.  Only one
+    file may define `administrative`, and only one `scripting` (or several
+    may, if they agree); they are shared by the tests of every file.
+
+    Files are read, and their tests validated, in a pool of processes.
+    Each file's validated tests are cached on its own, so editing one
+    file only costs reading and validating that file again.
+
+'''
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+from .cache import SuiteCache
+from .readfile import ingest_yaml_file
+from .yaml_input_validator.administrative import AdministrativeSectionValidator
+from .yaml_input_validator.scripting import ScriptingSectionValidator
+from .yaml_input_validator.tests import TestsSectionValidator
+
+# The top-level keys a file may have.  `tests` is kept apart from the rest.
+SHARED_SECTIONS = ('administrative', 'scripting')
+SECTIONS = SHARED_SECTIONS + ('include', 'tests')
+
+
+def suite_files(paths, relative_to=None):
+    '''
+        Inputs: [String+]+   files and directories
+                None or String+   a directory relative paths are taken from
+        Returns: [String+]   the files, in order: a directory gives every
+                             *.yaml / *.yml under it, sorted by name
+    '''
+    files = []
+    for path in paths:
+        if not isinstance(path, str):
+            raise ValueError(f'include "{path}" must be a string.')
+        path = os.path.expanduser(path)
+        if relative_to is not None:
+            path = os.path.join(relative_to, path)
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            dirnames.sort()
+            files.extend(os.path.join(dirpath, x) for x in sorted(filenames)
+                         if x.endswith(('.yaml', '.yml')))
+    return files
+
+
+def _read(filename):
+    '''
+        Worker: read one file of a suite.
+        Returns: dict   its top-level sections
+    '''
+    document = ingest_yaml_file(filename)
+    if document is None:
+        document = {}
+    if not isinstance(document, dict):
+        raise ValueError(f'{filename}: must be a mapping of sections.')
+    unexpected = set(document) - set(SECTIONS)
+    if unexpected:
+        raise ValueError(f'{filename}: unexpected sections {unexpected}')
+    if not isinstance(document.get('include', []), list):
+        raise ValueError(f'{filename}: include must be a list.')
+    return document
+
+
+def _validate(filename, admin_object, tests, verbose, jobs=1):
+    '''
+        Worker: validate the tests of one file, in `jobs` processes if it is large.
+        Returns: [TestValidator]
+    '''
+    validator = TestsSectionValidator()
+    try:
+        validator.validate(tests, admin_object=admin_object, verbose=verbose, jobs=jobs)
+    except ValueError as validation_err:
+        raise ValueError(f'{filename}: {validation_err}')
+    return validator.inputs
+
+
+def _pool_map(func, argument_lists, jobs):
+    '''
+        func(*arguments) for each, in a pool of `jobs` processes when there is
+        more than one to do, and in order.
+    '''
+    if jobs <= 1 or len(argument_lists) <= 1:
+        return [func(*arguments) for arguments in argument_lists]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(func, *zip(*argument_lists)))
+
+
+def load_suite(paths, cache_dir=None, jobs=1, verbose=False, refresh=False, timings=None,
+               validate_jobs=1):
+    '''
+        Read and validate a suite made of several files.
+        Inputs: [String+]+   files and directories
+                cache_dir: None to not cache, or the cache directory
+                jobs: how many processes to read and validate files in
+                validate_jobs: how many processes to split the tests of a single
+                               file to validate over (see validate_input)
+                refresh: ignore what is cached, but cache afresh
+                timings: None, or a Timings to record the ingest and validate phases in
+        Returns: dict   as validate_input
+        Raises: IOError or yaml.YAMLError if a file can not be read.
+                ValueError if the content is invalid, or files of the suite disagree.
+    '''
+    cache = None if cache_dir is None else SuiteCache(cache_dir)
+    documents = {}
+    entries = {}
+    keys = {}
+    includes = {}
+    with _phase(timings, 'ingest'):
+        pending = suite_files(paths)
+        while pending:
+            pending = [x for x in dict.fromkeys(os.path.realpath(x) for x in pending)
+                       if x not in includes]
+            to_read = []
+            for filename in pending:
+                entry = None
+                if cache is not None:
+                    keys[filename] = cache.key(filename, kind='file')
+                    if keys[filename] is not None and not refresh:
+                        entry = cache.get(keys[filename])
+                if entry is None:
+                    to_read.append(filename)
+                else:
+                    entries[filename] = entry
+            read = _pool_map(_read, [(x,) for x in to_read], jobs)
+            documents.update(zip(to_read, read))
+            found = []
+            for filename in pending:
+                source = documents[filename] if filename in documents \
+                    else entries[filename]['sections']
+                includes[filename] = suite_files(source.get('include', []),
+                                                 relative_to=os.path.dirname(filename))
+                found.extend(includes[filename])
+            pending = found
+    order = []
+    for filename in suite_files(paths):
+        _walk(os.path.realpath(filename), includes, order)
+
+    with _phase(timings, 'validate'):
+        (shared, where) = _shared_sections(order, documents, entries)
+        config_out = {'administrative': AdministrativeSectionValidator(),
+                      'scripting': ScriptingSectionValidator(),
+                      'tests': TestsSectionValidator()}
+        base_dir = None
+        if 'administrative' in where:
+            base_dir = os.path.dirname(where['administrative'])
+        config_out['administrative'].validate(shared.get('administrative'),
+                                              verbose=verbose, cache_dir=cache_dir,
+                                              base_dir=base_dir)
+        config_out['scripting'].validate(shared.get('scripting'), verbose=verbose)
+        # Tests are validated against the administrative section (for its
+        # substitutions, inline or in files), so a cached file whose tests
+        # were validated under another one has to be read again: its raw
+        # tests are not kept.
+        shared_key = hashlib.sha256(json.dumps(
+            [shared.get('administrative'), config_out['administrative'].table_digests()],
+            sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        stale = [x for x in order
+                 if x in entries and entries[x]['shared'] != shared_key]
+        documents.update(zip(stale, _pool_map(_read, [(x,) for x in stale], jobs)))
+        for filename in stale:
+            del entries[filename]
+        to_validate = [x for x in order if x in documents and documents[x].get('tests')]
+        # One file to validate is split over the processes; several are
+        # handed out whole, since workers can not start pools of their own.
+        file_jobs = validate_jobs if len(to_validate) == 1 else 1
+        validated = _pool_map(_validate, [(x, config_out['administrative'],
+                                           documents[x]['tests'], verbose, file_jobs)
+                                          for x in to_validate], jobs)
+        testers = dict(zip(to_validate, validated))
+
+        all_testers = []
+        for filename in order:
+            if filename in entries:
+                all_testers.extend(entries[filename]['tests'])
+                continue
+            all_testers.extend(testers.get(filename, []))
+            if cache is not None and keys[filename] is not None:
+                sections = {x: documents[filename][x] for x in documents[filename]
+                            if x != 'tests'}
+                cache.put(keys[filename], {'sections': sections, 'shared': shared_key,
+                                           'tests': testers.get(filename, [])})
+        if not all_testers:
+            raise ValueError('No tests defined in any file of the suite.')
+        config_out['tests'].inputs = all_testers
+    return config_out
+
+
+def _walk(filename, includes, order, seen=None):
+    ''' Put a file, then what it includes, in `order`, each file only once. '''
+    if seen is None:
+        seen = set(order)
+    if filename in seen:
+        return
+    seen.add(filename)
+    order.append(filename)
+    for included in includes[filename]:
+        _walk(os.path.realpath(included), includes, order, seen)
+
+
+def _shared_sections(order, documents, entries):
+    '''
+        The administrative and scripting sections, from whichever file defines them.
+        Returns: (dict, dict)   the sections; and the (first) file each is defined in
+        Raises: ValueError if two files define one differently
+    '''
+    shared = {}
+    where = {}
+    for filename in order:
+        source = documents[filename] if filename in documents \
+            else entries[filename]['sections']
+        for section in SHARED_SECTIONS:
+            if source.get(section) is None:
+                continue
+            if section in shared and shared[section] != source[section]:
+                raise ValueError(f'{section} is defined differently in {where[section]} '
+                                 f'and {filename}; define it in one file only.')
+            shared[section] = source[section]
+            where.setdefault(section, filename)
+    return (shared, where)
+
+
+@contextlib.contextmanager
+def _phase(timings, name):
+    ''' timings.phase(name), or nothing when there are no timings. '''
+    if timings is None:
+        yield
+    else:
+        with timings.phase(name):
+            yield
@@ -0,0 +1,183 @@
+'''
+
+    Timing instrumentation for a run: how long each phase took, and how
+    long each slapacl call took, so a slow run can be blamed on the right
+    thing (YAML parsing, validation, or slapacl itself).
+
+'''
+import collections
+import contextlib
+import json
+import resource
+import sys
+import time
+
+
+def _children_cpu():
+    ''' CPU seconds used so far by child processes that have been waited for. '''
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(sorted_values, fraction):
+    '''
+        Nearest-rank percentile.
+        Inputs: [Float]+   values, already sorted
+                Float      0 < fraction <= 1, e.g. 0.95
+        Returns: Float
+    '''
+    rank = int(fraction * len(sorted_values) + 0.999999)
+    return sorted_values[max(rank, 1) - 1]
+
+
+class Timings:
+    '''
+        Collects timings over a run.
+        Phases are timed with `with timings.phase('name'):`, and run_tests
+        records each command it runs with `record_command`.
+    '''
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+        self.commands = []
+        self.cached = 0
+        self._children_cpu_start = _children_cpu()
+
+    def add_phase(self, name, wall, cpu):
+        '''
+            Add time to a phase, creating it if need be.
+            Inputs: String+   the phase
+                    Float     wall-clock seconds
+                    Float     CPU seconds (of this process, all threads)
+        '''
+        phase = self.phases.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+        phase['wall_seconds'] += wall
+        phase['cpu_seconds'] += cpu
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        ''' Time the body of a `with` block as part of the phase `name`. '''
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - wall_start,
+                           time.process_time() - cpu_start)
+
+    def timed_iter(self, name, iterable, within=None):
+        '''
+            Hand out the items of `iterable`, counting the time spent making
+            them toward the phase `name`, and taking it back out of the phase
+            `within`, if given.  This is how the time to generate commands is
+            told apart from the time to run them, when the one feeds the other
+            as it goes.
+        '''
+        iterator = iter(iterable)
+        while True:
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                wall = time.perf_counter() - wall_start
+                cpu = time.process_time() - cpu_start
+                self.add_phase(name, wall, cpu)
+                if within is not None:
+                    self.add_phase(within, -wall, -cpu)
+            yield item
+
+    def record_command(self, description, seconds, cached=False):
+        '''
+            Record one command.
+            Inputs: String+   its description
+                    Float     how long it took, start to finish
+                    Bool      if it was answered from the result cache,
+                              it is counted but kept out of the latency figures
+        '''
+        if cached:
+            self.cached += 1
+        else:
+            self.commands.append((description, seconds))
+
+    def summary(self, slowest=10):
+        '''
+            Inputs: Integer   how many of the slowest commands to list
+            Returns: dict     everything we know, ready for json.dump
+        '''
+        retval = {'phases': {}}
+        for (name, phase) in self.phases.items():
+            retval['phases'][name] = {key: round(value, 6) for (key, value) in phase.items()}
+
+        latencies = sorted(seconds for (_, seconds) in self.commands)
+        total = sum(latencies)
+        children_cpu = _children_cpu() - self._children_cpu_start
+        retval['commands'] = {
+            'run': len(latencies),
+            'cached': self.cached,
+        }
+        if latencies:
+            retval['latency'] = {
+                'p50': round(percentile(latencies, 0.50), 6),
+                'p95': round(percentile(latencies, 0.95), 6),
+                'p99': round(percentile(latencies, 0.99), 6),
+                'max': round(latencies[-1], 6),
+                'mean': round(total / len(latencies), 6),
+            }
+        else:
+            retval['latency'] = {}
+        retval['spawn'] = {
+            'total_seconds': round(total, 6),
+            'children_cpu_seconds': round(children_cpu, 6),
+            # What slapacl calls took, beyond the CPU slapacl itself used:
+            # fork/exec, process start-up, and waiting on I/O.
+            'overhead_seconds': round(max(total - children_cpu, 0.0), 6),
+        }
+        slowest_commands = sorted(self.commands, key=lambda x: x[1], reverse=True)[:slowest]
+        retval['slowest'] = [{'description': description, 'seconds': round(seconds, 6)}
+                             for (description, seconds) in slowest_commands]
+        return retval
+
+    def report(self, slowest=10, stream=None):
+        ''' Print the summary for people to read. '''
+        if stream is None:
+            stream = sys.stdout
+        summary = self.summary(slowest=slowest)
+        print('# Timings', file=stream)
+        for (name, phase) in summary['phases'].items():
+            print(f'#   {name:10} {phase["wall_seconds"]:10.3f}s wall '
+                  f'{phase["cpu_seconds"]:10.3f}s cpu', file=stream)
+        commands = summary['commands']
+        print(f'# slapacl calls: {commands["run"]} run, {commands["cached"]} from cache',
+              file=stream)
+        latency = summary['latency']
+        if latency:
+            print(f'#   latency p50 {latency["p50"]:.3f}s  p95 {latency["p95"]:.3f}s  '
+                  f'p99 {latency["p99"]:.3f}s  max {latency["max"]:.3f}s', file=stream)
+        spawn = summary['spawn']
+        print(f'#   total {spawn["total_seconds"]:.3f}s, of which slapacl used '
+              f'{spawn["children_cpu_seconds"]:.3f}s cpu; '
+              f'spawn/wait overhead {spawn["overhead_seconds"]:.3f}s', file=stream)
+        if summary['slowest']:
+            print(f'# slowest {len(summary["slowest"])}:', file=stream)
+            for item in summary['slowest']:
+                print(f'#   {item["seconds"]:8.3f}s  {item["description"]}', file=stream)
+
+    def write_json(self, filename, slowest=10):
+        ''' Write the summary to a file as JSON, for dashboards. '''
+        with open(filename, 'w') as output_fh:
+            json.dump(self.summary(slowest=slowest), output_fh, indent=2)
+
+
+def timed_run(timings, run, commands, **kwargs):
+    '''
+        Call run(commands, timings=timings, **kwargs) -- that is, run_tests --
+        timing it as the 'run' phase, except for the time spent generating
+        `commands`, which counts as the 'generate' phase.
+        Returns: whatever `run` returns
+    '''
+    with timings.phase('run'):
+        return run(timings.timed_iter('generate', commands, within='run'),
+                   timings=timings, **kwargs)
@@ -3,25 +3,22 @@
     the validator of the administrative section of the YAML input structure.
 
 '''
-import sys
+import os
+from .substitution import SubstitutionEngine
+from .tables import MappedTable, load_table, table_format
 
 
 class AdministrativeSectionValidator:
     ''' class that validates the 'administrative' section of the YAML config '''
     section = 'administrative'
 
-    def _field_name(self, count=1):
-        ''' What field does the calling function seek to validate? '''
-        calling_func_str = sys._getframe(count).f_code.co_name  # pylint: disable=protected-access
-        return self.validating_functions[calling_func_str]
-
     def _validate_name(self, value_in, verbose=False):
         '''
             Validate the name of the test suite
             Inputs: None or String*
             Returns: String+
         '''
-        my_field = self._field_name()
+        my_field = 'name'
         where_am_i = f'{self.section} / {my_field}'
         if verbose:
             print(f'## Preflighting {where_am_i}.')
@@ -33,20 +30,27 @@ class AdministrativeSectionValidator:
             value_out = value_in
         return value_out
 
-    def __validate_sub_key(self, value_in, verbose=False):
+    def __validate_sub_key(self, my_field, value_in, verbose=False):
         '''
-            Validate a string for indicating runtime substitutions.
-            Inputs: None or String+
-            Returns: None or String+
+            Validate a string for indicating runtime substitutions, or a list of them.
+            Inputs: String+   the field being validated
+                    None or String+ or [String+]+
+            Returns: None or String+ or [String+]+
         '''
-        my_field = self._field_name(2)
         where_am_i = f'{self.section} / {my_field}'
         if verbose:
             print(f'## Preflighting {where_am_i}.')
         if value_in is None:
             value_out = None
+        elif isinstance(value_in, list):
+            if not value_in:
+                raise ValueError(f'{where_am_i} cannot be an empty list.')
+            for item in value_in:
+                if not isinstance(item, str) or not item:
+                    raise ValueError(f'{where_am_i} "{item}" must be a nonempty string.')
+            value_out = value_in
         elif not isinstance(value_in, str):
-            raise ValueError(f'{where_am_i} must be a string.')
+            raise ValueError(f'{where_am_i} must be a string or a list of strings.')
         elif not value_in:
             raise ValueError(f'{where_am_i} cannot be an empty string.')
         else:
@@ -55,47 +59,60 @@ class AdministrativeSectionValidator:
 
     def _validate_dn_sub_key(self, value_in, verbose=False):
         ''' Simple wrapper '''
-        return self.__validate_sub_key(value_in, verbose)
+        return self.__validate_sub_key('DN_substitutions_key', value_in, verbose)
 
     def _validate_peername_sub_key(self, value_in, verbose=False):
         ''' Simple wrapper '''
-        return self.__validate_sub_key(value_in, verbose)
+        return self.__validate_sub_key('peername_substitutions_key', value_in, verbose)
 
-    def __validate_subs(self, value_in, verbose=False):
+    def __validate_subs(self, my_field, value_in, verbose=False):
         '''
-            Validate a dict of available substitutions
-            Inputs: None or dict(String+: String+)
-            Returns: dict(String+: String+)
+            Validate a dict of available substitutions, or the name of a file of them
+            Inputs: String+   the field being validated
+                    None or dict(String+: String+ or [String+]+) or String+ (see tables.py)
+            Returns: dict(String+: String+ or [String+]+) or String+
         '''
-        my_field = self._field_name(2)
         where_am_i = f'{self.section} / {my_field}'
         if verbose:
             print(f'## Preflighting {where_am_i}.')
         if value_in is None:
             value_out = {}
+        elif isinstance(value_in, str) and value_in:
+            try:
+                table_format(value_in)
+            except ValueError as format_err:
+                raise ValueError(f'{where_am_i} {format_err}')
+            if not os.path.isfile(self._path(value_in)):
+                raise ValueError(f'{where_am_i} "{value_in}" is not a file.')
+            value_out = value_in
         elif not isinstance(value_in, dict):
-            raise ValueError(f'{where_am_i} must be a dict.')
+            raise ValueError(f'{where_am_i} must be a dict or a file name.')
         else:
             for subk, subv in value_in.items():
                 if not isinstance(subk, str) or not subk:
                     raise ValueError(f'{where_am_i} "{subk}" must be a nonempty string.')
-                if not isinstance(subv, str) or not subv:
-                    raise ValueError(f'{where_am_i} "{subk}" / "{subv}" must be a nonempty string.')
+                # A list is a group: the name stands in for each of them.
+                group = subv if isinstance(subv, list) and subv else [subv]
+                if not all(isinstance(x, str) and x for x in group):
+                    raise ValueError(f'{where_am_i} "{subk}" / "{subv}" must be a nonempty string '
+                                     f'or list of them.')
             value_out = value_in
         return value_out
 
     def _validate_dn_subs(self, value_in, verbose=False):
         ''' Simple wrapper '''
-        return self.__validate_subs(value_in, verbose)
+        return self.__validate_subs('DN_substitutions', value_in, verbose)
 
     def _validate_peername_subs(self, value_in, verbose=False):
         ''' Simple wrapper '''
-        return self.__validate_subs(value_in, verbose)
+        return self.__validate_subs('peername_substitutions', value_in, verbose)
 
     def __init__(self):
         '''
             build a dict of functions (above) that will validate pieces of the config
         '''
+        self.cache_dir = None
+        self.base_dir = None
         self.validating_functions = {
             '_validate_name': 'name',
             '_validate_dn_sub_key': 'DN_substitutions_key',
@@ -104,6 +121,64 @@ class AdministrativeSectionValidator:
             '_validate_peername_subs': 'peername_substitutions',
         }
         self.inputs = None
+        self._engines = (None, None, None)
+
+    def _engine(self, kind):
+        '''
+            The SubstitutionEngine for 'DN' or 'peername', compiled from inputs.
+            Compiled again whenever inputs is replaced.
+        '''
+        (inputs, dn_engine, peername_engine) = self._engines
+        if inputs is not self.inputs:
+            dn_engine = SubstitutionEngine(self.inputs['DN_substitutions_key'],
+                                           self._table('DN'))
+            peername_engine = SubstitutionEngine(self.inputs['peername_substitutions_key'],
+                                                 self._table('peername'))
+            self._engines = (self.inputs, dn_engine, peername_engine)
+        if kind == 'DN':
+            return dn_engine
+        return peername_engine
+
+    def _table(self, kind):
+        '''
+            The substitutions for 'DN' or 'peername': the inline dict, or a MappedTable
+            for a file of them.
+        '''
+        my_field = f'{kind}_substitutions'
+        table = self.inputs[my_field]
+        if not isinstance(table, str):
+            return table
+        try:
+            return load_table(self._path(table), kind, cache_dir=self.cache_dir)
+        except (OSError, ValueError) as table_err:
+            raise ValueError(f'{self.section} / {my_field}: {table_err}')
+
+    def _path(self, filename):
+        ''' A file of substitutions, relative to the file that names it, as include: is. '''
+        filename = os.path.expanduser(filename)
+        if self.base_dir is None:
+            return filename
+        return os.path.join(self.base_dir, filename)
+
+    def table_digests(self):
+        '''
+            Returns: [String+]   the hash of each file of substitutions, as it was read
+        '''
+        if self.inputs is None:
+            return []
+        tables = [self._engine('DN').table, self._engine('peername').table]
+        return [x.digest for x in tables if isinstance(x, MappedTable)]
+
+    def tables_changed(self):
+        '''
+            Has a file of substitutions changed since it was read?  Tests validated
+            against the old contents would then be out of date.
+            Returns: Bool
+        '''
+        if self.inputs is None:
+            return False
+        tables = [self._engine('DN').table, self._engine('peername').table]
+        return any(x.changed() for x in tables if isinstance(x, MappedTable))
 
     def possible_dn_substitutions(self, string_in):
         '''
@@ -116,6 +191,7 @@ class AdministrativeSectionValidator:
                    key = 'MAGIC:' and
                    subs = {'a':'M', 'b':'N'}
                    returns 'N'
+            A name whose value is a list (a group) returns the list.
         '''
         if self.inputs is None:
             raise RuntimeError(f'Can not perform DN subs before validation.')
@@ -123,22 +199,7 @@ class AdministrativeSectionValidator:
         if not isinstance(string_in, str):
             raise ValueError(f'input-string must be a string')
 
-        subkey = self.inputs['DN_substitutions_key']
-        subs = self.inputs['DN_substitutions']
-
-        if not subkey or not subs:
-            # "I don't want no subs"
-            return string_in
-        if not string_in.startswith(subkey):
-            # We're never going to match in order to do a substitution...
-            # So no sub happens: return the original.
-            return string_in
-
-        possible_key = string_in.replace(subkey, '', 1)
-        possible_value = subs.get(possible_key)
-        if possible_value is None:
-            return string_in
-        return possible_value
+        return self._engine('DN').substitute(string_in)
 
     def possible_peername_substitutions(self, string_in):
         '''
@@ -158,28 +219,16 @@ class AdministrativeSectionValidator:
         if not isinstance(string_in, str):
             raise ValueError(f'input-string must be a string')
 
-        subkey = self.inputs['peername_substitutions_key']
-        subs = self.inputs['peername_substitutions']
-
-        if not subkey or not subs:
-            # "subs is a key that can't get no love from me"
-            return string_in
-        if not string_in.startswith(subkey):
-            # We're never going to match in order to do a substitution...
-            # So no sub happens: return the original.
-            return string_in
-
-        possible_key = string_in.replace(subkey, '', 1)
-        possible_value = subs.get(possible_key)
-        if possible_value is None:
-            return string_in
-        return possible_value
+        return self._engine('peername').substitute(string_in)
 
-    def validate(self, config_in, verbose=False):
+    def validate(self, config_in, verbose=False, cache_dir=None, base_dir=None):
         '''
             Given an administrative config structure,
             validate that it is in good enough shape for us to run against.
             Inputs: None or dict
+                    cache_dir: None, or where to keep the indexes of files of substitutions
+                    base_dir: None, or the directory of the file this section is from,
+                              which relative file names of substitutions are taken from
             Returns: True
         '''
         if verbose:
@@ -197,6 +246,7 @@ class AdministrativeSectionValidator:
             raise ValueError(f'{self.section} contains unexpected fields {disallowed_sections}')
 
         config_out = {}
+        self.base_dir = base_dir
 
         for funcname_str, section_name in self.validating_functions.items():
             try:
@@ -205,7 +255,11 @@ class AdministrativeSectionValidator:
                 raise ValueError from exc_getattr
             config_out[section_name] = call_func(config_in.get(section_name))
 
+        self.cache_dir = cache_dir
         self.inputs = config_out
+        # Files of substitutions are indexed now, once, rather than by whoever
+        # looks a name up first.
+        self._engine('DN')
         return True
 
     def render(self, verbose=False):
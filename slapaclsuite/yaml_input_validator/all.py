@@ -11,9 +11,13 @@ from .scripting import ScriptingSectionValidator
 from .tests import TestsSectionValidator
 
 
-def validate_input(config_in, verbose=False):
+def validate_input(config_in, verbose=False, jobs=1, cache_dir=None, base_dir=None):
     '''
         Given a config structure, validate that it is in good enough shape for us to run against.
+        jobs: how many processes a large tests section may be validated in
+        cache_dir: None, or where to keep the indexes of files of substitutions
+        base_dir: None, or the directory of the file the config is from; relative file
+                  names of substitutions are taken from it (otherwise, from the current one)
     '''
 
     if not isinstance(config_in, dict):
@@ -30,8 +34,12 @@ def validate_input(config_in, verbose=False):
     try:
         for section_name, validator in validators.items():
             validation_kwargs = {'verbose': verbose}
+            if section_name == 'administrative':
+                validation_kwargs['cache_dir'] = cache_dir
+                validation_kwargs['base_dir'] = base_dir
             if section_name == 'tests':
                 validation_kwargs['admin_object'] = config_out['administrative']
+                validation_kwargs['jobs'] = jobs
             if validator.validate(config_in.get(section_name), **validation_kwargs):
                 config_out[section_name] = validator
             else:
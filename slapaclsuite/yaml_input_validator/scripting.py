@@ -3,7 +3,6 @@
     the validator of the scripting section of the YAML input structure.
 
 '''
-import sys
 import re
 
 
@@ -11,11 +10,6 @@ class ScriptingSectionValidator:
     ''' class that validates the 'scripting' section of the YAML config '''
     section = 'scripting'
 
-    def _field_name(self):
-        ''' What field does the calling function seek to validate? '''
-        calling_func_str = sys._getframe(1).f_code.co_name  # pylint: disable=protected-access
-        return self.validating_functions[calling_func_str]
-
     def _validate_executable(self, value_in, verbose=False):
         '''
             Validate the executable string
@@ -23,7 +17,7 @@ class ScriptingSectionValidator:
             Prints a complaint if None
             Returns: String+
         '''
-        my_field = self._field_name()
+        my_field = 'executable'
         where_am_i = f'{self.section} / {my_field}'
         if verbose:
             print(f'## Preflighting {where_am_i}.')
@@ -43,7 +37,7 @@ class ScriptingSectionValidator:
             Inputs: None or [String+]*
             Returns: [String+]*
         '''
-        my_field = self._field_name()
+        my_field = 'path'
         where_am_i = f'{self.section} / {my_field}'
         if verbose:
             print(f'## Preflighting {where_am_i}.')
@@ -64,7 +58,7 @@ class ScriptingSectionValidator:
             Inputs: None or [String+]*
             Returns: [String+]*
         '''
-        my_field = self._field_name()
+        my_field = 'default_arguments'
         where_am_i = f'{self.section} / {my_field}'
         if verbose:
             print(f'## Preflighting {where_am_i}.')
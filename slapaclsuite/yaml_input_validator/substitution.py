@@ -0,0 +1,82 @@
+'''
+
+    the substitutions of the administrative section, compiled for lookups.
+
+    A substitution key is one or more prefixes ('SUB:', 'PERSON:' ...).  A
+    string that starts with one of them, followed by a name in the table,
+    is replaced by that name's value.  The prefixes are kept in a trie, so
+    finding the ones a string starts with costs the length of the longest
+    prefix, however many there are; the name is then one dict lookup.
+    Suites repeat the same few strings many times over, so every answer is
+    remembered.
+
+'''
+
+# A trie node's entry for "a prefix ends here"; no character is None.
+_END = None
+
+# Answers remembered before the memo is started afresh.
+MEMO_LIMIT = 100000
+
+
+class SubstitutionEngine:
+    ''' One kind of substitution (DN or peername): its prefixes and its table. '''
+
+    def __init__(self, prefixes, table):
+        '''
+            Inputs: None, String+ or [String+]+   the substitution key(s)
+                    None or dict(String+: String+)   the substitutions
+        '''
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        self.table = table or {}
+        self.trie = {}
+        if self.table:
+            for prefix in prefixes or []:
+                node = self.trie
+                for character in prefix:
+                    node = node.setdefault(character, {})
+                node[_END] = len(prefix)
+        self._memo = {}
+
+    def __getstate__(self):
+        ''' The memo is not worth pickling. '''
+        state = self.__dict__.copy()
+        state['_memo'] = {}
+        return state
+
+    def substitute(self, string_in):
+        '''
+            Inputs: String
+            Returns: String   the substitution for string_in, or string_in if there is none
+        '''
+        try:
+            return self._memo[string_in]
+        except KeyError:
+            pass
+        string_out = self._resolve(string_in)
+        if len(self._memo) >= MEMO_LIMIT:
+            self._memo = {}
+        self._memo[string_in] = string_out
+        return string_out
+
+    def _resolve(self, string_in):
+        '''
+            The lookup itself.  Where prefixes overlap ('A:' and 'A:B:'),
+            the longest one whose name is in the table wins.
+        '''
+        if not self.trie:
+            return string_in
+        lengths = []
+        node = self.trie
+        for character in string_in:
+            node = node.get(character)
+            if node is None:
+                break
+            if _END in node:
+                lengths.append(node[_END])
+        for length in reversed(lengths):
+            string_out = self.table.get(string_in[length:])
+            if string_out is not None:
+                return string_out
+        return string_in
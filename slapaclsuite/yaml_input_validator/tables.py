@@ -0,0 +1,245 @@
+'''
+
+    Substitution tables kept in files of their own.
+
+    DN_substitutions and peername_substitutions may name a file instead of
+    listing the substitutions inline:
+
+    * a .csv file of `name,value` rows (blank rows, and rows whose first
+      cell starts with #, are skipped)
+    * an .ldif file of entries, each named by the value of its first RDN;
+      the value is the entry's DN for DN_substitutions, or its ipHostNumber
+      for peername_substitutions
+
+    The first time a file is seen it is read into an index, a hash table
+    on disk kept in the cache directory under the hash of the file, so a
+    changed file gets a new index and an unchanged one is never read again.
+    The index is memory-mapped, and only when the first name is looked up,
+    so a lookup only reads the pages it lands on.  With no cache directory
+    (--no-cache) the table is read whole and kept in memory instead.
+
+    Index layout, all integers little-endian:
+        header   MAGIC, number of names, number of slots (a power of two)
+        slots    one 8-byte offset per slot, 0 for an empty slot
+        records  4-byte name length, 4-byte value length, name, value (UTF-8)
+    A name goes in the slot its hash picks, or the next free one after it.
+
+'''
+import csv
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from ..cache import fingerprint_path
+from ..dn import split_unescaped
+from ..native.config import read_ldif
+
+MAGIC = b'SLTABLE1'
+_HEADER = struct.Struct('<8sQQ')
+_SLOT = struct.Struct('<Q')
+_RECORD = struct.Struct('<II')
+
+# What a file may be, by its extension.
+FORMATS = {'.csv': 'csv', '.ldif': 'ldif'}
+
+
+def _hash(name):
+    ''' The same in every process, unlike hash(). '''
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), 'little')
+
+
+def table_format(filename):
+    '''
+        Inputs: String+   a table file
+        Returns: String+   'csv' or 'ldif'
+        Raises: ValueError if it is neither
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f'"{filename}" must be a {" or ".join(sorted(FORMATS))} file.')
+    return FORMATS[extension]
+
+
+def read_table(filename, kind):
+    '''
+        Read a table file whole.
+        Inputs: String+   a .csv or .ldif file
+                String+   'DN' or 'peername': which values an LDIF file gives
+        Returns: dict(String+: String+)
+        Raises: ValueError if it is not a table, OSError if it can not be read
+    '''
+    table = {}
+
+    def add(name, value, where):
+        ''' one name, checked as inline substitutions are '''
+        if not name or not value:
+            raise ValueError(f'{filename}: {where}: names and values must be nonempty.')
+        if table.get(name, value) != value:
+            raise ValueError(f'{filename}: {where}: "{name}" is defined twice.')
+        table[name] = value
+
+    if table_format(filename) == 'csv':
+        with open(filename, newline='', encoding='utf-8') as input_fh:
+            for (line_number, row) in enumerate(csv.reader(input_fh), 1):
+                if not row or not ''.join(row).strip() or row[0].startswith('#'):
+                    continue
+                if len(row) != 2:
+                    raise ValueError(f'{filename}: line {line_number}: '
+                                     f'expected "name,value", found {len(row)} fields.')
+                add(row[0].strip(), row[1].strip(), f'line {line_number}')
+        return table
+
+    for entry in read_ldif(filename):
+        if 'dn' not in entry:
+            raise ValueError(f'{filename}: an entry has no dn.')
+        dn = entry['dn'][0]
+        (_, _, name) = split_unescaped(dn, ',')[0].partition('=')
+        if kind == 'DN':
+            value = dn
+        elif 'iphostnumber' in entry:
+            value = entry['iphostnumber'][0]
+        else:
+            raise ValueError(f'{filename}: "{dn}" has no ipHostNumber.')
+        add(name.strip(), value.strip(), f'"{dn}"')
+    return table
+
+
+def write_index(table, filename):
+    '''
+        Write `table` as an index file (see the module docstring), atomically.
+        Inputs: dict(String+: String+)
+                String+   the index file
+    '''
+    slots = 8
+    while slots < 2 * len(table):
+        slots *= 2
+    offsets = [0] * slots
+    records = []
+    position = _HEADER.size + slots * _SLOT.size
+    for (name, value) in table.items():
+        name = name.encode('utf-8')
+        value = value.encode('utf-8')
+        slot = _hash(name) & (slots - 1)
+        while offsets[slot]:
+            slot = (slot + 1) & (slots - 1)
+        offsets[slot] = position
+        records.append(_RECORD.pack(len(name), len(value)) + name + value)
+        position += len(records[-1])
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    (handle, temp_name) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output_fh:
+            output_fh.write(_HEADER.pack(MAGIC, len(table), slots))
+            output_fh.write(struct.pack(f'<{slots}Q', *offsets))
+            output_fh.writelines(records)
+        os.replace(temp_name, filename)
+    except OSError:
+        os.unlink(temp_name)
+        raise
+
+
+class MappedTable:
+    '''
+        A substitution table file, looked up through its index.
+        Behaves enough like a dict for SubstitutionEngine: get() and len().
+
+        source:  String+   the table file
+        digest:  String+   the hash of the table file the index was built from
+    '''
+
+    def __init__(self, source, kind, digest, index_file, length, table=None):
+        '''
+            Use load_table rather than this.
+            table: the whole table, when there is no index file to map
+        '''
+        self.source = source
+        self.kind = kind
+        self.digest = digest
+        self.index_file = index_file
+        self.length = length
+        self._table = table
+        self._map = None
+        self._slots = 0
+
+    def __getstate__(self):
+        ''' An mmap can not be pickled: it is opened again where it is needed. '''
+        state = self.__dict__.copy()
+        state['_map'] = None
+        return state
+
+    def __len__(self):
+        return self.length
+
+    def _open(self):
+        ''' Map the index in, the first time a name is looked up. '''
+        with open(self.index_file, 'rb') as index_fh:
+            self._map = mmap.mmap(index_fh.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, _, self._slots) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.index_file}: not a substitution index.')
+
+    def get(self, name, default=None):
+        '''
+            Inputs: String   a name
+            Returns: String+   its value, or `default`
+        '''
+        if self._table is not None:
+            return self._table.get(name, default)
+        if self._map is None:
+            self._open()
+        name = name.encode('utf-8')
+        mask = self._slots - 1
+        slot = _hash(name) & mask
+        while True:
+            (offset,) = _SLOT.unpack_from(self._map, _HEADER.size + slot * _SLOT.size)
+            if not offset:
+                return default
+            (name_length, value_length) = _RECORD.unpack_from(self._map, offset)
+            start = offset + _RECORD.size
+            if self._map[start:start + name_length] == name:
+                start += name_length
+                return self._map[start:start + value_length].decode('utf-8')
+            slot = (slot + 1) & mask
+
+    def changed(self):
+        '''
+            Returns: Bool   has the table file changed since the index was built?
+        '''
+        return fingerprint_path(self.source) != self.digest
+
+
+def load_table(filename, kind, cache_dir=None):
+    '''
+        Inputs: String+   a .csv or .ldif table file
+                String+   'DN' or 'peername'
+                None to keep the table in memory only, or String+: the cache
+                directory (indexes go in a subdirectory)
+        Returns: MappedTable
+        Raises: ValueError if it is not a table, OSError if it can not be read
+
+        If the index can not be written, the table is kept in memory instead.
+    '''
+    source = os.path.abspath(os.path.expanduser(filename))
+    table_format(source)
+    if not os.path.isfile(source):
+        raise ValueError(f'"{filename}" is not a file.')
+    digest = fingerprint_path(source)
+    if cache_dir is None:
+        table = read_table(source, kind)
+        return MappedTable(source, kind, digest, None, len(table), table=table)
+    index_file = os.path.join(cache_dir, 'tables', f'{digest}-{kind}.index')
+    try:
+        with open(index_file, 'rb') as index_fh:
+            (magic, length, _) = _HEADER.unpack(index_fh.read(_HEADER.size))
+        if magic == MAGIC:
+            return MappedTable(source, kind, digest, index_file, length)
+    except (OSError, struct.error):
+        pass
+    table = read_table(source, kind)
+    try:
+        write_index(table, index_file)
+    except OSError:
+        return MappedTable(source, kind, digest, None, len(table), table=table)
+    return MappedTable(source, kind, digest, index_file, len(table))
@@ -3,28 +3,55 @@
     the validator of a test section of the YAML input structure.
 
 '''
-import sys
+import hashlib
+import json
+
+# Shared, so that content_hash does not build an encoder for every test.
+_HASH_ENCODER = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+
+def _substitute_dns(items, as_list, admin_object):
+    '''
+        Apply DN substitutions to requestDN or authcDN items.  A substitution
+        may name a group of DNs, which stands in for all of them.
+        Inputs: [None or String+]+
+                Bool   was the field a list?
+                None or AdministrativeSectionValidator
+        Returns: the only DN, if the field was one DN and stayed one, or the list of them
+    '''
+    if admin_object is not None:
+        items = [item if item is None else admin_object.possible_dn_substitutions(item)
+                 for item in items]
+    value_out = _flatten(items)
+    if as_list or isinstance(items[0], list):
+        return value_out
+    return value_out[0]
+
+
+def _flatten(items):
+    ''' Substitutions give strings, or lists of them for groups: all in one list. '''
+    value_out = []
+    for item in items:
+        if isinstance(item, list):
+            value_out.extend(item)
+        else:
+            value_out.append(item)
+    return value_out
 
 
 class TestValidator:
     ''' class that validates the test pieces in the 'tests' section of the YAML config '''
     section = 'test'
 
-    def _field_name(self):
-        ''' What field does the calling function seek to validate? '''
-        calling_func_str = sys._getframe(1).f_code.co_name  # pylint: disable=protected-access
-        return self.validating_functions[calling_func_str]
-
     def _validate_expects(self, value_in, verbose=False, **_kwargs):
         '''
             Validate whether the test expects to be allowed or denied by slapacl
             Inputs: String+
             Returns: String+
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'expects'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # Undeterminable if this was an explicit null or a default null from being not
             # specified, but we assume the latter.
@@ -36,50 +63,61 @@ class TestValidator:
 
     def _validate_requestdn(self, value_in, admin_object=None, verbose=False):
         '''
-            Validate the DN of the entry that will be queried by the test.
-            Inputs: String+
-            Returns: String+
+            Validate the DN of the entry that will be queried by the test,
+            or a list of them, to run the test against each.
+            Inputs: String+ or [String+]+
+            Returns: String+ or [String+]+   a list if it was one, or if a
+                                              substitution gave a group of DNs
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'requestDN'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # Undeterminable if this was an explicit null or a default null from being not
             # specified, but we assume the latter.
             raise ValueError(f'"{my_field}" must be present on all tests.')
-        if not isinstance(value_in, str):
-            raise ValueError(f'"{my_field}" must be a string.')
-        if not value_in:
-            raise ValueError(f'"{my_field}" can not be an empty string.')
-        if admin_object is not None:
-            value_out = admin_object.possible_dn_substitutions(value_in)
+        if isinstance(value_in, list):
+            if not value_in:
+                raise ValueError(f'"{my_field}" in a test can not be empty.')
+            items = value_in
+        elif isinstance(value_in, str):
+            items = [value_in]
         else:
-            value_out = value_in
-        return value_out
+            raise ValueError(f'"{my_field}" must be a string or list of strings.')
+        for item in items:
+            if not isinstance(item, str):
+                raise ValueError(f'"{my_field}" must be a string or list of strings.')
+            if not item:
+                raise ValueError(f'"{my_field}" can not be an empty string.')
+        return _substitute_dns(items, isinstance(value_in, list), admin_object)
 
     def _validate_authcdn(self, value_in, admin_object=None, verbose=False):
         '''
-            Validate the DN that will do the querying
-            Inputs: None or String+
-            Returns: None or String+
+            Validate the DN that will do the querying, or a list of them,
+            to run the test as each (null in the list is anonymous).
+            Inputs: None or String+ or [None or String+]+
+            Returns: None or String+ or [None or String+]+
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'authcDN'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # 'None' is fine, it symbolizes that the connection is anonymous.
             return None
-        if not isinstance(value_in, str):
-            raise ValueError(f'"{my_field}" must be null or a string.')
-        if not value_in:
-            raise ValueError(f'"{my_field}" can not be an empty string.')
-        if admin_object is not None:
-            value_out = admin_object.possible_dn_substitutions(value_in)
+        if isinstance(value_in, list):
+            if not value_in:
+                raise ValueError(f'"{my_field}" in a test can not be empty.')
+            items = value_in
+        elif isinstance(value_in, str):
+            items = [value_in]
         else:
-            value_out = value_in
-        return value_out
+            raise ValueError(f'"{my_field}" must be null or a string.')
+        for item in items:
+            if item is not None and not isinstance(item, str):
+                raise ValueError(f'"{my_field}" must be null or a string.')
+            if item == '':
+                raise ValueError(f'"{my_field}" can not be an empty string.')
+        return _substitute_dns(items, isinstance(value_in, list), admin_object)
 
     def _validate_requestattr(self, value_in, verbose=False, **_kwargs):
         '''
@@ -87,10 +125,9 @@ class TestValidator:
             Inputs: String+ or [String+]+
             Returns: [String+]+
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'requestattr'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # 'None' is not okay.  In slapacl it symbolizes to use the 'entry' pseudo-attribute
             # However, we require it to be explicit in the yaml.
@@ -119,10 +156,9 @@ class TestValidator:
             Inputs: None or Bool
             Returns: Bool
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'fetchentry'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # 'None' is fine, it symbolizes that the requestDN is accurate
             # We add it to the output to make sure it's explicit, not implicit.
@@ -139,10 +175,9 @@ class TestValidator:
             Inputs: None or Integer
             Returns: None or Integer
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'ssf'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # 'None' is fine, it symbolizes that we are not checking security levels
             value_out = None
@@ -160,10 +195,9 @@ class TestValidator:
             Inputs: None or String+ or [String+]+
             Returns: None or [String+]+
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'peername'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # 'None' is fine, it symbolizes that we don't care what IP is here.
             # We add it to the output to make sure it's explicit, not implicit.
@@ -171,7 +205,7 @@ class TestValidator:
         elif isinstance(value_in, str):
             if value_in:
                 if admin_object is not None:
-                    value_out = [admin_object.possible_peername_substitutions(value_in)]
+                    value_out = _flatten([admin_object.possible_peername_substitutions(value_in)])
                 else:
                     value_out = [value_in]
             else:
@@ -189,6 +223,7 @@ class TestValidator:
                     value_out.append(admin_object.possible_peername_substitutions(item))
                 else:
                     value_out.append(item)
+            value_out = _flatten(value_out)
         else:
             raise ValueError(f'"{my_field}" in a test must be a string or list of strings.')
         return value_out
@@ -199,10 +234,9 @@ class TestValidator:
             Inputs: None or String*
             Returns: String*
         '''
-        my_field = self._field_name()
-        where_am_i = f'{self.section} / {my_field}'
+        my_field = 'description'
         if verbose:
-            print(f'## Preflighting {where_am_i}.')
+            print(f'## Preflighting {self.section} / {my_field}.')
         if value_in is None:
             # Let's cook up a description so there is one.
             value_out = 'undescribed test'
@@ -212,22 +246,42 @@ class TestValidator:
             value_out = value_in
         return value_out
 
+    # The fields a test may have, and the function (above) that validates each.
+    # Looked up once per class, not once per test.
+    validating_functions = {
+        '_validate_expects': 'expects',
+        '_validate_requestdn': 'requestDN',
+        '_validate_authcdn': 'authcDN',
+        '_validate_requestattr': 'requestattr',
+        '_validate_fetchentry': 'fetchentry',
+        '_validate_ssf': 'ssf',
+        '_validate_peername': 'peername',
+        '_validate_description': 'description',
+    }
+    _compiled = (None, None, None)
+
     def __init__(self):
         '''
-            build a dict of functions (above) that will validate pieces of the config
-        '''
-        self.validating_functions = {
-            '_validate_expects': 'expects',
-            '_validate_requestdn': 'requestDN',
-            '_validate_authcdn': 'authcDN',
-            '_validate_requestattr': 'requestattr',
-            '_validate_fetchentry': 'fetchentry',
-            '_validate_ssf': 'ssf',
-            '_validate_peername': 'peername',
-            '_validate_description': 'description',
-        }
+            A validator of one test.  The validating functions are shared by the class.
+        '''
         self.inputs = None
 
+    def _schema(self):
+        '''
+            validating_functions, compiled: the allowed fields, and
+            (function name, field) in order.  Compiled again only if
+            validating_functions has been replaced.
+            Returns: (frozenset, tuple)
+        '''
+        (source, allowed, items) = type(self)._compiled
+        if source is not self.validating_functions:
+            source = self.validating_functions
+            allowed = frozenset(source.values())
+            items = tuple(source.items())
+            if source is type(self).validating_functions:
+                type(self)._compiled = (source, allowed, items)
+        return (allowed, items)
+
     def validate(self, config_in, admin_object=None, verbose=False):
         '''
             Given a test config structure,
@@ -243,15 +297,14 @@ class TestValidator:
         if not isinstance(config_in, dict):
             raise ValueError(f'{self.section} section must be a dict.')
 
-        input_sections = set(config_in.keys())
-        allowable_sections = set(self.validating_functions.values())
-        disallowed_sections = input_sections - allowable_sections
-        if disallowed_sections:
+        (allowable_sections, items) = self._schema()
+        if not allowable_sections.issuperset(config_in):
+            disallowed_sections = set(config_in) - allowable_sections
             raise ValueError(f'{self.section} contains unexpected fields {disallowed_sections}')
 
         config_out = {}
 
-        for funcname_str, section_name in self.validating_functions.items():
+        for funcname_str, section_name in items:
             try:
                 call_func = getattr(self, funcname_str)
             except AttributeError as exc_getattr:
@@ -262,6 +315,56 @@ class TestValidator:
         self.inputs = config_out
         return True
 
+    def content_hash(self):
+        '''
+            A stable fingerprint of this test, taken after validation and substitution,
+            so it changes when (and only when) the checks this test makes change.
+            Inputs: None
+            Returns: String+
+        '''
+        if self.inputs is None:
+            raise RuntimeError(f'Can not hash unvalidated {self.section} instance')
+        return hashlib.sha1(_HASH_ENCODER.encode(self.inputs).encode('utf-8')).hexdigest()
+
+    def check_count(self):
+        '''
+            How many checks this test turns into: one per authcDN/requestDN/peername/
+            requestattr combination.
+            Inputs: None
+            Returns: Integer
+        '''
+        return self.command_count(batch=False)
+
+    def command_count(self, batch=False):
+        '''
+            How many slapacl calls this test turns into, without rendering it.
+            Inputs: Bool     are requestattrs batched into one call per peername?
+            Returns: Integer
+        '''
+        (authcdns, requestdns, peernames, requestattrs) = self.sizes()
+        if batch:
+            return authcdns * requestdns * peernames
+        return authcdns * requestdns * peernames * requestattrs
+
+    def sizes(self):
+        '''
+            How many values each dimension of this test has, without rendering it.
+            A single (or no) authcDN, requestDN or peername counts as one.
+            Inputs: None
+            Returns: (Integer+)   authcDNs, requestDNs, peernames, requestattrs
+        '''
+        if self.inputs is None:
+            raise RuntimeError(f'Can not count unvalidated {self.section} instance')
+        counts = []
+        # A list of authcDNs or requestDNs runs every combination of them.
+        for field in ['authcDN', 'requestDN', 'peername']:
+            if isinstance(self.inputs[field], list):
+                counts.append(len(self.inputs[field]))
+            else:
+                counts.append(1)
+        counts.append(len(self.inputs['requestattr']))
+        return tuple(counts)
+
     def render(self, verbose=False):
         '''
             Returns a structure useable by the methods that will build the runtime commands.
@@ -279,11 +382,18 @@ class TestValidator:
 
         config_out['description'] = self.inputs['description']
         config_out['expects'] = self.inputs['expects']
-        config_out['requestDN'] = ['-b', self.inputs['requestDN']]
-        if self.inputs['authcDN'] is None:
-            config_out['authcDN'] = []
+        # A single DN gets no label, so its tests are described as they always were.
+        if isinstance(self.inputs['requestDN'], list):
+            config_out['requestDN'] = [(f'on {x}', ['-b', x]) for x in self.inputs['requestDN']]
+        else:
+            config_out['requestDN'] = [('', ['-b', self.inputs['requestDN']])]
+        if isinstance(self.inputs['authcDN'], list):
+            config_out['authcDN'] = [('by anonymous', []) if x is None else (f'by {x}', ['-D', x])
+                                     for x in self.inputs['authcDN']]
+        elif self.inputs['authcDN'] is None:
+            config_out['authcDN'] = [('', [])]
         else:
-            config_out['authcDN'] = ['-D', self.inputs['authcDN']]
+            config_out['authcDN'] = [('', ['-D', self.inputs['authcDN']])]
         config_out['requestattr'] = [(x, [x]) for x in self.inputs['requestattr']]
         if self.inputs['fetchentry']:
             config_out['fetchentry'] = []
@@ -5,9 +5,60 @@
     Note that we are also 'odd' in that our .inputs is a list of instance objects
     instead of dict
 
+    Large sections can be validated in a pool of processes, in chunks,
+    when asked to (jobs > 1).  Each test is validated on its own, against
+    an administrative section that is only read, so this gives the same
+    result as one at a time: the same tests in the same order, or the
+    error of the first bad test.  Sending the chunks to the workers and
+    their results back costs about as much as validating them, so it
+    only pays with many tests and several cores to spare; serial is the
+    default.
+
 '''
+import concurrent.futures
 from .test import TestValidator
 
+# Tests per chunk handed to a worker, and fewer tests than this are not
+# worth starting a pool for.
+CHUNK_SIZE = 2000
+PARALLEL_MINIMUM = 2 * CHUNK_SIZE
+
+# Set once in each worker: the administrative section tests are validated against.
+_WORKER_ADMIN = None
+
+
+def _init_worker(admin_object):
+    ''' Worker: keep the administrative section, so chunks need not carry it. '''
+    global _WORKER_ADMIN  # pylint: disable=global-statement
+    _WORKER_ADMIN = admin_object
+
+
+def _validate_chunk(start, tests_in):
+    '''
+        Worker: validate tests_in[0:], which start at index `start` of the section.
+        Returns: (None, [validated inputs]) or (index of the first bad test, ValueError)
+                 Plain dicts are sent back: they pickle far faster than TestValidators.
+    '''
+    config_out = []
+    for (offset, test_in) in enumerate(tests_in):
+        try:
+            config_out.append(_validate_one(test_in, _WORKER_ADMIN, False).inputs)
+        except ValueError as validation_err:
+            return (start + offset, validation_err)
+    return (None, config_out)
+
+
+def _validate_one(test_in, admin_object, verbose):
+    '''
+        Validate one entry of the tests section.
+        Returns: TestValidator
+    '''
+    if not isinstance(test_in, dict):
+        raise ValueError(f'Test {test_in} is not a k/v test.  Check example.yaml')
+    tester = TestValidator()
+    tester.validate(test_in, admin_object=admin_object, verbose=verbose)
+    return tester
+
 
 class TestsSectionValidator:
     ''' class that validates the 'tests' section of the YAML config '''
@@ -19,11 +70,12 @@ class TestsSectionValidator:
         '''
         self.inputs = None
 
-    def validate(self, config_in, admin_object=None, verbose=False):
+    def validate(self, config_in, admin_object=None, verbose=False, jobs=1):
         '''
             Given a tests config structure,
             validate that it is in good enough shape for us to run against.
             Inputs: None or [dict]*
+                    jobs: how many processes to validate a large section in
             Prints a complaint if None or []
             Returns: True
         '''
@@ -37,20 +89,43 @@ class TestsSectionValidator:
         if not isinstance(config_in, list):
             raise ValueError(f'{self.section} section must be a list.')
 
-        config_out = []
-
-        for test_in in config_in:
-
-            if not isinstance(test_in, dict):
-                raise ValueError(f'Test {test_in} is not a k/v test.  Check example.yaml')
-
-            tester = TestValidator()
-            tester.validate(test_in, admin_object=admin_object, verbose=verbose)
-            config_out.append(tester)
+        # Verbose output stays in order by staying in this process.
+        if jobs > 1 and not verbose and len(config_in) >= PARALLEL_MINIMUM:
+            config_out = self._validate_parallel(config_in, admin_object, jobs)
+        else:
+            config_out = [_validate_one(test_in, admin_object, verbose)
+                          for test_in in config_in]
 
         self.inputs = config_out
         return True
 
+    @staticmethod
+    def _validate_parallel(config_in, admin_object, jobs):
+        '''
+            Validate config_in in chunks, in a pool of `jobs` processes.
+            Returns: [TestValidator]   in the order of config_in
+            Raises: ValueError of the first bad test, as validating in order would
+        '''
+        starts = range(0, len(config_in), CHUNK_SIZE)
+        config_out = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                                    initargs=(admin_object,)) as executor:
+            futures = [executor.submit(_validate_chunk, x, config_in[x:x + CHUNK_SIZE])
+                       for x in starts]
+            # Results are taken in order, so the first error seen is the first one in
+            # the section.  The chunks after it need not be validated.
+            for future in futures:
+                (bad_index, result) = future.result()
+                if bad_index is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    raise result
+                for inputs in result:
+                    tester = TestValidator()
+                    tester.inputs = inputs
+                    config_out.append(tester)
+        return config_out
+
     def render(self, verbose=False):
         '''
             Returns a structure useable by the methods that will build the runtime commands.
@@ -70,3 +145,19 @@ class TestsSectionValidator:
             config_out.append(test_in.render(verbose=verbose))
 
         return config_out
+
+    def iter_render(self, verbose=False):
+        '''
+            Like render, but hands back each test's structure as it is rendered,
+            rather than building the whole list first.
+            Inputs: None
+            Yields: dict
+        '''
+        if verbose:
+            print(f'# Rendering {self.section}.')
+
+        if self.inputs is None:
+            raise RuntimeError(f'Can not render unvalidated {self.section} instance')
+
+        for test_in in self.inputs:
+            yield test_in.render(verbose=verbose)
@@ -6,6 +6,7 @@ import unittest
 import yaml
 import mock
 import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite import readfile
 from slapaclsuite.readfile import ingest_yaml_file
 
 
@@ -40,3 +41,16 @@ class TestIngestYamlFile(unittest.TestCase):
         with mock.patch('builtins.open', mock.mock_open(read_data=read_data)):
             retval = ingest_yaml_file('/does_not_matter')
         self.assertEqual(retval, {'alist': [1, 2], 'astring': '123'})
+
+    def test_30_loader(self):
+        ''' The libyaml loader is used when it is there, and the answers are the same without '''
+        if yaml.__with_libyaml__:
+            self.assertIs(readfile._LOADER, yaml.CSafeLoader)
+        read_data = '---\nalist:\n  - 1\n  - 2\nastring: "123"\n'
+        with mock.patch('builtins.open', mock.mock_open(read_data=read_data)), \
+                mock.patch.object(readfile, '_LOADER', yaml.SafeLoader):
+            retval = ingest_yaml_file('/does_not_matter')
+        self.assertEqual(retval, {'alist': [1, 2], 'astring': '123'})
+        with mock.patch('builtins.open', mock.mock_open(read_data='!!python/object:os.system')), \
+                self.assertRaises(yaml.YAMLError):
+            ingest_yaml_file('/does_not_matter')
@@ -0,0 +1,148 @@
+'''
+    Test suites spread over several files
+'''
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite import suite as suite_module
+from slapaclsuite.suite import load_suite, suite_files
+
+MAIN = '''
+administrative:
+  DN_substitutions_key: 'SUB:'
+  DN_substitutions:
+    someone: 'uid=someone,dc=example'
+scripting:
+  default_arguments: ['-F', '/etc/openldap/slapd.d']
+include:
+  - teams
+tests:
+  - description: main
+    requestDN: 'dc=example'
+    requestattr: 'dc/read'
+    expects: ALLOWED
+'''
+
+TEAM = '''
+tests:
+  - description: {name}
+    authcDN: 'SUB:someone'
+    requestDN: 'ou={name},dc=example'
+    requestattr: 'ou/read'
+    expects: DENIED
+'''
+
+
+class TestLoadSuite(unittest.TestCase):
+    ''' Class of tests about suites made of several files. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.workdir, 'cache')
+        self.main = self._write('main.yaml', MAIN)
+        for name in ['b', 'a']:
+            self._write(os.path.join('teams', f'{name}.yaml'), TEAM.format(name=name))
+        self._write(os.path.join('teams', 'notes.txt'), 'not a suite file')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _write(self, name, contents):
+        ''' write a file of the suite '''
+        filename = os.path.join(self.workdir, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as suite_fh:
+            suite_fh.write(textwrap.dedent(contents))
+        return filename
+
+    def _load(self, paths, **kwargs):
+        ''' load_suite, quietly; returns the test descriptions and requestDNs '''
+        with mock.patch('sys.stdout', new=StringIO()):
+            config = load_suite(paths, **kwargs)
+        return [(x.inputs['description'], x.inputs['authcDN']) for x in config['tests'].inputs]
+
+    def test_suite_files(self):
+        ''' directories give their YAML files, sorted '''
+        teams = os.path.join(self.workdir, 'teams')
+        self.assertEqual(suite_files([teams, self.main]),
+                         [os.path.join(teams, 'a.yaml'), os.path.join(teams, 'b.yaml'),
+                          self.main])
+        self.assertEqual(suite_files(['a.yaml'], relative_to='/x'), ['/x/a.yaml'])
+
+    def test_include(self):
+        ''' included files share the administrative section, and come after the includer '''
+        expected = [('main', None), ('a', 'uid=someone,dc=example'),
+                    ('b', 'uid=someone,dc=example')]
+        self.assertEqual(self._load([self.main]), expected)
+        # Naming a file twice, or in a loop of includes, reads it once.
+        self._write(os.path.join('teams', 'a.yaml'), TEAM.format(name='a') +
+                    'include: [../main.yaml]\n')
+        self.assertEqual(self._load([self.main, os.path.join(self.workdir, 'teams')]),
+                         expected)
+
+    def test_relative_tables(self):
+        ''' a file of substitutions is found next to the file that names it '''
+        self._write(os.path.join('suite', 'people.csv'), 'someone,"uid=someone,dc=example"\n')
+        main = self._write(os.path.join('suite', 'main.yaml'),
+                           MAIN.replace("\n    someone: 'uid=someone,dc=example'",
+                                        ' people.csv').replace('- teams', '- ../teams'))
+        self.assertEqual(self._load([main]), [('main', None), ('a', 'uid=someone,dc=example'),
+                                              ('b', 'uid=someone,dc=example')])
+
+    def test_process_pool(self):
+        ''' files read in a pool of processes come back in the same order '''
+        self.assertEqual(self._load([self.main], jobs=3),
+                         self._load([self.main], jobs=1))
+
+    def test_conflicts(self):
+        ''' two different administrative sections, or bad files, stop everything '''
+        self._write(os.path.join('teams', 'a.yaml'), 'administrative:\n  name: other\n')
+        with self.assertRaises(ValueError) as raised:
+            self._load([self.main])
+        self.assertIn('administrative is defined differently', str(raised.exception))
+
+        self._write(os.path.join('teams', 'a.yaml'), 'tests:\n  - requestDN: 7\n')
+        with self.assertRaises(ValueError) as raised:
+            self._load([self.main])
+        self.assertIn('a.yaml: ', str(raised.exception))
+
+        self._write(os.path.join('teams', 'a.yaml'), 'testz: []\n')
+        with self.assertRaises(ValueError) as raised:
+            self._load([self.main])
+        self.assertIn('unexpected sections', str(raised.exception))
+
+        with self.assertRaises(IOError):
+            self._load([os.path.join(self.workdir, 'nonesuch.yaml')])
+
+    def test_cache(self):
+        ''' only files that changed are read again '''
+        first = self._load([self.main], cache_dir=self.cache_dir)
+        with mock.patch.object(suite_module, '_read',
+                               side_effect=suite_module._read) as mock_read:
+            self.assertEqual(self._load([self.main], cache_dir=self.cache_dir), first)
+            mock_read.assert_not_called()
+
+            self._write(os.path.join('teams', 'b.yaml'), TEAM.format(name='c'))
+            self.assertEqual(self._load([self.main], cache_dir=self.cache_dir)[2][0], 'c')
+            self.assertEqual([x[0][0] for x in mock_read.call_args_list],
+                             [os.path.join(self.workdir, 'teams', 'b.yaml')])
+
+            # A new administrative section re-reads every file with tests that use it.
+            mock_read.reset_mock()
+            self._write('main.yaml', MAIN.replace('uid=someone', 'uid=other'))
+            self.assertEqual(self._load([self.main], cache_dir=self.cache_dir)[1],
+                             ('a', 'uid=other,dc=example'))
+            self.assertEqual(mock_read.call_count, 3)
+
+            mock_read.reset_mock()
+            self._load([self.main], cache_dir=self.cache_dir, refresh=True)
+            self.assertEqual(mock_read.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
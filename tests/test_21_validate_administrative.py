@@ -75,6 +75,15 @@ class SubKeyMixIn:
         with self.assertRaises(ValueError):
             self.testfunc(inputs)
 
+    def test_list(self):
+        '''
+            Several prefixes may share one table: a list of nonempty strings.
+        '''
+        self.assertEqual(self.testfunc(['SUB:', 'OLD:']), ['SUB:', 'OLD:'])
+        for inputs in ([], ['SUB:', ''], ['SUB:', 1]):
+            with self.assertRaises(ValueError):
+                self.testfunc(inputs)
+
     def test_nullstring(self):
         '''
             An empty string is not allowed as it would always match, and cause pain.
@@ -165,6 +174,15 @@ class SubsMixIn:
         with self.assertRaises(ValueError):
             self.testfunc(inputs)
 
+    def test_dict_group(self):
+        '''
+            A value may be a group: a nonempty list of nonempty strings.
+        '''
+        self.assertEqual(self.testfunc({'a': ['b', 'c']}), {'a': ['b', 'c']})
+        for inputs in ({'a': []}, {'a': ['b', '']}, {'a': ['b', 1]}):
+            with self.assertRaises(ValueError):
+                self.testfunc(inputs)
+
     def test_dict_null_key(self):
         '''
             Dicts must be string: string; fail if keys are empty.
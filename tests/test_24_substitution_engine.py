@@ -0,0 +1,90 @@
+'''
+    Test the compiled substitution engine
+'''
+import pickle
+import unittest
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.yaml_input_validator import substitution
+from slapaclsuite.yaml_input_validator.substitution import SubstitutionEngine
+from slapaclsuite.yaml_input_validator.administrative import \
+        AdministrativeSectionValidator
+
+
+class TestSubstitutionEngine(unittest.TestCase):
+    ''' Class of tests about SubstitutionEngine. '''
+
+    def test_one_prefix(self):
+        ''' the old behavior: one prefix, whole names only '''
+        engine = SubstitutionEngine('SUB:', {'a': 'uid=a', 'ab': 'uid=ab'})
+        self.assertEqual(engine.substitute('SUB:a'), 'uid=a')
+        self.assertEqual(engine.substitute('SUB:ab'), 'uid=ab')
+        self.assertEqual(engine.substitute('SUB:abc'), 'SUB:abc')
+        self.assertEqual(engine.substitute('SUB:'), 'SUB:')
+        self.assertEqual(engine.substitute('SU'), 'SU')
+        self.assertEqual(engine.substitute('a'), 'a')
+        self.assertEqual(engine.substitute(''), '')
+
+    def test_nothing_to_do(self):
+        ''' no prefix, or no table, substitutes nothing '''
+        for engine in [SubstitutionEngine(None, {'a': 'b'}), SubstitutionEngine('S:', {}),
+                       SubstitutionEngine('S:', None), SubstitutionEngine([], {'a': 'b'})]:
+            self.assertEqual(engine.substitute('S:a'), 'S:a')
+
+    def test_several_prefixes(self):
+        ''' every prefix reaches the table; the longest one that names something wins '''
+        engine = SubstitutionEngine(['SUB:', 'OLD:', 'S:', 'S:X:'],
+                                    {'a': 'uid=a', 'X:a': 'uid=xa'})
+        self.assertEqual(engine.substitute('SUB:a'), 'uid=a')
+        self.assertEqual(engine.substitute('OLD:a'), 'uid=a')
+        self.assertEqual(engine.substitute('S:X:a'), 'uid=a')
+        self.assertEqual(engine.substitute('S:a'), 'uid=a')
+        engine = SubstitutionEngine(['S:', 'S:X:'], {'X:a': 'uid=xa'})
+        self.assertEqual(engine.substitute('S:X:a'), 'uid=xa')
+
+    def test_many_keys(self):
+        ''' tens of thousands of names and prefixes '''
+        table = {f'user{x}': f'uid=user{x},dc=example' for x in range(50000)}
+        engine = SubstitutionEngine([f'P{x}:' for x in range(1000)], table)
+        self.assertEqual(engine.substitute('P999:user49999'), 'uid=user49999,dc=example')
+        self.assertEqual(engine.substitute('P1000:user1'), 'P1000:user1')
+
+    def test_memo(self):
+        ''' answers are remembered, up to a limit, and not pickled '''
+        engine = SubstitutionEngine('S:', {'a': 'b'})
+        with mock.patch.object(engine, '_resolve', wraps=engine._resolve) as mock_resolve:
+            engine.substitute('S:a')
+            engine.substitute('S:a')
+        self.assertEqual(mock_resolve.call_count, 1)
+        self.assertEqual(pickle.loads(pickle.dumps(engine)).__dict__['_memo'], {})
+        with mock.patch.object(substitution, 'MEMO_LIMIT', 2):
+            for name in ['S:a', 'S:b', 'S:c']:
+                engine.substitute(name)
+        self.assertEqual(list(engine.__dict__['_memo']), ['S:c'])
+
+
+class TestAdministrativeEngines(unittest.TestCase):
+    ''' Class of tests about how the administrative section uses its engines. '''
+
+    def test_lists_of_keys(self):
+        ''' both kinds take several prefixes '''
+        library = AdministrativeSectionValidator()
+        library.validate({'DN_substitutions_key': ['SUB:', 'PERSON:'],
+                          'DN_substitutions': {'a': 'uid=a'},
+                          'peername_substitutions_key': ['IP:', 'HOST:'],
+                          'peername_substitutions': {'a': '10.0.0.1'}})
+        self.assertEqual(library.possible_dn_substitutions('PERSON:a'), 'uid=a')
+        self.assertEqual(library.possible_dn_substitutions('IP:a'), 'IP:a')
+        self.assertEqual(library.possible_peername_substitutions('HOST:a'), '10.0.0.1')
+
+    def test_recompiled(self):
+        ''' replacing inputs replaces the engines '''
+        library = AdministrativeSectionValidator()
+        library.validate({'DN_substitutions_key': 'SUB:', 'DN_substitutions': {'a': 'uid=a'}})
+        self.assertEqual(library.possible_dn_substitutions('SUB:a'), 'uid=a')
+        library.validate({'DN_substitutions_key': 'SUB:', 'DN_substitutions': {'a': 'uid=b'}})
+        self.assertEqual(library.possible_dn_substitutions('SUB:a'), 'uid=b')
+
+
+if __name__ == '__main__':
+    unittest.main()
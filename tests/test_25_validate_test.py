@@ -129,6 +129,24 @@ class TestTestValidateRequestDN(unittest.TestCase):
         self.assertEqual(result, 'somebody')
         self.assertEqual('', fake_out.getvalue())
 
+    def test_list(self):
+        '''
+            a list of requestDNs, or a substitution naming a group of them, stays a list
+        '''
+        admin_obj = AdministrativeSectionValidator()
+        admin_obj.validate({
+            'DN_substitutions_key': 'SUB:',
+            'DN_substitutions': {'somebody': 'joe', 'staff': ['ann', 'bob']}})
+        self.assertEqual(self.testfunc(['a', 'SUB:somebody'], admin_object=admin_obj),
+                         ['a', 'joe'])
+        self.assertEqual(self.testfunc(['SUB:staff', 'c'], admin_object=admin_obj),
+                         ['ann', 'bob', 'c'])
+        self.assertEqual(self.testfunc('SUB:staff', admin_object=admin_obj), ['ann', 'bob'])
+        self.assertEqual(self.testfunc(['a']), ['a'])
+        for inputs in ([], ['a', ''], ['a', None], ['a', 1]):
+            with self.assertRaises(ValueError):
+                self.testfunc(inputs)
+
 
 class TestTestValidateAuthcDN(unittest.TestCase):
     ''' Check TestValidator _validate_authcdn '''
@@ -172,6 +190,20 @@ class TestTestValidateAuthcDN(unittest.TestCase):
         self.assertEqual(result, inputs)
         self.assertIn('## Preflighting ', fake_out.getvalue())
 
+    def test_list(self):
+        '''
+            a list of authcDNs, where null is anonymous
+        '''
+        admin_obj = AdministrativeSectionValidator()
+        admin_obj.validate({
+            'DN_substitutions_key': 'SUB:',
+            'DN_substitutions': {'staff': ['ann', 'bob']}})
+        self.assertEqual(self.testfunc([None, 'SUB:staff'], admin_object=admin_obj),
+                         [None, 'ann', 'bob'])
+        for inputs in ([], ['a', ''], ['a', 1]):
+            with self.assertRaises(ValueError):
+                self.testfunc(inputs)
+
 
 class TestTestValidateRequestattr(unittest.TestCase):
     ''' Check TestValidator _validate_requestattr '''
@@ -662,6 +694,19 @@ class TestValidateTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.testfunc(inputs)
 
+    def test_schema_shared(self):
+        ''' the fields are worked out once for the class, not per test '''
+        other = TestValidator()
+        self.assertIs(self.library.validating_functions, other.validating_functions)
+        self.assertNotIn('validating_functions', vars(other))
+        inputs = {'expects': 'ALLOWED', 'requestDN': 'a', 'requestattr': 'b'}
+        self.library.validate(dict(inputs))
+        self.assertIs(self.library._schema()[1], other._schema()[1])
+        other.validating_functions = {'_validate_expects': 'expects'}
+        with self.assertRaises(ValueError):
+            other.validate(dict(inputs))
+        self.assertTrue(TestValidator().validate(dict(inputs)))
+
 
 class TestRenderTest(unittest.TestCase):
     ''' Check TestValidator render '''
@@ -687,8 +732,8 @@ class TestRenderTest(unittest.TestCase):
                   'ssf': None,
                   'description': 'something'}
         outputs = {'expects': 'ALLOWED',
-                   'requestDN': ['-b', 'bar'],
-                   'authcDN': ['-D', 'baz'],
+                   'requestDN': [('', ['-b', 'bar'])],
+                   'authcDN': [('', ['-D', 'baz'])],
                    'requestattr': [('someattr', ['someattr'])],
                    'fetchentry': [],
                    'peername': [('any-IP', [])],
@@ -711,8 +756,8 @@ class TestRenderTest(unittest.TestCase):
                   'ssf': 128,
                   'description': 'something'}
         outputs = {'expects': 'ALLOWED',
-                   'requestDN': ['-b', 'bar'],
-                   'authcDN': [],
+                   'requestDN': [('', ['-b', 'bar'])],
+                   'authcDN': [('', [])],
                    'requestattr': [('someattr', ['someattr'])],
                    'fetchentry': ['-u'],
                    'peername': [('someip', ['-o', 'peername=IP=someip'])],
@@ -723,3 +768,44 @@ class TestRenderTest(unittest.TestCase):
             result = self.testfunc(verbose=True)
         self.assertEqual(result, outputs)
         self.assertIn('# Rendering ', fake_out.getvalue())
+
+
+class TestTestContentHash(unittest.TestCase):
+    ''' Check TestValidator content_hash and check_count '''
+
+    def setUp(self):
+        ''' a test definition with a substitution in it '''
+        self.admin = AdministrativeSectionValidator()
+        self.admin.validate({'DN_substitutions_key': 'SUB:',
+                             'DN_substitutions': {'foo': 'uid=foo,dc=example'}})
+        self.inputs = {'expects': 'ALLOWED',
+                       'requestDN': 'SUB:foo',
+                       'requestattr': ['a/read', 'b/read'],
+                       'peername': ['1.2.3.4', '5.6.7.8', '9.9.9.9']}
+
+    def test_unvalidated(self):
+        ''' We can not hash or count before validating '''
+        library = TestValidator()
+        with self.assertRaises(RuntimeError):
+            library.content_hash()
+        with self.assertRaises(RuntimeError):
+            library.check_count()
+
+    def test_hash_after_substitution(self):
+        ''' The hash is of what will be checked, not how it was spelled '''
+        subbed = TestValidator()
+        subbed.validate(self.inputs, admin_object=self.admin)
+        spelled_out = TestValidator()
+        spelled_out.validate(dict(self.inputs, requestDN='uid=foo,dc=example'))
+        self.assertEqual(subbed.content_hash(), spelled_out.content_hash())
+        changed = TestValidator()
+        changed.validate(dict(self.inputs, expects='DENIED'))
+        self.assertNotEqual(subbed.content_hash(), changed.content_hash())
+
+    def test_check_count(self):
+        ''' One check per peername/requestattr pair '''
+        library = TestValidator()
+        library.validate(self.inputs, admin_object=self.admin)
+        self.assertEqual(library.check_count(), 6)
+        library.validate(dict(self.inputs, peername=None))
+        self.assertEqual(library.check_count(), 2)
@@ -6,8 +6,11 @@ import unittest
 from io import StringIO
 import mock
 import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.yaml_input_validator import tests as tests_module
 from slapaclsuite.yaml_input_validator.tests import \
         TestsSectionValidator
+from slapaclsuite.yaml_input_validator.administrative import \
+        AdministrativeSectionValidator
 from slapaclsuite.yaml_input_validator.test import \
         TestValidator
 
@@ -78,6 +81,61 @@ class TestTestsSectionValidate(unittest.TestCase):
         self.assertIn('# Preflighting ', fake_out.getvalue())
 
 
+class TestTestsSectionParallel(unittest.TestCase):
+    ''' Check TestsSectionValidator validate, over a pool of processes '''
+
+    def setUp(self):
+        ''' a suite of tests over several small chunks, and substitutions to apply '''
+        self.admin = AdministrativeSectionValidator()
+        self.admin.validate({'DN_substitutions_key': 'DN:',
+                             'DN_substitutions': {'boss': 'uid=boss,dc=example'}})
+        self.inputs = [{'description': f'test {x}', 'expects': 'ALLOWED',
+                        'requestDN': 'DN:boss', 'authcDN': f'uid={x},dc=example',
+                        'requestattr': 'cn/read'} for x in range(23)]
+        patchers = [mock.patch.object(tests_module, 'CHUNK_SIZE', 4),
+                    mock.patch.object(tests_module, 'PARALLEL_MINIMUM', 8)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _validate(self, inputs, jobs):
+        ''' the validated tests, rendered, or the error validating them raised '''
+        library = TestsSectionValidator()
+        try:
+            library.validate(inputs, admin_object=self.admin, jobs=jobs)
+        except ValueError as validation_err:
+            return str(validation_err)
+        return library.render()
+
+    def test_same_as_serial(self):
+        ''' the same tests, in the same order, with the substitutions made '''
+        serial = self._validate(self.inputs, jobs=1)
+        self.assertEqual(self._validate(self.inputs, jobs=3), serial)
+        self.assertEqual(serial[0]['requestDN'], [('', ['-b', 'uid=boss,dc=example'])])
+        self.assertEqual(serial[-1]['description'], 'test 22')
+
+    def test_first_error(self):
+        ''' of several bad tests, in several chunks, the first one's error is raised '''
+        self.inputs[6]['ssf'] = -1
+        self.inputs[13] = 'not a test'
+        self.inputs[21]['expects'] = None
+        expected = self._validate(self.inputs, jobs=1)
+        self.assertIn('ssf', expected)
+        self.assertEqual(self._validate(self.inputs, jobs=3), expected)
+        del self.inputs[6]
+        self.assertIn('not a k/v test', self._validate(self.inputs, jobs=3))
+
+    def test_small_or_verbose(self):
+        ''' small sections, and verbose runs, are validated here, in order '''
+        with mock.patch.object(tests_module.concurrent.futures,
+                               'ProcessPoolExecutor') as mock_pool, \
+                mock.patch('sys.stdout', new=StringIO()):
+            TestsSectionValidator().validate(self.inputs[:7], admin_object=self.admin, jobs=3)
+            TestsSectionValidator().validate(self.inputs, admin_object=self.admin, jobs=3,
+                                             verbose=True)
+        mock_pool.assert_not_called()
+
+
 class TestRenderTests(unittest.TestCase):
     ''' Check TestsSectionValidator render '''
 
@@ -0,0 +1,162 @@
+'''
+    Test substitution tables kept in files
+'''
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.yaml_input_validator import tables
+from slapaclsuite.yaml_input_validator.tables import MappedTable, load_table, read_table
+from slapaclsuite.yaml_input_validator.administrative import \
+        AdministrativeSectionValidator
+
+LDIF = '''# people
+dn: uid=jdoe,ou=people,dc=example
+uid: jdoe
+
+dn: cn=adminhost,ou=hosts,dc=example
+ipHostNumber: 10.20.30.40
+
+dn:: Y249b2RkXCwgbmFtZSxvdT1ob3N0cyxkYz1leGFtcGxl
+ipHostNumber: 10.20.30.41
+'''
+
+
+class TestSubstitutionTables(unittest.TestCase):
+    ''' Class of tests about substitution tables in CSV and LDIF files. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.workdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _write(self, name, text):
+        ''' write a table file '''
+        filename = os.path.join(self.workdir, name)
+        with open(filename, 'w') as table_fh:
+            table_fh.write(text)
+        return filename
+
+    def test_csv(self):
+        ''' name,value rows, looked up through the index '''
+        filename = self._write('people.csv', '# name,dn\njdoe,"uid=jdoe,dc=example"\n\n'
+                                             'asmith , uid=asmith \n')
+        table = load_table(filename, 'DN', self.cache_dir)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.get('jdoe'), 'uid=jdoe,dc=example')
+        self.assertEqual(table.get('asmith'), 'uid=asmith')
+        self.assertIsNone(table.get('nobody'))
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'tables')),
+                         [f'{table.digest}-DN.index'])
+
+    def test_many(self):
+        ''' every one of many names is found, whatever slots they collide in '''
+        filename = self._write('many.csv', ''.join(f'u{x},uid=u{x}\n' for x in range(20000)))
+        table = load_table(filename, 'DN', self.cache_dir)
+        for name in range(0, 20000, 7):
+            self.assertEqual(table.get(f'u{name}'), f'uid=u{name}')
+        self.assertIsNone(table.get('u20000'))
+
+    def test_index_reused(self):
+        ''' a file is read once, until it changes '''
+        filename = self._write('people.csv', 'jdoe,uid=jdoe\n')
+        first = load_table(filename, 'DN', self.cache_dir)
+        with mock.patch.object(tables, 'read_table') as mock_read:
+            second = load_table(filename, 'DN', self.cache_dir)
+        mock_read.assert_not_called()
+        self.assertEqual(second.get('jdoe'), 'uid=jdoe')
+        self.assertFalse(first.changed())
+
+        self._write('people.csv', 'jdoe,"uid=jdoe,ou=moved"\n')
+        self.assertTrue(first.changed())
+        third = load_table(filename, 'DN', self.cache_dir)
+        self.assertNotEqual(third.digest, first.digest)
+        self.assertEqual(third.get('jdoe'), 'uid=jdoe,ou=moved')
+
+    def test_ldif(self):
+        ''' entries are named by their first RDN '''
+        filename = self._write('inventory.ldif', LDIF)
+        self.assertEqual(read_table(filename, 'DN'),
+                         {'jdoe': 'uid=jdoe,ou=people,dc=example',
+                          'adminhost': 'cn=adminhost,ou=hosts,dc=example',
+                          'odd\\, name': 'cn=odd\\, name,ou=hosts,dc=example'})
+        with self.assertRaises(ValueError):
+            read_table(filename, 'peername')
+        filename = self._write('hosts.ldif', LDIF.split('\n\n', 1)[1])
+        table = load_table(filename, 'peername', self.cache_dir)
+        self.assertEqual(table.get('adminhost'), '10.20.30.40')
+
+    def test_bad_files(self):
+        ''' what is not a table says where '''
+        for (name, text, message) in [
+                ('a.csv', 'jdoe\n', 'line 1'),
+                ('b.csv', 'jdoe,uid=a\njdoe,uid=b\n', 'defined twice'),
+                ('c.csv', 'jdoe,\n', 'nonempty'),
+                ('d.txt', 'jdoe,uid=a\n', 'must be a .csv or .ldif file'),
+                ('e.ldif', 'uid: jdoe\n', 'no dn')]:
+            with self.assertRaises(ValueError) as raised:
+                load_table(self._write(name, text), 'DN', self.cache_dir)
+            self.assertIn(message, str(raised.exception))
+        with self.assertRaises(ValueError):
+            load_table(os.path.join(self.workdir, 'missing.csv'), 'DN', self.cache_dir)
+
+    def test_no_cache(self):
+        ''' with no cache directory, nothing is written: the table is kept in memory '''
+        filename = self._write('people.csv', 'jdoe,uid=jdoe\n')
+        with mock.patch.object(tables, 'write_index') as mock_write:
+            table = load_table(filename, 'DN', None)
+        mock_write.assert_not_called()
+        self.assertIsNone(table.index_file)
+        self.assertEqual(table.get('jdoe'), 'uid=jdoe')
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_not_writable(self):
+        ''' with nowhere to keep the index, the table is kept in memory '''
+        filename = self._write('people.csv', 'jdoe,uid=jdoe\n')
+        with mock.patch.object(tables, 'write_index', side_effect=OSError):
+            table = load_table(filename, 'DN', self.cache_dir)
+        self.assertIsNone(table.index_file)
+        self.assertEqual(table.get('jdoe'), 'uid=jdoe')
+
+    def test_administrative(self):
+        ''' the administrative section takes file names, and its engines use them '''
+        people = self._write('people.csv', 'jdoe,"uid=jdoe,dc=example"\n')
+        hosts = self._write('hosts.ldif', LDIF.split('\n\n', 1)[1])
+        library = AdministrativeSectionValidator()
+        library.validate({'DN_substitutions_key': 'SUB:', 'DN_substitutions': people,
+                          'peername_substitutions_key': 'IP:',
+                          'peername_substitutions': hosts}, cache_dir=self.cache_dir)
+        self.assertEqual(library.render()['DN_substitutions'], people)
+        self.assertEqual(library.possible_dn_substitutions('SUB:jdoe'), 'uid=jdoe,dc=example')
+        self.assertEqual(library.possible_peername_substitutions('IP:adminhost'),
+                         '10.20.30.40')
+        self.assertEqual(len(library.table_digests()), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, 'tables'))), 2)
+
+        # Pool workers and the suite cache get it pickled: the index is mapped again there.
+        copied = pickle.loads(pickle.dumps(library))
+        self.assertIsInstance(copied._engine('DN').table, MappedTable)
+        self.assertEqual(copied.possible_dn_substitutions('SUB:jdoe'), 'uid=jdoe,dc=example')
+        self.assertFalse(copied.tables_changed())
+        self._write('people.csv', 'jdoe,"uid=jdoe,ou=moved,dc=example"\n')
+        self.assertTrue(copied.tables_changed())
+
+        # A relative file name is taken from the directory of the file naming it.
+        library = AdministrativeSectionValidator()
+        library.validate({'DN_substitutions_key': 'SUB:', 'DN_substitutions': 'people.csv'},
+                         base_dir=self.workdir)
+        self.assertEqual(library.possible_dn_substitutions('SUB:jdoe'),
+                         'uid=jdoe,ou=moved,dc=example')
+
+        for value in [os.path.join(self.workdir, 'missing.csv'), people + '.txt', 123]:
+            with self.assertRaises(ValueError):
+                AdministrativeSectionValidator().validate({'DN_substitutions': value})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,9 +61,11 @@ class TestYAMLValidatorAll(unittest.TestCase):
         self.assertEqual(result, {'administrative': mock_adm,
                                   'scripting': mock_scripting,
                                   'tests': mock_tester})
-        mock_adm.validate.assert_called_once_with(None, verbose=False)
+        mock_adm.validate.assert_called_once_with(None, verbose=False, cache_dir=None,
+                                                  base_dir=None)
         mock_scripting.validate.assert_called_once_with(None, verbose=False)
-        mock_tester.validate.assert_called_once_with(None, admin_object=mock_adm, verbose=False)
+        mock_tester.validate.assert_called_once_with(None, admin_object=mock_adm, verbose=False,
+                                                     jobs=1)
 
     def test_dict(self):
         '''
@@ -89,9 +91,11 @@ class TestYAMLValidatorAll(unittest.TestCase):
         self.assertEqual(result, {'administrative': mock_adm,
                                   'scripting': mock_scripting,
                                   'tests': mock_tester})
-        mock_adm.validate.assert_called_once_with('inad', verbose=True)
+        mock_adm.validate.assert_called_once_with('inad', verbose=True, cache_dir=None,
+                                                  base_dir=None)
         mock_scripting.validate.assert_called_once_with('insc', verbose=True)
-        mock_tester.validate.assert_called_once_with('ints', admin_object=mock_adm, verbose=True)
+        mock_tester.validate.assert_called_once_with('ints', admin_object=mock_adm, verbose=True,
+                                                     jobs=1)
 
     def test_dict_with_false(self):
         '''
@@ -115,9 +119,11 @@ class TestYAMLValidatorAll(unittest.TestCase):
                 mock.patch('sys.stderr', new=StringIO()) as fake_err, \
                 self.assertRaises(SystemExit):
             self.testfunc(inputs, verbose=False)
-        mock_adm.validate.assert_called_once_with('inad', verbose=False)
+        mock_adm.validate.assert_called_once_with('inad', verbose=False, cache_dir=None,
+                                                  base_dir=None)
         mock_scripting.validate.assert_called_once_with('insc', verbose=False)
-        mock_tester.validate.assert_called_once_with('ints', admin_object=mock_adm, verbose=False)
+        mock_tester.validate.assert_called_once_with('ints', admin_object=mock_adm, verbose=False,
+                                                     jobs=1)
         self.assertIn('Unexpected validation return ', fake_err.getvalue())
 
     def test_dict_with_failure(self):
@@ -142,7 +148,9 @@ class TestYAMLValidatorAll(unittest.TestCase):
                 mock.patch('sys.stderr', new=StringIO()) as fake_err, \
                 self.assertRaises(SystemExit):
             self.testfunc(inputs, verbose=False)
-        mock_adm.validate.assert_called_once_with('inad', verbose=False)
+        mock_adm.validate.assert_called_once_with('inad', verbose=False, cache_dir=None,
+                                                  base_dir=None)
         mock_scripting.validate.assert_called_once_with('insc', verbose=False)
-        mock_tester.validate.assert_called_once_with('ints', admin_object=mock_adm, verbose=False)
+        mock_tester.validate.assert_called_once_with('ints', admin_object=mock_adm, verbose=False,
+                                                     jobs=1)
         self.assertIn('oops', fake_err.getvalue())
@@ -0,0 +1,61 @@
+'''
+    Test the CommandEntry plan objects
+'''
+import pickle
+import unittest
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.plan import CommandEntry
+
+
+class TestCommandEntry(unittest.TestCase):
+    ''' Class of tests about the compact command plan entries. '''
+
+    def setUp(self):
+        self.path = ['/usr/local/sbin', '/usr/sbin']
+        self.env = {'PATH': '/usr/local/sbin:/usr/sbin'}
+        self.entry = CommandEntry(('slapacl', '-F', '/etc/openldap/slapd.d'),
+                                  ('-b', 'uid=foo,dc=example'), ('uid/read',),
+                                  self.path, self.env, 'ALLOWED')
+        self.batched = CommandEntry(('slapacl',), ('-b', 'uid=foo,dc=example'),
+                                    ('uid/read', 'cn/read'), self.path, self.env, 'DENIED',
+                                    ['t uid/read', 't cn/read'])
+
+    def test_reads_like_a_dict(self):
+        ''' The entry answers and compares like the hash it replaces '''
+        expected = {'script': ['slapacl', '-F', '/etc/openldap/slapd.d',
+                               '-b', 'uid=foo,dc=example', 'uid/read'],
+                    'path': ['/usr/local/sbin', '/usr/sbin'],
+                    'expects': 'ALLOWED'}
+        self.assertEqual(self.entry, expected)
+        self.assertEqual(expected, self.entry)
+        self.assertEqual(dict(self.entry), expected)
+        self.assertEqual(self.entry['script'], expected['script'])
+        self.assertIsNone(self.entry.get('checks'))
+        self.assertEqual(self.entry.get('checks', ['x']), ['x'])
+        self.assertNotIn('checks', self.entry)
+        with self.assertRaises(KeyError):
+            self.entry['nonsense']  # pylint: disable=pointless-statement
+        self.assertEqual(self.batched['checks'], ['t uid/read', 't cn/read'])
+        self.assertEqual(len(self.batched), 4)
+
+    def test_script_is_fresh(self):
+        ''' Editing a script we were handed does not change the entry '''
+        script = self.entry['script']
+        script.append('junk')
+        self.assertNotIn('junk', self.entry['script'])
+        self.assertEqual(self.entry.printable,
+                         'slapacl -F /etc/openldap/slapd.d -b uid=foo,dc=example uid/read')
+
+    def test_read_only(self):
+        ''' Entries can not be changed after they are made '''
+        with self.assertRaises(AttributeError):
+            self.entry.expects = 'DENIED'
+        with self.assertRaises(AttributeError):
+            del self.entry.expects
+
+    def test_pickle(self):
+        ''' Entries survive a trip through pickle (e.g. to another process) '''
+        copied = pickle.loads(pickle.dumps(self.batched))
+        self.assertEqual(copied, self.batched)
+        self.assertEqual(copied.env, self.env)
+        self.assertIn('CommandEntry(', repr(copied))
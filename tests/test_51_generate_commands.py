@@ -2,10 +2,11 @@
     generate_commands
 '''
 
+import types
 import unittest
 import tests.context  # noqa F401 pylint: disable=unused-import
 from slapaclsuite.yaml_input_validator import validate_input
-from slapaclsuite.commands import generate_commands
+from slapaclsuite.commands import generate_commands, iter_commands, count_commands
 
 
 class TestGenerateCommands(unittest.TestCase):
@@ -141,3 +142,106 @@ class TestGenerateCommands(unittest.TestCase):
                          '-o', 'peername=IP=1.2.3.4', 'objectClass/add'],
               'path': ['/usr/local/sbin', '/usr/sbin'],
               'expects': 'DENIED'}))
+
+    def test_batched_inputs(self):
+        ''' Batching puts all the requestattrs of a test/peername into one command '''
+        config_objects = validate_input(self.inputs, verbose=False)
+        result = generate_commands(config_objects, batch=True)
+        self.assertEqual(len(result), 5)
+        self.assertEqual(
+            result[0],
+            ('anonymous may auth from anywhere any-IP',
+             {'script': ['slapacl', '-F', '/etc/openldap/slapd.d',
+                         '-b', 'uid=binder,ou=logins,dc=example', 'userPassword/auth'],
+              'path': ['/usr/local/sbin', '/usr/sbin'],
+              'expects': 'ALLOWED',
+              'checks': ['anonymous may auth from anywhere userPassword/auth any-IP']}))
+        self.assertEqual(
+            result[2],
+            ('a user can search for bar from two IPs 20.40.60.80',
+             {'script': ['slapacl', '-F', '/etc/openldap/slapd.d',
+                         '-D', 'uid=foo,ou=logins,dc=example',
+                         '-b', 'uid=bar,ou=logins,dc=example',
+                         '-o', 'peername=IP=20.40.60.80', 'uid/search'],
+              'path': ['/usr/local/sbin', '/usr/sbin'],
+              'expects': 'ALLOWED',
+              'checks': ['a user can search for bar from two IPs uid/search 20.40.60.80']}))
+        self.assertEqual(
+            result[4],
+            ('frob can make a new user 1.2.3.4',
+             {'script': ['slapacl', '-F', '/etc/openldap/slapd.d',
+                         '-D', 'uid=frob,ou=logins,dc=example', '-u',
+                         '-b', 'uid=newguy,ou=logins,dc=example',
+                         '-o', 'peername=IP=1.2.3.4',
+                         'entry/add', 'uid/add', 'objectClass/add'],
+              'path': ['/usr/local/sbin', '/usr/sbin'],
+              'expects': 'DENIED',
+              'checks': ['frob can make a new user entry/add 1.2.3.4',
+                         'frob can make a new user uid/add 1.2.3.4',
+                         'frob can make a new user objectClass/add 1.2.3.4']}))
+
+    def test_iter_commands(self):
+        ''' iter_commands hands out the same commands, lazily '''
+        config_objects = validate_input(self.inputs, verbose=False)
+        for batch in (False, True):
+            result = iter_commands(config_objects, batch=batch)
+            self.assertIsInstance(result, types.GeneratorType)
+            self.assertEqual(list(result), generate_commands(config_objects, batch=batch))
+
+    def test_count_commands(self):
+        ''' count_commands agrees with what gets generated '''
+        config_objects = validate_input(self.inputs, verbose=False)
+        self.assertEqual(count_commands(config_objects), 7)
+        self.assertEqual(count_commands(config_objects, batch=True), 5)
+
+    def test_matrix(self):
+        ''' lists of authcDNs and requestDNs run every combination, labelled '''
+        self.inputs['administrative']['DN_substitutions']['staff'] = ['uid=ann', 'uid=bob']
+        self.inputs['tests'] = [{'description': 'staff reads',
+                                 'authcDN': ['SUB:staff', None],
+                                 'requestDN': ['ou=a', 'ou=b', 'ou=c'],
+                                 'requestattr': ['cn/read', 'sn/read'],
+                                 'expects': 'ALLOWED'},
+                                {'description': 'staff read one',
+                                 'authcDN': 'SUB:staff',
+                                 'requestDN': 'ou=a',
+                                 'requestattr': 'cn/read',
+                                 'expects': 'ALLOWED'}]
+        config_objects = validate_input(self.inputs, verbose=False)
+        result = generate_commands(config_objects)
+        self.assertEqual(count_commands(config_objects), len(result))
+        self.assertEqual(len(result), 3 * 3 * 2 + 2)
+        self.assertEqual(result[0][0], 'staff reads by uid=ann on ou=a cn/read any-IP')
+        self.assertEqual(result[0][1]['script'][3:],
+                         ['-D', 'uid=ann', '-b', 'ou=a', 'cn/read'])
+        self.assertEqual(result[17][0], 'staff reads by anonymous on ou=c sn/read any-IP')
+        self.assertEqual(result[17][1]['script'][3:], ['-b', 'ou=c', 'sn/read'])
+        self.assertEqual(result[19][0], 'staff read one by uid=bob cn/read any-IP')
+        batched = generate_commands(config_objects, batch=True)
+        self.assertEqual(count_commands(config_objects, batch=True), len(batched))
+        self.assertEqual(batched[0][0], 'staff reads by uid=ann on ou=a any-IP')
+
+    def test_matrix_lazy(self):
+        ''' a large matrix is handed out one command at a time '''
+        self.inputs['tests'] = [{'authcDN': [f'uid={x}' for x in range(1000)],
+                                 'requestDN': [f'ou={x}' for x in range(1000)],
+                                 'requestattr': 'cn/read',
+                                 'expects': 'ALLOWED'}]
+        config_objects = validate_input(self.inputs, verbose=False)
+        self.assertEqual(count_commands(config_objects), 1000000)
+        commands = iter_commands(config_objects)
+        self.assertEqual(next(commands)[0], 'undescribed test by uid=0 on ou=0 cn/read any-IP')
+        self.assertEqual(next(commands)[0], 'undescribed test by uid=0 on ou=1 cn/read any-IP')
+
+    def test_shared_pieces(self):
+        ''' Commands share their prefix, path and environment rather than copying them '''
+        config_objects = validate_input(self.inputs, verbose=False)
+        result = generate_commands(config_objects)
+        first = result[0][1]
+        for (_, entry) in result[1:]:
+            self.assertIs(entry.prefix, first.prefix)
+            self.assertIs(entry.path, first.path)
+            self.assertIs(entry.env, first.env)
+        # the requestattrs of one test/peername share their options
+        self.assertIs(result[4][1].options, result[5][1].options)
+        self.assertEqual(first.env, {'PATH': '/usr/local/sbin:/usr/sbin'})
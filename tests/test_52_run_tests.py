@@ -144,3 +144,107 @@ class TestRunTests(unittest.TestCase):
                           'script goes here\nauthcDN: "uid=someone,dc=example"\n'
                           'something we never expected\n\n'),
                          fake_out.getvalue())
+
+    def test_parallel_run_keeps_order(self):
+        ''' With several jobs, output still follows the order of the commands '''
+        test_data = [(f'test{x}', {'script': ['script', str(x)],
+                                   'path': ['/usr/sbin'],
+                                   'expects': 'ALLOWED'}) for x in range(20)]
+
+        def fake_run(script, **_kwargs):
+            ''' odd-numbered commands are denied '''
+            answer = b'DENIED' if int(script[1]) % 2 else b'ALLOWED'
+            return subprocess.CompletedProcess(
+                args=script, returncode=0, stderr=b'read access to o: ' + answer + b'\n')
+        with mock.patch.object(subprocess, 'run', side_effect=fake_run) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            run_tests(test_data, verbose=True, jobs=4)
+        self.assertEqual(mock_run.call_count, 20)
+        expected = ''
+        for x in range(20):
+            if x % 2:
+                expected += (f'FAIL # test{x}\nscript {x}\n'
+                             '# expected "ALLOWED", but got "DENIED"\n')
+            else:
+                expected += f'PASS # test{x}\n'
+        self.assertEqual(expected, fake_out.getvalue())
+
+    def test_batched_run(self):
+        ''' A batched command gets one verdict per requestattr, in order '''
+        test_data = [('test1', {'script': ['script', 'a/read', 'b/read'],
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED',
+                                'checks': ['test1 a/read', 'test1 b/read']})]
+        mock_retval = subprocess.CompletedProcess(
+            args=['script', 'a/read', 'b/read'], returncode=0,
+            stderr=(b'authcDN: "uid=someone,dc=example"\n'
+                    b'read access to a: ALLOWED\nread access to b: DENIED\n'))
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            run_tests(test_data, verbose=True)
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(('PASS # test1 a/read\n'
+                          'FAIL # test1 b/read\nscript a/read b/read\n'
+                          '# expected "ALLOWED", but got "DENIED"\n'),
+                         fake_out.getvalue())
+
+    def test_batched_run_short_answer(self):
+        ''' A batched command that answers for too few attributes is reported '''
+        test_data = [('test1', {'script': ['script', 'a/read', 'b/read'],
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED',
+                                'checks': ['test1 a/read', 'test1 b/read']})]
+        mock_retval = subprocess.CompletedProcess(
+            args=['script', 'a/read', 'b/read'], returncode=0,
+            stderr=b'read access to a: ALLOWED\n')
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval), \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            run_tests(test_data)
+        self.assertEqual(('# test1\nUnable to determine answer from `slapacl`:\n'
+                          'script a/read b/read\nread access to a: ALLOWED\n\n'),
+                         fake_out.getvalue())
+
+    def test_statuses_returned(self):
+        ''' run_tests hands back one status per check '''
+        test_data = [('test1', {'script': ['script', 'pass'],
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED'}),
+                     ('test2', {'script': ['script', 'fail'],
+                                'path': ['/usr/sbin'],
+                                'expects': 'DENIED'}),
+                     ('test3', {'script': ['script', 'error'],
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED',
+                                'checks': ['test3 a', 'test3 b']}),
+                     ('test4', {'script': ['script', 'garbage'],
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED'})]
+
+        def fake_run(script, **_kwargs):
+            ''' answer according to the last word of the script '''
+            if script[1] == 'error':
+                raise subprocess.CalledProcessError(returncode=1, cmd=script)
+            stderr = b'garbage\n' if script[1] == 'garbage' else b'read access to o: ALLOWED\n'
+            return subprocess.CompletedProcess(args=script, returncode=0, stderr=stderr)
+        with mock.patch.object(subprocess, 'run', side_effect=fake_run), \
+                mock.patch('sys.stdout', new=StringIO()):
+            statuses = run_tests(test_data)
+        self.assertEqual(statuses, ['PASS', 'FAIL', 'ERROR', 'ERROR', 'UNKNOWN'])
+        with mock.patch('sys.stdout', new=StringIO()):
+            self.assertEqual(run_tests(test_data, noop=True), [])
+
+    def test_progress(self):
+        ''' With a total, progress goes to stderr and results still go to stdout '''
+        test_data = [(f'test{x}', {'script': ['script', str(x)],
+                                   'path': ['/usr/sbin'],
+                                   'expects': 'ALLOWED'}) for x in range(20)]
+        mock_retval = subprocess.CompletedProcess(
+            args=['script'], returncode=0, stderr=b'read access to o: ALLOWED\n')
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval), \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out, \
+                mock.patch('sys.stderr', new=StringIO()) as fake_err:
+            run_tests(iter(test_data), total=20)
+        self.assertEqual('', fake_out.getvalue())
+        lines = fake_err.getvalue().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertTrue(lines[-1].startswith('# progress: 20/20 commands (100%), ETA '))
@@ -0,0 +1,159 @@
+'''
+    Test the ResultCache
+'''
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.cache import ResultCache, SuiteCache, config_location, fingerprint_path
+from slapaclsuite.yaml_input_validator import validate_input
+from slapaclsuite.commands import run_tests
+
+
+class TestResultCache(unittest.TestCase):
+    ''' Class of tests about caching slapacl answers. '''
+
+    def setUp(self):
+        ''' a scratch directory with a pretend slapd.d in it '''
+        self.workdir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.workdir, 'slapd.d')
+        os.mkdir(self.config_dir)
+        with open(os.path.join(self.config_dir, 'cn=config.ldif'), 'w') as config_fh:
+            config_fh.write('dn: cn=config\n')
+        self.cache_dir = os.path.join(self.workdir, 'cache')
+        self.script = ['slapacl', '-F', self.config_dir, '-b', 'o=x', 'o/read']
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_config_location(self):
+        ''' We find the config the command line points at '''
+        self.assertEqual(config_location(['slapacl', '-F', '/a', '-b', 'o=x']), '/a')
+        self.assertEqual(config_location(['slapacl', '-f', '/a.conf']), '/a.conf')
+        self.assertEqual(config_location(['slapacl', '-F/glued']), '/glued')
+        self.assertIsNone(config_location(['slapacl', '-b', 'o=x']))
+        self.assertIsNone(config_location(['slapacl', '-F']))
+
+    def test_fingerprint_changes(self):
+        ''' Editing the config changes its fingerprint '''
+        before = fingerprint_path(self.config_dir)
+        self.assertEqual(before, fingerprint_path(self.config_dir))
+        with open(os.path.join(self.config_dir, 'cn=config.ldif'), 'a') as config_fh:
+            config_fh.write('olcLogLevel: stats\n')
+        self.assertNotEqual(before, fingerprint_path(self.config_dir))
+        self.assertNotEqual(fingerprint_path(None), fingerprint_path('/no-such-file-I-hope'))
+
+    def test_get_put(self):
+        ''' Answers survive closing and reopening the cache '''
+        cache = ResultCache(self.cache_dir)
+        key = cache.key(self.script, '/usr/sbin')
+        self.assertIsNone(cache.get(key))
+        cache.put(key, b'read access to o: ALLOWED\n')
+        cache.close()
+        cache = ResultCache(self.cache_dir)
+        self.assertEqual(cache.get(key), b'read access to o: ALLOWED\n')
+        self.assertNotEqual(key, cache.key(self.script + ['uid/read'], '/usr/sbin'))
+        refreshing = ResultCache(self.cache_dir, refresh=True)
+        self.assertIsNone(refreshing.get(key))
+        cache.close()
+        refreshing.close()
+
+    def test_lru_eviction(self):
+        ''' Once full, the least recently used answers go first '''
+        cache = ResultCache(self.cache_dir, max_entries=10)
+        keys = [cache.key(self.script + [str(x)], '') for x in range(10)]
+        for key in keys:
+            cache.put(key, b'x')
+        # touch the first one, so it is the most recently used
+        self.assertEqual(cache.get(keys[0]), b'x')
+        cache.put(cache.key(self.script + ['new'], ''), b'x')
+        self.assertEqual(cache.get(keys[0]), b'x')
+        self.assertIsNone(cache.get(keys[1]))
+        cache.close()
+
+    def test_run_tests_uses_cache(self):
+        ''' A second run answers from the cache without spawning slapacl '''
+        test_data = [('test1', {'script': self.script,
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED'})]
+        mock_retval = subprocess.CompletedProcess(
+            args=self.script, returncode=0, stderr=b'read access to o: ALLOWED\n')
+        cache = ResultCache(self.cache_dir)
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            run_tests(test_data, verbose=True, cache=cache)
+            run_tests(test_data, verbose=True, cache=cache)
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual('PASS # test1\nPASS # test1\n', fake_out.getvalue())
+        cache.close()
+
+    def test_run_tests_skips_errors(self):
+        ''' Failed executions are not remembered '''
+        test_data = [('test1', {'script': self.script,
+                                'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED'})]
+        mock_retval = subprocess.CalledProcessError(returncode=1, cmd=self.script)
+        cache = ResultCache(self.cache_dir)
+        with mock.patch.object(subprocess, 'run', side_effect=mock_retval) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()):
+            run_tests(test_data, cache=cache)
+            run_tests(test_data, cache=cache)
+        self.assertEqual(mock_run.call_count, 2)
+        cache.close()
+
+
+class TestSuiteCache(unittest.TestCase):
+    ''' Class of tests about keeping validated suites. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.workdir, 'suite.yaml')
+        with open(self.test_file, 'w') as test_fh:
+            test_fh.write('tests:\n  - requestDN: o=x\n    requestattr: o/read\n'
+                          '    expects: ALLOWED\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_get_put(self):
+        ''' A suite comes back for the same file contents, and not for others '''
+        cache = SuiteCache(self.workdir)
+        key = cache.key(self.test_file)
+        self.assertIsNone(cache.get(key))
+        with mock.patch('sys.stdout', new=StringIO()):
+            suite = validate_input({'tests': [{'requestDN': 'o=x', 'requestattr': 'o/read',
+                                               'expects': 'ALLOWED'}]})
+        cache.put(key, suite)
+        stored = SuiteCache(self.workdir).get(key)
+        self.assertEqual(stored['tests'].inputs[0].inputs, suite['tests'].inputs[0].inputs)
+
+        with open(self.test_file, 'a') as test_fh:
+            test_fh.write('# a comment\n')
+        self.assertNotEqual(cache.key(self.test_file), key)
+        self.assertIsNone(cache.key(os.path.join(self.workdir, 'nonesuch.yaml')))
+
+    def test_code_change(self):
+        ''' A change to the validator code changes every key '''
+        cache = SuiteCache(self.workdir)
+        key = cache.key(self.test_file)
+        with mock.patch.object(SuiteCache, '_code_fingerprint', return_value='other'):
+            self.assertNotEqual(cache.key(self.test_file), key)
+
+    def test_bad_and_old_entries(self):
+        ''' Damaged entries are ignored, and only the newest few are kept '''
+        cache = SuiteCache(self.workdir)
+        cache.max_entries = 2
+        for (age, key) in [(300, 'a'), (200, 'b'), (0, 'c')]:
+            cache.put(key, {'tests': key})
+            os.utime(os.path.join(cache.directory, f'{key}.pickle'),
+                     (time.time() - age, time.time() - age))
+        self.assertEqual(sorted(os.listdir(cache.directory)), ['b.pickle', 'c.pickle'])
+        with open(os.path.join(cache.directory, 'c.pickle'), 'wb') as cache_fh:
+            cache_fh.write(b'garbage')
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.get('b'), {'tests': 'b'})
@@ -0,0 +1,149 @@
+'''
+    Test incremental runs
+'''
+import copy
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.yaml_input_validator import validate_input
+from slapaclsuite.incremental import run_incremental, default_state_file
+from slapaclsuite.results import EarlyStop
+
+
+class TestIncremental(unittest.TestCase):
+    ''' Class of tests about only re-running what changed. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.workdir, 'state.json')
+        self.inputs = {
+            'scripting': {
+                'executable': 'slapacl',
+                'default_arguments': ['-F', os.path.join(self.workdir, 'slapd.d')]
+            },
+            'tests': [
+                {
+                    'description': 'one',
+                    'requestDN': 'uid=one,dc=example',
+                    'requestattr': ['uid/read', 'cn/read'],
+                    'expects': 'ALLOWED'
+                },
+                {
+                    'description': 'two',
+                    'requestDN': 'uid=two,dc=example',
+                    'requestattr': 'uid/read',
+                    'peername': ['1.2.3.4', '5.6.7.8'],
+                    'expects': 'ALLOWED'
+                },
+            ]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _run(self, inputs, answer=b'ALLOWED'):
+        ''' one incremental run, where slapacl always gives `answer` '''
+        mock_retval = subprocess.CompletedProcess(
+            args=[], returncode=0, stderr=b'read access to uid: ' + answer + b'\n')
+        with mock.patch('sys.stdout', new=StringIO()):
+            config_objects = validate_input(copy.deepcopy(inputs))
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            statuses = run_incremental(config_objects, self.state_file, verbose=True)
+        return (statuses, mock_run.call_count, fake_out.getvalue())
+
+    def test_stopped_run_keeps_unfinished_out(self):
+        ''' Tests a stopped run did not finish are not recorded, so they run next time '''
+        mock_retval = subprocess.CompletedProcess(
+            args=[], returncode=0, stderr=b'read access to uid: DENIED\n')
+        with mock.patch('sys.stdout', new=StringIO()):
+            config_objects = validate_input(copy.deepcopy(self.inputs))
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()):
+            statuses = run_incremental(config_objects, self.state_file,
+                                       stop=EarlyStop(maxfail=3))
+        self.assertEqual(statuses, ['FAIL'] * 3)
+        self.assertEqual(mock_run.call_count, 3)
+        with open(self.state_file) as state_fh:
+            state = json.load(state_fh)
+        self.assertEqual(list(state['tests'].values()), [['FAIL', 'FAIL']])
+
+    def test_first_run_runs_everything(self):
+        ''' With no state, everything runs and the state gets written '''
+        (statuses, calls, _) = self._run(self.inputs)
+        self.assertEqual(statuses, ['PASS'] * 4)
+        self.assertEqual(calls, 4)
+        with open(self.state_file) as state_fh:
+            state = json.load(state_fh)
+        self.assertEqual(len(state['tests']), 2)
+
+    def test_unchanged_run_runs_nothing(self):
+        ''' A second run of the same tests reports old verdicts without running '''
+        self._run(self.inputs)
+        (statuses, calls, output) = self._run(self.inputs)
+        self.assertEqual(statuses, ['PASS'] * 4)
+        self.assertEqual(calls, 0)
+        self.assertIn('PASS # one (unchanged, not re-run)', output)
+
+    def test_changed_test_reruns(self):
+        ''' Only the edited test runs again '''
+        self._run(self.inputs)
+        edited = copy.deepcopy(self.inputs)
+        edited['tests'][1]['peername'] = ['1.2.3.4']
+        (statuses, calls, _) = self._run(edited)
+        self.assertEqual(statuses, ['PASS'] * 3)
+        self.assertEqual(calls, 1)
+
+    def test_failures_rerun(self):
+        ''' Tests that failed last time run again '''
+        self._run(self.inputs, answer=b'DENIED')
+        (statuses, calls, _) = self._run(self.inputs)
+        self.assertEqual(statuses, ['PASS'] * 4)
+        self.assertEqual(calls, 4)
+
+    def test_scripting_change_reruns(self):
+        ''' Changing how we run slapacl re-runs everything '''
+        self._run(self.inputs)
+        edited = copy.deepcopy(self.inputs)
+        edited['scripting']['path'] = ['/usr/sbin']
+        (_, calls, _) = self._run(edited)
+        self.assertEqual(calls, 4)
+
+    def test_binary_change_reruns(self):
+        ''' A different slapacl binary (say, an upgrade in place) re-runs everything '''
+        bin_dir = os.path.join(self.workdir, 'bin')
+        os.makedirs(bin_dir)
+        binary = os.path.join(bin_dir, 'slapacl')
+        with open(binary, 'w') as binary_fh:
+            binary_fh.write('#!/bin/sh\n')
+        os.chmod(binary, 0o755)
+        inputs = copy.deepcopy(self.inputs)
+        inputs['scripting']['path'] = [bin_dir]
+        self._run(inputs)
+        (_, calls, _) = self._run(inputs)
+        self.assertEqual(calls, 0)
+        with open(binary, 'a') as binary_fh:
+            binary_fh.write('# 2.6\n')
+        (_, calls, _) = self._run(inputs)
+        self.assertEqual(calls, 4)
+
+    def test_corrupt_state(self):
+        ''' A garbage state file is the same as no state file '''
+        with open(self.state_file, 'w') as state_fh:
+            state_fh.write('not json')
+        (_, calls, _) = self._run(self.inputs)
+        self.assertEqual(calls, 4)
+
+    def test_default_state_file(self):
+        ''' The default state file lives in the cache dir, named for the yaml '''
+        state_file = default_state_file('suite.yaml', '/cache')
+        self.assertTrue(state_file.startswith('/cache/incremental-'))
+        self.assertNotEqual(state_file, default_state_file('other.yaml', '/cache'))
+        self.assertEqual(state_file, default_state_file(['suite.yaml'], '/cache'))
+        self.assertNotEqual(state_file, default_state_file(['suite.yaml', 'more'], '/cache'))
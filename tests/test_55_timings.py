@@ -0,0 +1,117 @@
+'''
+    Test the Timings instrumentation
+'''
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.commands import run_tests
+from slapaclsuite.timings import Timings, percentile, timed_run
+
+
+class TestTimings(unittest.TestCase):
+    ''' Class of tests about where the time went. '''
+
+    def test_percentile(self):
+        ''' nearest-rank percentiles '''
+        values = [float(x) for x in range(1, 101)]
+        self.assertEqual(percentile(values, 0.50), 50.0)
+        self.assertEqual(percentile(values, 0.95), 95.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile(values, 1.0), 100.0)
+        self.assertEqual(percentile([3.0], 0.5), 3.0)
+
+    def test_phase(self):
+        ''' phases add up, and keep the order they were first seen in '''
+        timings = Timings()
+        with mock.patch('time.perf_counter', side_effect=[1.0, 3.0, 10.0, 11.0]), \
+                mock.patch('time.process_time', side_effect=[0.0, 0.5, 1.0, 1.25]):
+            with timings.phase('ingest'):
+                pass
+            with timings.phase('validate'):
+                pass
+        self.assertEqual(list(timings.phases), ['ingest', 'validate'])
+        self.assertEqual(timings.phases['ingest'], {'wall_seconds': 2.0, 'cpu_seconds': 0.5})
+        self.assertEqual(timings.phases['validate'], {'wall_seconds': 1.0, 'cpu_seconds': 0.25})
+
+    def test_phase_on_exception(self):
+        ''' a phase that blows up still counts '''
+        timings = Timings()
+        with self.assertRaises(ValueError):
+            with timings.phase('ingest'):
+                raise ValueError('boom')
+        self.assertIn('ingest', timings.phases)
+
+    def test_timed_iter_within(self):
+        ''' time spent generating items is moved out of the enclosing phase '''
+        timings = Timings()
+        timings.add_phase('run', 10.0, 5.0)
+        with mock.patch('time.perf_counter', side_effect=[0.0, 1.0, 2.0, 4.0]), \
+                mock.patch('time.process_time', side_effect=[0.0, 1.0, 2.0, 3.0]):
+            items = list(timings.timed_iter('generate', ['a'], within='run'))
+        self.assertEqual(items, ['a'])
+        self.assertEqual(timings.phases['generate'], {'wall_seconds': 3.0, 'cpu_seconds': 2.0})
+        self.assertEqual(timings.phases['run'], {'wall_seconds': 7.0, 'cpu_seconds': 3.0})
+
+    def test_summary(self):
+        ''' latency figures leave out cached answers, and the slowest are listed '''
+        timings = Timings()
+        for index in range(1, 21):
+            timings.record_command(f'test{index}', index / 10)
+        timings.record_command('cached', 100.0, cached=True)
+        with mock.patch('slapaclsuite.timings._children_cpu', return_value=0.0):
+            summary = timings.summary(slowest=3)
+        self.assertEqual(summary['commands'], {'run': 20, 'cached': 1})
+        self.assertEqual(summary['latency']['p50'], 1.0)
+        self.assertEqual(summary['latency']['p95'], 1.9)
+        self.assertEqual(summary['latency']['max'], 2.0)
+        self.assertEqual(summary['spawn']['total_seconds'], 21.0)
+        self.assertEqual([x['description'] for x in summary['slowest']],
+                         ['test20', 'test19', 'test18'])
+
+    def test_summary_empty(self):
+        ''' nothing run, nothing to say about latency '''
+        summary = Timings().summary()
+        self.assertEqual(summary['latency'], {})
+        self.assertEqual(summary['slowest'], [])
+
+    def test_report_and_json(self):
+        ''' the report is readable by people, and the JSON by programs '''
+        timings = Timings()
+        timings.add_phase('validate', 0.5, 0.5)
+        timings.record_command('test1', 0.25)
+        fake_out = StringIO()
+        timings.report(stream=fake_out)
+        self.assertIn('# Timings\n#   validate', fake_out.getvalue())
+        self.assertIn('# slapacl calls: 1 run, 0 from cache', fake_out.getvalue())
+        self.assertIn('0.250s  test1', fake_out.getvalue())
+        with tempfile.TemporaryDirectory() as workdir:
+            filename = os.path.join(workdir, 'timings.json')
+            timings.write_json(filename)
+            with open(filename) as json_fh:
+                report = json.load(json_fh)
+        self.assertEqual(report['phases']['validate']['wall_seconds'], 0.5)
+        self.assertEqual(report['slowest'], [{'description': 'test1', 'seconds': 0.25}])
+
+    def test_timed_run_tests(self):
+        ''' run_tests records every command it runs '''
+        test_data = [(f'test{x}', {'script': ['slapacl', str(x)],
+                                   'path': ['/usr/sbin'],
+                                   'expects': 'ALLOWED'}) for x in range(3)]
+        mock_retval = subprocess.CompletedProcess(
+            args=['slapacl'], returncode=0, stderr=b'read access to o: ALLOWED\n')
+        timings = Timings()
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval), \
+                mock.patch('sys.stdout', new=StringIO()):
+            statuses = timed_run(timings, run_tests, test_data, jobs=2)
+        self.assertEqual(statuses, ['PASS', 'PASS', 'PASS'])
+        self.assertEqual(sorted(x[0] for x in timings.commands), ['test0', 'test1', 'test2'])
+        self.assertEqual(list(timings.phases), ['generate', 'run'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+'''
+    Test iter_results and report_results
+'''
+import json
+import subprocess
+import threading
+import time
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.commands import iter_results, report_results, run_tests
+from slapaclsuite.results import Result, EarlyStop
+
+
+class TestIterResults(unittest.TestCase):
+    ''' Class of tests about structured results. '''
+
+    def test_single_results(self):
+        ''' one Result per command, in order, with what we asked and what we got '''
+        test_data = [('test1', {'script': ['slapacl', 'one'], 'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED'}),
+                     ('test2', {'script': ['slapacl', 'two'], 'path': ['/usr/sbin'],
+                                'expects': 'ALLOWED'})]
+        returns = [subprocess.CompletedProcess(args=[], returncode=0,
+                                               stderr=b'read access to o: ALLOWED\n'),
+                   subprocess.CompletedProcess(args=[], returncode=0,
+                                               stderr=b'read access to o: DENIED\n')]
+        with mock.patch.object(subprocess, 'run', side_effect=returns), \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            results = list(iter_results(test_data))
+        self.assertEqual('', fake_out.getvalue())
+        self.assertEqual([x.description for x in results], ['test1', 'test2'])
+        self.assertEqual([x.status for x in results], ['PASS', 'FAIL'])
+        self.assertEqual(results[1].argv, ['slapacl', 'two'])
+        self.assertEqual(results[1].expected, 'ALLOWED')
+        self.assertEqual(results[1].actual, 'DENIED')
+        self.assertIsNone(results[1].stderr)
+        self.assertFalse(results[1].cached)
+        self.assertGreaterEqual(results[1].duration, 0)
+
+    def test_batched_and_errors(self):
+        ''' batched commands split into checks; errors keep what slapacl said '''
+        test_data = [('test1 peer', {'script': ['slapacl', 'a', 'b'], 'path': ['/usr/sbin'],
+                                     'expects': 'DENIED', 'checks': ['test1 a', 'test1 b']}),
+                     ('test2', {'script': ['slapacl', 'c'], 'path': ['/usr/sbin'],
+                                'expects': 'DENIED'})]
+        returns = [subprocess.CompletedProcess(args=[], returncode=0,
+                                               stderr=b'a: DENIED\nb: DENIED\n'),
+                   subprocess.CalledProcessError(1, ['slapacl', 'c'], stderr=b'no config\n')]
+        with mock.patch.object(subprocess, 'run', side_effect=returns):
+            results = list(iter_results(test_data, jobs=2))
+        self.assertEqual([(x.description, x.command, x.status, x.position) for x in results],
+                         [('test1 a', 'test1 peer', 'PASS', 0),
+                          ('test1 b', 'test1 peer', 'PASS', 1),
+                          ('test2', 'test2', 'ERROR', 0)])
+        self.assertEqual(results[2].stderr, b'no config\n')
+        self.assertIsNone(results[2].actual)
+        self.assertEqual(json.loads(json.dumps(results[2].as_dict()))['stderr'], 'no config\n')
+
+    def test_lazy(self):
+        ''' results come out as commands finish, not after the whole run '''
+        def commands():
+            yield ('test1', {'script': ['slapacl'], 'path': [], 'expects': 'ALLOWED'})
+            raise AssertionError('asked for a second command too soon')
+        mock_retval = subprocess.CompletedProcess(args=[], returncode=0, stderr=b'x: ALLOWED\n')
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval):
+            first = next(iter_results(commands()))
+        self.assertEqual(first.status, 'PASS')
+
+    def test_report_results(self):
+        ''' the text form: problems are told once per command '''
+        results = [
+            Result('t1', 't1', ['slapacl', 'x'], 'ALLOWED', 'ALLOWED', 'PASS', 0.1, None,
+                   False, 0),
+            Result('t2', 't2', ['slapacl', 'y'], 'ALLOWED', 'DENIED', 'FAIL', 0.1, None,
+                   False, 0),
+            Result('t3 a', 't3', ['slapacl', 'a', 'b'], 'ALLOWED', None, 'UNKNOWN', 0.1,
+                   b'garbage\n', False, 0),
+            Result('t3 b', 't3', ['slapacl', 'a', 'b'], 'ALLOWED', None, 'UNKNOWN', 0.1,
+                   b'garbage\n', False, 1),
+        ]
+        with mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            statuses = report_results(iter(results), verbose=True)
+        self.assertEqual(statuses, ['PASS', 'FAIL', 'UNKNOWN', 'UNKNOWN'])
+        self.assertEqual(fake_out.getvalue(),
+                         'PASS # t1\n'
+                         'FAIL # t2\nslapacl y\n# expected "ALLOWED", but got "DENIED"\n'
+                         '# t3\nUnable to determine answer from `slapacl`:\n'
+                         'slapacl a b\ngarbage\n\n')
+
+    def test_longest_first(self):
+        ''' with a schedule, the costliest commands start first; results keep plan order '''
+        test_data = [(f'test{x}', {'script': ['slapacl', str(x)], 'path': [],
+                                   'expects': 'ALLOWED'}) for x in range(8)]
+        costs = {'test2': 9.0, 'test6': 5.0, 'test7': 7.0}
+        started = []
+
+        def answer(script, **_kwargs):
+            ''' a slapacl that notes the order it is run in '''
+            started.append(int(script[1]))
+            return subprocess.CompletedProcess(args=script, returncode=0,
+                                               stderr=b'x: ALLOWED\n')
+        with mock.patch.object(subprocess, 'run', side_effect=answer):
+            results = list(iter_results(test_data, jobs=3,
+                                        schedule=lambda x: costs.get(x[0], 1.0)))
+        self.assertEqual([x.description for x in results], [x[0] for x in test_data])
+        self.assertEqual(started[:3], [2, 7, 6])
+        self.assertEqual(sorted(started), list(range(8)))
+
+        started.clear()
+        with mock.patch.object(subprocess, 'run', side_effect=answer):
+            list(iter_results(test_data, jobs=1, schedule=lambda x: costs.get(x[0], 1.0)))
+        self.assertEqual(started, list(range(8)))
+
+    def test_slow_head(self):
+        ''' a slow command does not keep the other jobs waiting; results keep plan order '''
+        test_data = [(f'test{x}', {'script': ['slapacl', str(x)], 'path': [],
+                                   'expects': 'ALLOWED'}) for x in range(40)]
+        others_done = threading.Event()
+        finished = []
+
+        def answer(script, **_kwargs):
+            ''' the first command only finishes once the ones after it have '''
+            if script[1] == '0':
+                others_done.wait(timeout=5)
+            finished.append(int(script[1]))
+            if len(finished) == 30:
+                others_done.set()
+            return subprocess.CompletedProcess(args=script, returncode=0,
+                                               stderr=b'x: ALLOWED\n')
+        with mock.patch.object(subprocess, 'run', side_effect=answer):
+            results = list(iter_results(test_data, jobs=2))
+        self.assertTrue(others_done.is_set())
+        self.assertGreater(finished.index(0), 20)
+        self.assertEqual([x.description for x in results], [x[0] for x in test_data])
+
+
+class TestEarlyStop(unittest.TestCase):
+    ''' Class of tests about giving up on a failing run. '''
+
+    @staticmethod
+    def _commands(count):
+        ''' make `count` simple commands '''
+        return [(f'test{x}', {'script': ['slapacl', str(x)], 'path': ['/usr/sbin'],
+                              'expects': 'ALLOWED'}) for x in range(count)]
+
+    def test_breaker(self):
+        ''' the same error every time trips the breaker, and we stop spawning '''
+        error = subprocess.CalledProcessError(1, ['slapacl'], stderr=b'bad config\n')
+        stop = EarlyStop(breaker=5)
+        with mock.patch.object(subprocess, 'run', side_effect=error) as mock_run:
+            results = list(iter_results(self._commands(1000), stop=stop))
+        self.assertEqual(len(results), 5)
+        self.assertEqual(mock_run.call_count, 5)
+        self.assertIn('the first 5 commands all failed the same way (ERROR): bad config',
+                      stop.reason)
+
+    def test_breaker_parallel(self):
+        ''' with a pool, only what was already in flight runs after the breaker trips '''
+        error = subprocess.CalledProcessError(1, ['slapacl'], stderr=b'bad config\n')
+        stop = EarlyStop(breaker=5)
+        with mock.patch.object(subprocess, 'run', side_effect=error) as mock_run:
+            results = list(iter_results(self._commands(1000), jobs=4, stop=stop))
+        self.assertEqual(len(results), 5)
+        self.assertLess(mock_run.call_count, 20)
+
+    def test_breaker_scheduled(self):
+        ''' a scheduled run stops as soon, and drops what has not started '''
+        def broken(*_args, **_kwargs):
+            ''' a slapacl that takes a moment to fail '''
+            time.sleep(0.005)
+            return subprocess.CalledProcessError(1, ['slapacl'], stderr=b'bad config\n')
+        stop = EarlyStop(breaker=5)
+        with mock.patch.object(subprocess, 'run', side_effect=broken) as mock_run:
+            results = list(iter_results(self._commands(1000), jobs=4, stop=stop,
+                                        schedule=lambda x: 1.0))
+        self.assertEqual(len(results), 5)
+        self.assertLess(mock_run.call_count, 100)
+
+    def test_breaker_different_errors(self):
+        ''' errors that differ, or a pass among them, do not trip the breaker '''
+        results = [Result('t', 't', [], 'ALLOWED', None, 'ERROR', 0.1, b'error %d' % x,
+                          False, 0) for x in range(20)]
+        stop = EarlyStop(breaker=5)
+        self.assertFalse(any(stop.check(x) for x in results))
+        ok = Result('t', 't', [], 'ALLOWED', 'ALLOWED', 'PASS', 0.1, None, False, 0)
+        bad = results[0]
+        stop = EarlyStop(breaker=5)
+        self.assertFalse(any(stop.check(x) for x in [ok] + [bad] * 20))
+        self.assertFalse(any(EarlyStop(breaker=0).check(x) for x in [bad] * 20))
+
+    def test_maxfail(self):
+        ''' --maxfail counts checks that did not pass '''
+        returns = [subprocess.CompletedProcess(args=[], returncode=0,
+                                               stderr=b'x: ' + answer + b'\n')
+                   for answer in [b'ALLOWED', b'DENIED', b'ALLOWED', b'DENIED', b'DENIED']]
+        stop = EarlyStop(maxfail=2)
+        with mock.patch.object(subprocess, 'run', side_effect=returns), \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            statuses = run_tests(self._commands(5), stop=stop)
+        self.assertEqual(statuses, ['PASS', 'FAIL', 'PASS', 'FAIL'])
+        self.assertEqual(stop.reason, 'stopped after 2 failures (--maxfail)')
+        self.assertTrue(fake_out.getvalue().endswith('# stopped after 2 failures (--maxfail)\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+'''
+    Test change-impact runs
+'''
+import copy
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from tests.test_60_native_acl import write_slapd_d
+from slapaclsuite.yaml_input_validator import validate_input
+from slapaclsuite.commands import generate_commands
+from slapaclsuite.impact import AccessDiff, retarget, run_impact
+from slapaclsuite.native import Unsupported, load_index
+
+BASELINE = [
+    'to dn.subtree="ou=people,dc=example" attrs=userPassword by self write by * auth',
+    'to dn.subtree="ou=groups,dc=example" by users read',
+    'to * by * read',
+]
+
+
+class TestImpact(unittest.TestCase):
+    ''' Class of tests about running only what an ACL change can affect. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.baseline = write_slapd_d(os.path.join(self.workdir, 'old'), BASELINE)
+        self.inputs = {
+            'scripting': {
+                'executable': 'slapacl',
+                'default_arguments': ['-F', self.baseline, '-u']
+            },
+            'tests': [
+                {
+                    'description': 'people',
+                    'authcDN': 'uid=a,ou=people,dc=example',
+                    'requestDN': 'uid=b,ou=people,dc=example',
+                    'requestattr': ['userPassword/write', 'cn/read'],
+                    'expects': 'DENIED'
+                },
+                {
+                    'description': 'groups',
+                    'authcDN': 'uid=a,ou=people,dc=example',
+                    'requestDN': 'cn=staff,ou=groups,dc=example',
+                    'requestattr': 'member/read',
+                    'expects': 'ALLOWED'
+                },
+            ]
+        }
+        with mock.patch('sys.stdout', new=StringIO()):
+            self.config_objects = validate_input(copy.deepcopy(self.inputs))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _candidate(self, access, name='new', **kwargs):
+        ''' write a candidate slapd.d '''
+        return write_slapd_d(os.path.join(self.workdir, name), access, **kwargs)
+
+    def _affected(self, candidate):
+        ''' the descriptions of the commands a change to `candidate` may affect '''
+        diff = AccessDiff(load_index(self.baseline), load_index(candidate))
+        return [description for (description, entry) in generate_commands(self.config_objects)
+                if diff.affects(entry['script'])]
+
+    def test_no_change(self):
+        ''' identical rules affect nothing '''
+        self.assertEqual(self._affected(self._candidate(BASELINE)), [])
+
+    def test_changed_rule(self):
+        ''' only checks a changed rule covers are affected '''
+        candidate = self._candidate([BASELINE[0], 'to dn.subtree="ou=groups,dc=example" '
+                                     'by users write', BASELINE[2]])
+        self.assertEqual(self._affected(candidate), ['groups member/read any-IP'])
+
+    def test_added_rule_by_attribute(self):
+        ''' a new rule for one attribute affects only checks of that attribute '''
+        candidate = self._candidate(['to attrs=cn by * none'] + BASELINE)
+        self.assertEqual(self._affected(candidate), ['people cn/read any-IP'])
+
+    def test_removed_rule(self):
+        ''' a removed rule affects what it used to cover '''
+        candidate = self._candidate(BASELINE[1:])
+        self.assertEqual(self._affected(candidate), ['people userPassword/write any-IP'])
+
+    def test_whole_database(self):
+        ''' a rootdn change, or new databases, leave nothing out '''
+        candidate = self._candidate(BASELINE, rootdn='cn=other,dc=example')
+        self.assertEqual(len(self._affected(candidate)), 3)
+        diff = AccessDiff(load_index(self.baseline), load_index(candidate))
+        self.assertEqual(diff.describe(), ['mdb{1}: rootdn changed'])
+
+        candidate = self._candidate(BASELINE, name='newer')
+        with open(os.path.join(candidate, 'cn=config', 'olcDatabase={2}mdb.ldif'),
+                  'w') as config_fh:
+            config_fh.write('dn: olcDatabase={2}mdb\nolcDatabase: {2}mdb\n'
+                            'olcSuffix: dc=other\n')
+        self.assertEqual(len(self._affected(candidate)), 3)
+
+    def test_frontend_change(self):
+        ''' frontend rules come after every database's own '''
+        candidate = self._candidate(BASELINE[:2], frontend_access=['to * by * read'])
+        diff = AccessDiff(load_index(self.baseline), load_index(candidate))
+        self.assertEqual(diff.describe(), ['frontend{-1}: 0 rules removed, 1 added'])
+        candidate = self._candidate(BASELINE[:2], name='newer',
+                                    frontend_access=['to * by * search'])
+        diff = AccessDiff(load_index(self.baseline), load_index(candidate))
+        self.assertEqual(diff.describe(), ['mdb{1}: 1 rules removed, 1 added',
+                                           'frontend{-1}: 0 rules removed, 1 added'])
+
+    def test_unreadable_command(self):
+        ''' commands we can not take apart are always affected '''
+        candidate = self._candidate(['to attrs=cn by * none'] + BASELINE)
+        diff = AccessDiff(load_index(self.baseline), load_index(candidate))
+        self.assertTrue(diff.affects(['slapacl', '-F', self.baseline, '-b',
+                                      'uid=b,ou=people,dc=example', 'uid']))
+        self.assertTrue(diff.affects(['slapacl', '-F', self.baseline, '-b', 'dc=elsewhere',
+                                      'uid/read']))
+        self.assertFalse(diff.affects(['slapacl', '-F', self.baseline, '-b',
+                                       'uid=b,ou=people,dc=example', 'uid/read']))
+
+    def test_retarget(self):
+        ''' the command is pointed at the candidate, whatever form -F took '''
+        (_, entry) = generate_commands(self.config_objects)[0]
+        self.assertEqual(retarget(entry, '/new')['script'][:5],
+                         ['slapacl', '-F', '/new', '-u', '-D'])
+        self.assertEqual(retarget(entry, '/new')['expects'], 'DENIED')
+        inputs = copy.deepcopy(self.inputs)
+        inputs['scripting']['default_arguments'] = ['-F/old', '-u']
+        with mock.patch('sys.stdout', new=StringIO()):
+            (_, entry) = generate_commands(validate_input(inputs))[0]
+        self.assertEqual(retarget(entry, '/new')['script'][:4],
+                         ['slapacl', '-F', '/new', '-u'])
+
+    def test_run_impact(self):
+        ''' affected checks run against the candidate, the rest are carried '''
+        candidate = self._candidate(['to attrs=cn by * none'] + BASELINE)
+        mock_retval = subprocess.CompletedProcess(
+            args=[], returncode=0, stderr=b'read access to cn: DENIED\n')
+        with mock.patch.object(subprocess, 'run', return_value=mock_retval) as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            statuses = run_impact(self.config_objects, self.baseline, candidate, verbose=True)
+        self.assertEqual(statuses, ['PASS'])
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(mock_run.call_args[0][0][:3], ['slapacl', '-F', candidate])
+        self.assertIn('# impact: mdb{1}: 0 rules removed, 1 added', fake_out.getvalue())
+        self.assertIn('CARRIED # people userPassword/write any-IP', fake_out.getvalue())
+        self.assertIn('CARRIED # groups member/read any-IP', fake_out.getvalue())
+        self.assertIn('1 checks run against', fake_out.getvalue())
+        self.assertIn('2 carried over', fake_out.getvalue())
+
+        with self.assertRaises(Unsupported), mock.patch('sys.stdout', new=StringIO()):
+            run_impact(self.config_objects, self.baseline, os.path.join(self.workdir, 'no'))
+
+
+if __name__ == '__main__':
+    unittest.main()
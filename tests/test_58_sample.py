@@ -0,0 +1,137 @@
+'''
+    Test sampled runs
+'''
+import copy
+import itertools
+import random
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.yaml_input_validator import validate_input
+from slapaclsuite.commands import generate_commands
+from slapaclsuite.sample import Sampler, all_pairs
+
+
+class TestSample(unittest.TestCase):
+    ''' Class of tests about picking a reproducible subset of the checks. '''
+
+    def setUp(self):
+        self.inputs = {
+            'scripting': {'executable': 'slapacl'},
+            'tests': [
+                {
+                    'description': f'test {x}',
+                    'authcDN': [f'uid=a{y},dc=example' for y in range(3)],
+                    'requestDN': [f'uid=r{y},dc=example' for y in range(4)],
+                    'peername': ['10.0.0.1', '10.0.0.2'],
+                    'requestattr': ['cn/read', 'sn/read', f'attr{x}/write'],
+                    'expects': 'ALLOWED'
+                } for x in range(10)
+            ]
+        }
+
+    def _commands(self, inputs=None, **kwargs):
+        ''' the descriptions of the commands made '''
+        with mock.patch('sys.stdout', new=StringIO()):
+            config_objects = validate_input(copy.deepcopy(inputs or self.inputs))
+        return [x for (x, _) in generate_commands(config_objects, **kwargs)]
+
+    def test_random(self):
+        ''' the same seed gives the same subset, in the same order '''
+        full = self._commands()
+        first = self._commands(sample=Sampler('random', fraction=0.2, seed=5))
+        self.assertEqual(first, self._commands(sample=Sampler('random', fraction=0.2, seed=5)))
+        self.assertNotEqual(first, self._commands(sample=Sampler('random', fraction=0.2,
+                                                                 seed=6)))
+        self.assertEqual(first, [x for x in full if x in set(first)])
+        self.assertLess(len(full) * 0.1, len(first))
+        self.assertLess(len(first), len(full) * 0.3)
+        self.assertEqual(self._commands(sample=Sampler('random', fraction=1)), full)
+
+    def test_stable(self):
+        ''' a test's sample does not change when other tests are added '''
+        inputs = copy.deepcopy(self.inputs)
+        inputs['tests'].insert(0, dict(inputs['tests'][0], description='new test'))
+        for strategy in ('random', 'pairwise'):
+            before = self._commands(sample=Sampler(strategy, fraction=0.3, seed=1))
+            after = self._commands(inputs, sample=Sampler(strategy, fraction=0.3, seed=1))
+            self.assertEqual([x for x in after if not x.startswith('new test')], before,
+                             strategy)
+        # stratified only ever hands an attribute's check over to the new test.
+        before = self._commands(sample=Sampler('stratified', fraction=0.3, seed=1))
+        after = self._commands(inputs, sample=Sampler('stratified', fraction=0.3, seed=1))
+        self.assertLessEqual({x for x in after if not x.startswith('new test')}, set(before))
+
+    def test_stratified(self):
+        ''' every test at least once, and every attribute somewhere in the suite '''
+        picked = self._commands(sample=Sampler('stratified', fraction=0.01, seed=3))
+        for number in range(10):
+            self.assertTrue(any(x.startswith(f'test {number} ') for x in picked), number)
+        for attribute in ['cn/read', 'sn/read'] + [f'attr{x}/write' for x in range(10)]:
+            self.assertTrue(any(f' {attribute} ' in x for x in picked), attribute)
+        self.assertLess(len(picked), 30)
+        self.assertEqual(picked, self._commands(sample=Sampler('stratified', fraction=0.01,
+                                                               seed=3)))
+
+    def test_stratified_order(self):
+        ''' which test checks an attribute does not depend on the order of the tests '''
+        inputs = copy.deepcopy(self.inputs)
+        inputs['tests'].reverse()
+        for seed in range(5):
+            self.assertEqual(
+                set(self._commands(inputs, sample=Sampler('stratified', fraction=0.01,
+                                                          seed=seed))),
+                set(self._commands(sample=Sampler('stratified', fraction=0.01, seed=seed))))
+
+    def test_pairwise(self):
+        ''' every pair of values of two dimensions is checked together '''
+        inputs = copy.deepcopy(self.inputs)
+        del inputs['tests'][1:]
+        full = self._commands(inputs)
+        picked = self._commands(inputs, sample=Sampler('pairwise'))
+        self.assertLess(len(picked), len(full))
+        self.assertEqual(picked, [x for x in full if x in set(picked)])
+        values = [[f'uid=a{y},dc=example' for y in range(3)],
+                  [f'uid=r{y},dc=example' for y in range(4)],
+                  ['10.0.0.1', '10.0.0.2'],
+                  ['cn/read', 'sn/read', 'attr0/write']]
+        for (first, second) in itertools.combinations(range(4), 2):
+            for (one, two) in itertools.product(values[first], values[second]):
+                self.assertTrue(any(f' {one} ' in f' {x} ' and f' {two} ' in f' {x} '
+                                    for x in picked), (one, two))
+
+    def test_all_pairs(self):
+        ''' the covering array covers, whatever the sizes '''
+        chooser = random.Random(0)
+        for _ in range(30):
+            sizes = tuple(chooser.randint(1, 5) for _ in range(4))
+            rows = all_pairs(sizes, random.Random(1))
+            for (first, second) in itertools.combinations(range(4), 2):
+                self.assertEqual({(x[first], x[second]) for x in rows},
+                                 set(itertools.product(range(sizes[first]),
+                                                       range(sizes[second]))))
+            self.assertLessEqual(len(set(rows)), max(1, sizes[0] * sizes[1] * sizes[2] *
+                                                     sizes[3]))
+
+    def test_batch(self):
+        ''' batched commands carry only the sampled requestattrs '''
+        sample = Sampler('random', fraction=0.3, seed=2)
+        single = self._commands(sample=sample)
+        with mock.patch('sys.stdout', new=StringIO()):
+            config_objects = validate_input(copy.deepcopy(self.inputs))
+        batched = generate_commands(config_objects, batch=True,
+                                    sample=Sampler('random', fraction=0.3, seed=2))
+        self.assertEqual([x for (_, entry) in batched for x in entry['checks']], single)
+
+    def test_bad_sampler(self):
+        ''' unknown strategies and fractions out of range are refused '''
+        for (strategy, fraction) in [('some', 0.1), ('random', 0), ('random', 1.5)]:
+            with self.assertRaises(ValueError):
+                Sampler(strategy, fraction=fraction)
+        self.assertEqual(Sampler('random', fraction=0.5, seed=7).describe(),
+                         '--sample random --sample-fraction 0.5 --sample-seed 7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+'''
+    Test sharded runs, and merging their results
+'''
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.commands import run_tests
+from slapaclsuite.results import EarlyStop
+from slapaclsuite.shard import Shard, command_key, merge_results, read_results, shard_of
+
+
+def _commands(names):
+    ''' a plan of one command per name; the odd ones are batched '''
+    retval = []
+    for (number, name) in enumerate(names):
+        entry = {'script': ['slapacl', '-b', f'cn={name}', 'cn/read'], 'path': [],
+                 'expects': 'ALLOWED'}
+        if number % 2:
+            entry['script'].append('sn/read')
+            entry['checks'] = [f'{name} cn', f'{name} sn']
+        retval.append((name, entry))
+    return retval
+
+
+def _answer(script, **_kwargs):
+    ''' a stand-in slapacl: cn=t3 is denied, cn=t5 fails to run '''
+    if 'cn=t5' in script:
+        return subprocess.CalledProcessError(1, script, stderr=b'broken\n')
+    answer = b'DENIED' if 'cn=t3' in script else b'ALLOWED'
+    return subprocess.CompletedProcess(args=script, returncode=0,
+                                       stderr=b''.join(b'x: ' + answer + b'\n'
+                                                       for _ in script[3:]))
+
+
+class TestShard(unittest.TestCase):
+    ''' Class of tests about splitting a run into shards. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _run_shard(self, commands, index, count, stop=None, name='shard', assignment=None,
+                   backend='slapacl'):
+        ''' run one shard of `commands`, and give back its results file '''
+        filename = os.path.join(self.workdir, f'{name}-{index}.jsonl')
+        with open(filename, 'w') as output_fh, \
+                mock.patch.object(subprocess, 'run', side_effect=_answer), \
+                mock.patch('sys.stdout', new=StringIO()):
+            shard = Shard(index, count, output_fh, assignment=assignment, backend=backend)
+            run_tests(shard.select(commands), jobs=2, stop=stop, record=shard.record)
+            shard.finish(stop)
+        return filename
+
+    def test_partition(self):
+        ''' every command is in exactly one shard, and stays there as the plan grows '''
+        commands = _commands([f'test{x}' for x in range(300)])
+        shards = [[x[0] for x in Shard(index, 3).select(commands)] for index in (1, 2, 3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(x[0] for x in commands))
+        self.assertTrue(all(60 < len(x) < 140 for x in shards))
+
+        grown = _commands([f'new{x}' for x in range(50)]) + commands
+        self.assertTrue(all(shard_of(x, 3) == index
+                            for (index, shard) in enumerate(shards, 1)
+                            for x in commands if x[0] in shard))
+        self.assertEqual([[x[0] for x in Shard(index, 3).select(grown)
+                           if not x[0].startswith('new')] for index in (1, 2, 3)], shards)
+        with self.assertRaises(ValueError):
+            Shard(4, 3)
+
+    def test_merge(self):
+        ''' the shards' results, merged, are the results of the whole run, in order '''
+        commands = _commands([f't{x}' for x in range(12)])
+        with mock.patch.object(subprocess, 'run', side_effect=_answer), \
+                mock.patch('sys.stdout', new=StringIO()):
+            whole = []
+            run_tests(commands, record=whole.append)
+        files = [self._run_shard(commands, index, 3) for index in (3, 1, 2)]
+        (summary, merged) = merge_results(files)
+        self.assertEqual(summary, {'shards': 3, 'plan': mock.ANY, 'assignment': mock.ANY,
+                                   'backend': 'slapacl', 'commands': 12, 'stopped': []})
+        self.assertEqual([x._replace(duration=0) for x in merged],
+                         [x._replace(duration=0) for x in whole])
+        self.assertEqual(merged[7].stderr, b'broken\n')
+        self.assertEqual(sum(len(read_results(x)[1]) for x in files), 18)
+
+    def test_merge_reordered(self):
+        ''' a shard may run its commands in any order; merging puts them back '''
+        commands = _commands([f't{x}' for x in range(12)])
+        filename = os.path.join(self.workdir, 'reordered.jsonl')
+        with open(filename, 'w') as output_fh, \
+                mock.patch.object(subprocess, 'run', side_effect=_answer), \
+                mock.patch('sys.stdout', new=StringIO()):
+            shard = Shard(1, 1, output_fh)
+            run_tests(list(reversed(list(shard.select(commands)))), record=shard.record)
+            shard.finish()
+        (_, merged) = merge_results([filename])
+        self.assertEqual([x.description for x in merged][:4], ['t0', 't1 cn', 't1 sn', 't2'])
+
+    def test_merge_errors(self):
+        ''' only every shard of one plan, once each, can be merged '''
+        commands = _commands([f't{x}' for x in range(12)])
+        files = [self._run_shard(commands, index, 3) for index in (1, 2, 3)]
+        for (filenames, message) in [
+                (files[:2], 'Missing the results of shard(s) 3 of 3'),
+                (files + files[:1], 'given twice'),
+                ([files[0], self._run_shard(commands[1:], 2, 3, name='other')],
+                 'different plan'),
+                ([files[0], files[1], self._run_shard(commands, 3, 3, name='native',
+                                                      backend='native')],
+                 'ran with --backend native')]:
+            with self.assertRaises(ValueError) as raised:
+                merge_results(filenames)
+            self.assertIn(message, str(raised.exception))
+
+        with open(files[0]) as input_fh:
+            lines = input_fh.readlines()
+        with open(files[0], 'w') as output_fh:
+            output_fh.writelines(lines[:-1])
+        with self.assertRaises(ValueError) as raised:
+            merge_results(files)
+        self.assertIn('did that shard finish?', str(raised.exception))
+
+    def test_merge_assignments(self):
+        ''' shards that dealt the plan out differently can not be merged '''
+        commands = _commands([f't{x}' for x in range(10)])
+        first = {command_key(x): number % 2 + 1 for (number, x) in enumerate(commands)}
+        second = {command_key(x): (number // 3) % 2 + 1 for (number, x) in enumerate(commands)}
+        files = [self._run_shard(commands, 1, 2, assignment=first, name='first'),
+                 self._run_shard(commands, 2, 2, assignment=second, name='second')]
+        with self.assertRaises(ValueError) as raised:
+            merge_results(files)
+        self.assertIn('same --history-file', str(raised.exception))
+
+        files = [self._run_shard(commands, index, 2, assignment=first) for index in (1, 2)]
+        self.assertEqual(len(merge_results(files)[1]), 15)
+        with open(files[1]) as input_fh:
+            lines = input_fh.readlines()
+        for (changed, message) in [(lines[:3] + lines[-1:], 'never ran'),
+                                   (lines[:3] + lines, 'ran more than once')]:
+            with open(files[1], 'w') as output_fh:
+                output_fh.writelines(changed)
+            with self.assertRaises(ValueError) as raised:
+                merge_results(files)
+            self.assertIn(message, str(raised.exception))
+
+    def test_stopped(self):
+        ''' a shard stopped early still describes the whole plan, and says it stopped '''
+        commands = _commands([f't{x}' for x in range(12)])
+        stopped = self._run_shard(commands, 1, 2, stop=EarlyStop(maxfail=1, breaker=0))
+        finished = self._run_shard(commands, 2, 2)
+        (summary, merged) = merge_results([stopped, finished])
+        self.assertEqual(summary['commands'], 12)
+        self.assertEqual(len(summary['stopped']), 1)
+        self.assertIn('shard 1: stopped after 1 failures', summary['stopped'][0])
+        self.assertLess(len(merged), 18)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+'''
+    Test reading slapd.d trees and evaluating their olcAccess rules in-process
+'''
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.native import Unsupported, Request, evaluate, load_config, parse_access
+from slapaclsuite.native.acl import DNPattern, normalize_dn, tokenize
+from slapaclsuite.native.config import SlapdConfig, Database, read_ldif
+
+
+def write_slapd_d(directory, access, frontend_access=(), rootdn='cn=admin,dc=example'):
+    '''
+        Write a small slapd.d: a frontend, and one mdb database for dc=example.
+        Returns: String+   the slapd.d directory
+    '''
+    config_dir = os.path.join(directory, 'slapd.d')
+    os.makedirs(os.path.join(config_dir, 'cn=config'))
+    with open(os.path.join(config_dir, 'cn=config.ldif'), 'w') as config_fh:
+        config_fh.write('# AUTO-GENERATED FILE - DO NOT EDIT!! Use ldapmodify.\n'
+                        'dn: cn=config\nobjectClass: olcGlobal\ncn: config\n')
+    with open(os.path.join(config_dir, 'cn=config', 'olcDatabase={-1}frontend.ldif'),
+              'w') as config_fh:
+        config_fh.write('dn: olcDatabase={-1}frontend\nolcDatabase: {-1}frontend\n')
+        for (index, rule) in enumerate(frontend_access):
+            config_fh.write(f'olcAccess: {{{index}}}{rule}\n')
+    with open(os.path.join(config_dir, 'cn=config', 'olcDatabase={1}mdb.ldif'),
+              'w') as config_fh:
+        config_fh.write('dn: olcDatabase={1}mdb\nolcDatabase: {1}mdb\n'
+                        'olcSuffix: dc=example\n')
+        if rootdn:
+            config_fh.write(f'olcRootDN: {rootdn}\n')
+        for (index, rule) in enumerate(access):
+            config_fh.write(f'olcAccess: {{{index}}}{rule}\n')
+    return config_dir
+
+
+def check(config, dn, attribute, access, authc='', ssf=0, peername=None):
+    ''' evaluate one check, from plain values '''
+    return evaluate(config, Request.build(authc, dn, attribute, access, ssf=ssf,
+                                          peername=peername))
+
+
+class TestNativeParsing(unittest.TestCase):
+    ''' Class of tests about reading the access language. '''
+
+    def test_tokenize(self):
+        ''' words split on spaces, except in quotes, which go away '''
+        self.assertEqual(tokenize('to dn.base="cn=a b,dc=x" by * read'),
+                         ['to', 'dn.base=cn=a b,dc=x', 'by', '*', 'read'])
+        self.assertEqual(tokenize(r'to dn.regex="^uid=[^,]+\,x$" by * none'),
+                         ['to', r'dn.regex=^uid=[^,]+\,x$', 'by', '*', 'none'])
+        with self.assertRaises(ValueError):
+            tokenize('to dn="x by * read')
+
+    def test_normalize_dn(self):
+        ''' case and spacing do not matter, escaped commas do '''
+        self.assertEqual(normalize_dn('UID=Foo , OU=People,DC=Example'),
+                         'uid=foo,ou=people,dc=example')
+        self.assertEqual(normalize_dn(r'cn=Smith\, John,dc=x'), r'cn=smith\, john,dc=x')
+        self.assertEqual(normalize_dn(' '), '')
+
+    def test_dn_styles(self):
+        ''' each dn style covers what slapd.access(5) says it does '''
+        base = 'ou=people,dc=example'
+        cases = {
+            'dn.base': ['ou=people,dc=example'],
+            'dn.exact': ['ou=people,dc=example'],
+            'dn': ['ou=people,dc=example'],
+            'dn.one': ['uid=a,ou=people,dc=example'],
+            'dn.subtree': ['ou=people,dc=example', 'uid=a,ou=people,dc=example',
+                           'cn=b,uid=a,ou=people,dc=example'],
+            'dn.children': ['uid=a,ou=people,dc=example', 'cn=b,uid=a,ou=people,dc=example'],
+        }
+        candidates = ['dc=example', 'ou=people,dc=example', 'uid=a,ou=people,dc=example',
+                      'cn=b,uid=a,ou=people,dc=example', 'ou=people,dc=other']
+        for (key, expected) in cases.items():
+            pattern = DNPattern(key, base)
+            self.assertEqual([x for x in candidates if pattern.matches(x)], expected, key)
+        pattern = DNPattern('dn.regex', '^uid=[^,]+,ou=people,dc=example$')
+        self.assertEqual([x for x in candidates if pattern.matches(x)],
+                         ['uid=a,ou=people,dc=example'])
+
+    def test_dn_unsupported(self):
+        ''' things we can not evaluate say so '''
+        for (key, value) in [('dn', 'uid=.*,dc=example'), ('dn.level{2}', 'dc=example'),
+                             ('dn.regex', '^uid=[[:alpha:]]+$'), ('dn.regex', 'uid=$1')]:
+            with self.assertRaises(Unsupported):
+                DNPattern(key, value)
+
+    def test_parse_access(self):
+        ''' a rule comes apart into what it covers and its by clauses '''
+        rule = parse_access('{3}to dn.subtree="dc=example" attrs=uid,commonName '
+                            'by self write by users =rs continue by * none break')
+        self.assertEqual(rule.what.attrs, frozenset(['uid', 'cn']))
+        self.assertEqual([x.control for x in rule.bys], ['stop', 'continue', 'break'])
+        self.assertEqual(rule.bys[1].privileges, frozenset('rs'))
+
+    def test_unreadable_rule(self):
+        ''' a rule we can not read raises Unsupported when it is reached '''
+        request = Request.build('', 'dc=example', 'cn', 'read')
+        for text in ['to * by', 'frobnicate', 'to filter=(uid=x) by * read',
+                     'to attrs=@inetOrgPerson by * read']:
+            rule = parse_access(text)
+            with self.assertRaises(Unsupported, msg=text):
+                if rule.applies(request):
+                    rule.mask(request, frozenset())
+
+
+class TestNativeEvaluate(unittest.TestCase):
+    ''' Class of tests about deciding checks. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _config(self, access, frontend_access=()):
+        ''' load a slapd.d with these rules; one per call '''
+        return load_config(write_slapd_d(tempfile.mkdtemp(dir=self.workdir), access,
+                                         frontend_access))
+
+    def test_read_ldif(self):
+        ''' comments, folded lines, and base64 values '''
+        filename = os.path.join(self.workdir, 'x.ldif')
+        encoded = base64.b64encode('to * by * read'.encode('utf-8')).decode('ascii')
+        with open(filename, 'w') as ldif_fh:
+            ldif_fh.write('# comment\ndn: olcDatabase={1}mdb\nolcAccess: {0}to * by\n'
+                          '  * none\nolcAccess:: ' + encoded + '\n\ndn: cn=second\n')
+        entries = read_ldif(filename)
+        self.assertEqual(entries[0]['olcaccess'], ['{0}to * by * none', 'to * by * read'])
+        self.assertEqual(entries[1]['dn'], ['cn=second'])
+
+    def test_load_config(self):
+        ''' databases, in order, with the frontend kept apart '''
+        config = self._config(['{0}to * by * read'], ['to dn.base="" by * read'])
+        self.assertEqual([x.kind for x in config.databases], ['mdb'])
+        self.assertEqual(config.databases[0].rootdn, 'cn=admin,dc=example')
+        self.assertEqual(config.frontend.kind, 'frontend')
+        self.assertIs(config.database_for('uid=x,dc=example'), config.databases[0])
+        self.assertIs(config.database_for(''), config.frontend)
+        with self.assertRaises(Unsupported):
+            config.database_for('dc=other')
+        with self.assertRaises(Unsupported):
+            load_config(os.path.join(self.workdir, 'nonesuch'))
+
+    def test_who_clauses(self):
+        ''' self, anonymous, users and dn styles, in order '''
+        config = self._config([
+            'to attrs=userPassword by self write by anonymous auth by * none',
+            'to dn.subtree="ou=people,dc=example" '
+            'by dn.children="ou=admins,dc=example" write by users read by * none',
+        ])
+        person = 'uid=joe,ou=people,dc=example'
+        self.assertTrue(check(config, person, 'userPassword', 'write', authc=person))
+        self.assertFalse(check(config, person, 'userPassword', 'read',
+                               authc='uid=ann,ou=people,dc=example'))
+        self.assertTrue(check(config, person, 'userPassword', 'auth'))
+        self.assertFalse(check(config, person, 'userPassword', 'read'))
+        self.assertTrue(check(config, person, 'cn', 'write',
+                              authc='uid=boss,ou=admins,dc=example'))
+        self.assertTrue(check(config, person, 'cn', 'read',
+                              authc='uid=ann,ou=people,dc=example'))
+        self.assertFalse(check(config, person, 'cn', 'write',
+                               authc='uid=ann,ou=people,dc=example'))
+        self.assertFalse(check(config, person, 'cn', 'read'))
+        # Nothing covers this entry: implicitly, nobody gets in.
+        self.assertFalse(check(config, 'ou=groups,dc=example', 'cn', 'read',
+                               authc='uid=ann,ou=people,dc=example'))
+
+    def test_peername_and_ssf(self):
+        ''' network and security strength conditions '''
+        config = self._config([
+            'to * by peername.ip=10.0.0.0%255.0.0.0 ssf=128 write '
+            'by peername.ip=10.0.0.0%255.0.0.0 read '
+            'by peername.regex="^IP=192\\.168\\." search by * none',
+        ])
+        self.assertTrue(check(config, 'dc=example', 'cn', 'write', ssf=128,
+                              peername='IP=10.1.2.3'))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'write', ssf=56,
+                               peername='IP=10.1.2.3'))
+        self.assertTrue(check(config, 'dc=example', 'cn', 'read', peername='IP=10.1.2.3'))
+        self.assertTrue(check(config, 'dc=example', 'cn', 'search',
+                              peername='IP=192.168.1.1'))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'read', peername='IP=11.1.2.3'))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'read'))
+
+    def test_continue_and_break(self):
+        ''' privileges add up over continue, and break goes on to the next rule '''
+        config = self._config([
+            'to * by users =s continue by dn.base="uid=joe,dc=example" +r by * none break',
+            'to attrs=cn by users +c',
+        ])
+        joe = 'uid=joe,dc=example'
+        ann = 'uid=ann,dc=example'
+        self.assertTrue(check(config, 'dc=example', 'cn', 'read', authc=joe))
+        self.assertTrue(check(config, 'dc=example', 'cn', 'search', authc=joe))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'compare', authc=joe))
+        # ann gets =s, then `* none break` takes it away, and the next rule gives +c.
+        self.assertFalse(check(config, 'dc=example', 'cn', 'search', authc=ann))
+        self.assertTrue(check(config, 'dc=example', 'cn', 'compare', authc=ann))
+        # anonymous breaks out of the first rule with nothing, then gets nothing.
+        self.assertFalse(check(config, 'dc=example', 'cn', 'compare'))
+
+    def test_break_goes_on(self):
+        ''' break keeps the privileges so far, but a rule that runs out of clauses denies '''
+        config = self._config(['to * by * =d break', 'to * by users +r stop'])
+        self.assertTrue(check(config, 'dc=example', 'cn', 'read', authc='uid=a,dc=example'))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'read'))
+        config = self._config(['to * by * =d break', 'to * by users +r continue'])
+        self.assertFalse(check(config, 'dc=example', 'cn', 'read', authc='uid=a,dc=example'))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'disclose'))
+
+    def test_slapacl_parity(self):
+        ''' the answers slapacl gives, after the implicit "by * none stop" of every rule '''
+        user = 'uid=a,dc=example'
+        for (rules, access, authc, allowed) in [
+                (['to * by users +r continue'], 'read', user, False),
+                (['to * by users +r continue by users +s break', 'to * by * +c'], 'read', user,
+                 True),
+                (['to * by users read continue', 'to * by * +w'], 'read', user, False),
+                (['to * by users =r continue by users +w'], 'write', user, True),
+                (['to * by users =r continue by anonymous +w'], 'read', user, False),
+                (['to * by users read'], 'read', user, True),
+                (['to * by users read'], 'read', '', False)]:
+            config = self._config(rules)
+            self.assertEqual(check(config, 'dc=example', 'cn', access, authc=authc), allowed,
+                             f'{rules}: {access} by "{authc}"')
+
+    def test_levels(self):
+        ''' each level includes the ones below it, and write covers add and delete '''
+        config = self._config(['to * by * add'])
+        self.assertTrue(check(config, 'dc=example', 'entry', 'add'))
+        self.assertTrue(check(config, 'dc=example', 'entry', 'read'))
+        self.assertFalse(check(config, 'dc=example', 'entry', 'delete'))
+        self.assertFalse(check(config, 'dc=example', 'entry', 'write'))
+        with self.assertRaises(Unsupported):
+            check(config, 'dc=example', 'entry', 'frobnicate')
+
+    def test_rootdn_frontend_and_default(self):
+        ''' rootdn may do anything; frontend rules come last; no rules means read '''
+        config = self._config(['to dn.base="dc=example" by * none'],
+                              ['to * by users read'])
+        self.assertTrue(check(config, 'dc=example', 'cn', 'manage',
+                              authc='cn=Admin,dc=Example'))
+        self.assertFalse(check(config, 'dc=example', 'cn', 'read', authc='uid=a,dc=example'))
+        self.assertTrue(check(config, 'ou=x,dc=example', 'cn', 'read',
+                              authc='uid=a,dc=example'))
+        empty = SlapdConfig([Database(1, 'mdb', ['dc=example'], None, [])], None)
+        self.assertTrue(check(empty, 'dc=example', 'cn', 'read'))
+        self.assertFalse(check(empty, 'dc=example', 'cn', 'write'))
+
+    def test_unsupported_only_when_reached(self):
+        ''' a rule we can not evaluate only matters to checks that reach it '''
+        config = self._config([
+            'to dn.subtree="ou=people,dc=example" by group="cn=admins,dc=example" write '
+            'by * read',
+            'to * by * read',
+        ])
+        self.assertTrue(check(config, 'ou=groups,dc=example', 'cn', 'read'))
+        with self.assertRaises(Unsupported):
+            check(config, 'uid=a,ou=people,dc=example', 'cn', 'read')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+'''
+    Test the in-process NativeBackend
+'''
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from tests.test_60_native_acl import write_slapd_d
+from slapaclsuite.commands import run_tests
+from slapaclsuite.native import NativeBackend, Unsupported
+from slapaclsuite.native.backend import parse_command
+
+
+class TestNativeBackend(unittest.TestCase):
+    ''' Class of tests about answering slapacl command lines in-process. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.config_dir = write_slapd_d(self.workdir, [
+            'to attrs=userPassword by self write by anonymous auth by * none',
+            'to dn.subtree="ou=people,dc=example" by group="cn=staff,dc=example" read '
+            'by * none',
+            'to * by users read by * none',
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _script(self, *args):
+        ''' a slapacl command line against our slapd.d '''
+        return ['slapacl', '-F', self.config_dir] + list(args)
+
+    def test_parse_command(self):
+        ''' the options iter_commands uses come apart '''
+        parsed = parse_command(['slapacl', '-Fslapd.d', '-D', 'uid=a,dc=x', '-b', 'dc=x',
+                                '-u', '-o', 'ssf=128', '-o', 'peername=IP=1.2.3.4',
+                                'uid/read', 'cn/write:bob'])
+        self.assertEqual(parsed, {'config_dir': 'slapd.d', 'authc': 'uid=a,dc=x',
+                                  'base': 'dc=x', 'ssf': 128, 'peername': 'IP=1.2.3.4',
+                                  'attributes': [('uid', 'read', None),
+                                                 ('cn', 'write', 'bob')]})
+        for script in [['slapacl', '-f', 'slapd.conf', '-b', 'dc=x', 'uid/read'],
+                       ['slapacl', '-F', 'slapd.d', '-b', 'dc=x', 'uid'],
+                       ['slapacl', '-F', 'slapd.d', '-b', 'dc=x', '-o', 'tls_ssf=1', 'uid/read'],
+                       ['slapacl', '-F', 'slapd.d', '-b', 'dc=x', '-U', 'joe', 'uid/read'],
+                       ['slapacl', '-F', 'slapd.d', 'uid/read']]:
+            with self.assertRaises(Unsupported, msg=script):
+                parse_command(script)
+
+    def test_answer(self):
+        ''' answers look like slapacl's '''
+        backend = NativeBackend()
+        result = backend.execute(self._script('-b', 'uid=a,dc=example', 'userPassword/auth',
+                                              'cn/read'), {'PATH': '/usr/sbin'})
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stderr, b'authcDN: ""\nauth access to userPassword: ALLOWED\n'
+                                        b'read access to cn: DENIED\n')
+        self.assertEqual(backend.answered, 1)
+
+    def test_fallback(self):
+        ''' what we can not decide goes to slapacl, and we count why '''
+        fallback = mock.Mock(return_value=subprocess.CompletedProcess(
+            args=[], returncode=0, stderr=b'read access to cn: ALLOWED\n'))
+        backend = NativeBackend(fallback=fallback)
+        script = self._script('-b', 'uid=a,ou=people,dc=example', 'cn/read')
+        result = backend.execute(script, {'PATH': '/usr/sbin'})
+        fallback.assert_called_once_with(script, {'PATH': '/usr/sbin'})
+        self.assertEqual(result.stderr, b'read access to cn: ALLOWED\n')
+        self.assertEqual(backend.answered, 0)
+        self.assertEqual(list(backend.fallbacks.values()), [1])
+        fake_out = StringIO()
+        backend.report(stream=fake_out)
+        self.assertIn('0 commands answered in-process, 1 by slapacl', fake_out.getvalue())
+        self.assertIn('1 x by group=cn=staff,dc=example', fake_out.getvalue())
+
+    def test_missing_config(self):
+        ''' a config we can not read is left for slapacl to complain about '''
+        fallback = mock.Mock(return_value=subprocess.CalledProcessError(1, ['slapacl']))
+        backend = NativeBackend(fallback=fallback)
+        result = backend.execute(['slapacl', '-F', '/nonesuch', '-b', 'dc=example',
+                                  'cn/read'], {})
+        self.assertIsInstance(result, subprocess.CalledProcessError)
+
+    def test_run_tests(self):
+        ''' run_tests takes a backend in place of spawning slapacl '''
+        test_data = [('pass', {'script': self._script('-b', 'dc=example', '-D',
+                                                      'uid=a,dc=example', 'cn/read'),
+                               'path': ['/usr/sbin'], 'expects': 'ALLOWED'}),
+                     ('fail', {'script': self._script('-b', 'dc=example', 'cn/read'),
+                               'path': ['/usr/sbin'], 'expects': 'ALLOWED'})]
+        with mock.patch.object(subprocess, 'run') as mock_run, \
+                mock.patch('sys.stdout', new=StringIO()):
+            statuses = run_tests(test_data, jobs=2, backend=NativeBackend())
+        mock_run.assert_not_called()
+        self.assertEqual(statuses, ['PASS', 'FAIL'])
+
+    def test_cross_check(self):
+        ''' sampled answers are checked against slapacl, and disagreements reported '''
+        slapacl_says = {'uid=a,dc=example': b'read access to cn: ALLOWED\n',
+                        'uid=b,dc=example': b'read access to cn: DENIED\n'}
+        fallback = mock.Mock(side_effect=lambda script, env: subprocess.CompletedProcess(
+            args=script, returncode=0, stderr=slapacl_says[script[-2]]))
+        backend = NativeBackend(fallback=fallback, sample_size=5, seed=1)
+        for dn in ['uid=a,dc=example', 'uid=b,dc=example']:
+            backend.execute(self._script('-D', 'uid=x,dc=example', '-b', dn, 'cn/read'), {})
+        fallback.assert_not_called()
+        self.assertEqual(len(backend.sample), 2)
+        mismatches = backend.cross_check()
+        self.assertEqual(fallback.call_count, 2)
+        self.assertEqual([(x[0][-2], x[1], x[2]) for x in mismatches],
+                         [('uid=b,dc=example', ['ALLOWED'], ['DENIED'])])
+
+    def test_sample_size(self):
+        ''' the sample never grows past its size '''
+        backend = NativeBackend(sample_size=3, seed=1)
+        for index in range(50):
+            backend.execute(self._script('-b', f'uid={index},dc=example', 'cn/read'), {})
+        self.assertEqual(backend.answered, 50)
+        self.assertEqual(len(backend.sample), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
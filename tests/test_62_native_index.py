@@ -0,0 +1,152 @@
+'''
+    Test the DN index over olcAccess rules
+'''
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+import mock
+import tests.context  # noqa F401 pylint: disable=unused-import
+from tests.test_60_native_acl import write_slapd_d
+from slapaclsuite.native import Request, Unsupported, evaluate, load_config, load_index
+from slapaclsuite.native import RuleIndex, rule_coverage, report_coverage
+from slapaclsuite.native import index as index_module
+
+RULES = [
+    'to dn.base="dc=example" by * read',
+    'to dn.regex="^uid=[^,]+,ou=people,dc=example$" attrs=userPassword by self write '
+    'by anonymous auth by * none',
+    'to dn.one="ou=people,dc=example" by users read by * none break',
+    'to dn.children="ou=groups,dc=example" by dn.base="uid=boss,ou=people,dc=example" write',
+    'to dn.subtree="ou=people,dc=example" attrs=cn by * search',
+    'to dn.subtree="ou=deep,ou=people,dc=example" by * compare',
+    'to attrs=mail by users read',
+    'to * by users +d',
+]
+
+
+class TestRuleIndex(unittest.TestCase):
+    ''' Class of tests about finding the rules for a DN quickly. '''
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.config_dir = write_slapd_d(self.workdir, RULES, ['to * by * auth'])
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_candidates(self):
+        ''' only rules whose DN and scope fit come back, in rule order '''
+        index = RuleIndex(load_config(self.config_dir))
+        database = index.database_for('dc=example')
+        expected = {
+            'dc=example': [0, 6, 7, 8],
+            'ou=people,dc=example': [4, 6, 7, 8],
+            'uid=a,ou=people,dc=example': [1, 2, 4, 6, 7, 8],
+            'cn=x,uid=a,ou=people,dc=example': [4, 6, 7, 8],
+            'ou=deep,ou=people,dc=example': [2, 4, 5, 6, 7, 8],
+            'ou=groups,dc=example': [6, 7, 8],
+            'cn=staff,ou=groups,dc=example': [3, 6, 7, 8],
+            'ou=other,dc=example': [6, 7, 8],
+        }
+        for (ndn, positions) in expected.items():
+            self.assertEqual(index.candidates(database, ndn), positions, ndn)
+        (_, rules) = index.lookup('dc=example')
+        self.assertEqual([x.text for x in rules[:2]], [RULES[0], RULES[6]])
+
+    def test_same_answers(self):
+        ''' the index never changes an answer '''
+        config = load_config(self.config_dir)
+        index = RuleIndex(config)
+        chooser = random.Random(7)
+        dns = ['dc=example', 'ou=people,dc=example', 'uid=a,ou=people,dc=example',
+               'uid=boss,ou=people,dc=example', 'ou=deep,ou=people,dc=example',
+               'cn=x,ou=deep,ou=people,dc=example', 'ou=groups,dc=example',
+               'cn=staff,ou=groups,dc=example', 'ou=other,dc=example']
+        for _ in range(500):
+            request = Request.build(chooser.choice(['', 'uid=boss,ou=people,dc=example',
+                                                    'uid=a,ou=people,dc=example']),
+                                    chooser.choice(dns),
+                                    chooser.choice(['cn', 'mail', 'userPassword', 'uid']),
+                                    chooser.choice(['read', 'write', 'auth', 'search',
+                                                    'compare', 'disclose']))
+            self.assertEqual(evaluate(index, request), evaluate(config, request), request)
+
+    def test_load_index_saved(self):
+        ''' an index is built once per config, and rebuilt when the config changes '''
+        cache_dir = os.path.join(self.workdir, 'cache')
+        first = load_index(self.config_dir, cache_dir)
+        with mock.patch.object(index_module, 'load_config') as mock_load_config:
+            second = load_index(self.config_dir, cache_dir)
+        mock_load_config.assert_not_called()
+        self.assertIsNot(first, second)
+        request = Request.build('uid=a,ou=people,dc=example', 'uid=a,ou=people,dc=example',
+                                'userPassword', 'write')
+        self.assertTrue(evaluate(second, request))
+
+        with open(os.path.join(self.config_dir, 'cn=config', 'olcDatabase={1}mdb.ldif'),
+                  'a') as config_fh:
+            config_fh.write('olcAccess: {99}to * by * manage\n')
+        third = load_index(self.config_dir, cache_dir)
+        self.assertEqual(len(third.config.databases[0].access), len(RULES) + 1)
+
+        # A change to the code that parses the config is as good as a change to it.
+        with mock.patch.object(index_module, '_code_fingerprint', return_value='changed'), \
+                mock.patch.object(index_module, 'load_config',
+                                  wraps=index_module.load_config) as mock_load_config:
+            load_index(self.config_dir, cache_dir)
+        mock_load_config.assert_called_once_with(self.config_dir)
+
+    def test_load_index_bad_file(self):
+        ''' a damaged saved index is rebuilt, not trusted '''
+        cache_dir = os.path.join(self.workdir, 'cache')
+        load_index(self.config_dir, cache_dir)
+        index_dir = os.path.join(cache_dir, 'native')
+        for filename in os.listdir(index_dir):
+            with open(os.path.join(index_dir, filename), 'wb') as index_fh:
+                index_fh.write(b'garbage')
+        self.assertIsInstance(load_index(self.config_dir, cache_dir), RuleIndex)
+        with self.assertRaises(Unsupported):
+            load_index(os.path.join(self.workdir, 'nonesuch'), cache_dir)
+
+    def test_rule_coverage(self):
+        ''' which rules a suite's DNs reach, and which they miss '''
+        index = RuleIndex(load_config(self.config_dir))
+        (rows, unplaced) = rule_coverage(index, ['uid=a,ou=people,dc=example',
+                                                 'UID=A, ou=people,dc=example',
+                                                 'dc=example', 'dc=elsewhere'])
+        counts = {(database.kind, position): count
+                  for (database, position, _, count) in rows}
+        self.assertEqual(counts[('mdb', 0)], 1)
+        self.assertEqual(counts[('mdb', 1)], 2)
+        self.assertEqual(counts[('mdb', 2)], 2)
+        self.assertEqual(counts[('mdb', 3)], 0)
+        self.assertEqual(counts[('frontend', 0)], 0)
+        self.assertEqual(unplaced, ['dc=elsewhere'])
+
+    def test_report_coverage(self):
+        ''' the report names the rules nothing reaches '''
+        scripting = mock.Mock()
+        scripting.render.return_value = {'executable': 'slapacl',
+                                         'default_arguments': ['-F', self.config_dir]}
+        suite = mock.Mock()
+        suite.iter_render.return_value = [
+            {'requestDN': [('', ['-b', 'cn=a,ou=groups,dc=example'])]}]
+        fake_out = StringIO()
+        self.assertTrue(report_coverage({'scripting': scripting, 'tests': suite},
+                                        stream=fake_out))
+        self.assertIn('# acl coverage: 4 of 10 olcAccess rules', fake_out.getvalue())
+        self.assertIn('COVERED # mdb{1} rule 3: 1 DNs: ' + RULES[3], fake_out.getvalue())
+        self.assertIn('UNCOVERED # mdb{1} rule 0: 0 DNs', fake_out.getvalue())
+
+        scripting.render.return_value = {'executable': 'slapacl', 'default_arguments': []}
+        fake_out = StringIO()
+        self.assertFalse(report_coverage({'scripting': scripting, 'tests': suite},
+                                         stream=fake_out))
+        self.assertIn('name no -F slapd.d', fake_out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
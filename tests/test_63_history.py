@@ -0,0 +1,164 @@
+'''
+    Test the duration history, and shards planned from it
+'''
+import json
+import os
+import tempfile
+import unittest
+import tests.context  # noqa F401 pylint: disable=unused-import
+from slapaclsuite.history import PRUNE_AFTER, History, guess_cost, last_failed, plan_shards, \
+    prioritize
+from slapaclsuite.results import Result
+from slapaclsuite.shard import Shard, command_key, shard_of
+
+
+def _command(name, fetch=False, checks=None):
+    ''' one command, as iter_commands gives them '''
+    script = ['slapacl', '-F', '/etc/slapd.d', '-b', f'cn={name}', 'cn/read']
+    if not fetch:
+        script.insert(3, '-u')
+    entry = {'script': script, 'path': [], 'expects': 'ALLOWED'}
+    if checks:
+        entry['checks'] = checks
+    return (name, entry)
+
+
+def _result(command, seconds, status='PASS', cached=False, position=0):
+    ''' the Result of a command that took `seconds` '''
+    (description, entry) = command
+    return Result(description, description, entry['script'], entry['expects'], 'ALLOWED',
+                  status, seconds, None, cached, position)
+
+
+class TestHistory(unittest.TestCase):
+    ''' Class of tests about remembering how long commands took. '''
+
+    def test_record_and_save(self):
+        ''' timings are smoothed, kept, and read back; only real answers count '''
+        (fast, slow) = (_command('fast'), _command('slow'))
+        with tempfile.TemporaryDirectory() as workdir:
+            filename = os.path.join(workdir, 'sub', 'durations.json')
+            history = History(filename)
+            history.save()
+            self.assertFalse(os.path.exists(filename))
+            for result in [_result(fast, 0.1), _result(slow, 4.0), _result(slow, 2.0),
+                           _result(slow, 9.0, cached=True), _result(slow, 9.0, 'ERROR'),
+                           _result(slow, 9.0, position=1)]:
+                history.record(result)
+            history.save()
+            with open(filename) as input_fh:
+                self.assertEqual(len(json.load(input_fh)['durations']['slapacl']), 2)
+
+            reread = History(filename)
+            self.assertEqual(reread.estimate(fast), 0.1)
+            self.assertEqual(reread.estimate(slow), 3.0)
+
+            with open(filename, 'w') as output_fh:
+                output_fh.write('not json')
+            self.assertEqual(len(History(filename)), 0)
+
+    def test_backends_and_pruning(self):
+        ''' each backend's durations are its own, and commands long gone are dropped '''
+        (kept, gone) = (_command('kept'), _command('gone'))
+        with tempfile.TemporaryDirectory() as workdir:
+            filename = os.path.join(workdir, 'history.json')
+            native = History(filename, backend='native')
+            native.record(_result(kept, 0.00002))
+            native.record(_result(gone, 0.00002))
+            native.save()
+            slapacl = History(filename)
+            self.assertEqual(len(slapacl), 0)
+            self.assertEqual(slapacl.estimate(kept), 0.05)
+            self.assertEqual(slapacl.status(gone), 'PASS')
+            slapacl.record(_result(kept, 2.0))
+            slapacl.save()
+            self.assertEqual(History(filename, backend='native').estimate(kept), 0.00002)
+            self.assertEqual(History(filename).estimate(kept), 2.0)
+
+            for _ in range(PRUNE_AFTER - 2):
+                history = History(filename)
+                history.record(_result(kept, 2.0))
+                history.save()
+            self.assertEqual(History(filename).status(gone), 'PASS')
+            history = History(filename)
+            history.record(_result(kept, 2.0))
+            history.save()
+            history = History(filename, backend='native')
+            self.assertIsNone(history.status(gone))
+            self.assertEqual(len(history), 1)
+
+    def test_guesses(self):
+        ''' commands never timed are guessed from what they ask for, and what others took '''
+        self.assertEqual(guess_cost(_command('plain'), 1.0), 1.0)
+        self.assertEqual(guess_cost(_command('fetch', fetch=True), 1.0), 3.0)
+        self.assertEqual(guess_cost(_command('batch', checks=['a', 'b', 'c']), 1.0), 1.6)
+        peer = _command('peer')
+        peer[1]['script'][3:3] = ['-o', 'peername=IP=10.0.0.1', '-o', 'ssf=128']
+        self.assertEqual(guess_cost(peer, 1.0), 1.4)
+
+        history = History(None)
+        self.assertEqual(history.estimate(_command('plain')), 0.05)
+        for (number, seconds) in enumerate([0.2, 0.4, 9.0]):
+            history.record(_result(_command(f'timed{number}'), seconds))
+        self.assertAlmostEqual(history.estimate(_command('new', fetch=True)), 1.2)
+
+    def test_statuses(self):
+        ''' how each command ended last time, kept and read back, and what to run first '''
+        commands = [_command(f'test{x}') for x in range(6)]
+        batch = _command('batch', checks=['batch cn', 'batch sn'])
+        with tempfile.TemporaryDirectory() as workdir:
+            filename = os.path.join(workdir, 'history.json')
+            history = History(filename)
+            for result in [_result(commands[0], 0.1), _result(commands[1], 0.1, 'FAIL'),
+                           _result(commands[2], 0.1, 'ERROR', cached=True),
+                           _result(commands[3], 0.1), _result(batch, 0.1),
+                           _result(batch, 0.1, 'FAIL', position=1)]:
+                history.record(result)
+            history.save()
+            history = History(filename)
+            self.assertEqual([history.status(x) for x in commands + [batch]],
+                             ['PASS', 'FAIL', 'ERROR', 'PASS', None, None, 'FAIL'])
+
+        plan = commands + [batch]
+        self.assertEqual([x[0] for x in last_failed(plan, history)], ['test1', 'test2', 'batch'])
+        self.assertEqual([x[0] for x in prioritize(plan, history, failed_first=True)],
+                         ['test1', 'test2', 'batch', 'test0', 'test3', 'test4', 'test5'])
+        self.assertEqual([x[0] for x in prioritize(plan, history, changed_first=True)],
+                         ['test4', 'test5', 'test0', 'test1', 'test2', 'test3', 'batch'])
+        self.assertEqual([x[0] for x in prioritize(plan, history, failed_first=True,
+                                                   changed_first=True)],
+                         ['test1', 'test2', 'batch', 'test4', 'test5', 'test0', 'test3'])
+
+        history.record(_result(commands[1], 0.1))
+        self.assertEqual(history.status(commands[1]), 'PASS')
+
+    def test_plan_shards(self):
+        ''' longest first, to the least loaded shard: even shards, the same every time '''
+        commands = [_command(f'test{x}') for x in range(200)]
+        costs = {command_key(x): 5.0 if number % 20 == 0 else 0.1
+                 for (number, x) in enumerate(commands)}
+
+        def estimate(command):
+            ''' what each command is known to take '''
+            return costs[command_key(command)]
+
+        (assignment, loads) = plan_shards(commands, 4, estimate)
+        self.assertEqual(sorted(set(assignment.values())), [1, 2, 3, 4])
+        self.assertAlmostEqual(sum(loads), 69.0)
+        self.assertLess(max(loads) - min(loads), 0.2)
+        self.assertEqual(plan_shards(list(reversed(commands)), 4, estimate)[0], assignment)
+
+        hashed = [sum(costs[command_key(x)] for x in commands if shard_of(x, 4) == shard)
+                  for shard in (1, 2, 3, 4)]
+        self.assertGreater(max(hashed), max(loads))
+
+        shards = [[x[0] for x in Shard(index, 4, assignment=assignment).select(commands)]
+                  for index in (1, 2, 3, 4)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(x[0] for x in commands))
+        for (shard, load) in zip(shards, loads):
+            self.assertAlmostEqual(sum(costs[command_key(x)] for x in commands
+                                       if x[0] in shard), load)
+
+
+if __name__ == '__main__':
+    unittest.main()
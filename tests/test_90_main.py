@@ -2,11 +2,19 @@
     Test main
 '''
 
+import json
+import os
+import tempfile
 import unittest
 from io import StringIO
 import mock
 import tests.context  # noqa F401 pylint: disable=unused-import
 import slapaclsuite.__main__
+from slapaclsuite.cache import default_cache_dir
+from slapaclsuite.history import PRUNE_AFTER, History, last_failed, prioritize
+from slapaclsuite.native import NativeBackend
+from slapaclsuite.results import Result
+from slapaclsuite.yaml_input_validator.administrative import AdministrativeSectionValidator
 
 
 class TestMain(unittest.TestCase):
@@ -26,15 +34,15 @@ class TestMain(unittest.TestCase):
                                side_effect=IOError) as mock_ingest_yaml_file, \
                 mock.patch.object(slapaclsuite, 'validate_input',
                                   return_value='some2') as mock_validate_input, \
-                mock.patch.object(slapaclsuite, 'generate_commands',
-                                  return_value='some3') as mock_generate_commands, \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3') as mock_iter_commands, \
                 mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
             retval = slapaclsuite.__main__.main(['scriptname', 'notafile.yaml'])
         mock_ingest_yaml_file.assert_called_once_with('notafile.yaml')
         mock_validate_input.assert_not_called()
-        mock_generate_commands.assert_not_called()
+        mock_iter_commands.assert_not_called()
         mock_run_tests.assert_not_called()
-        self.assertFalse(retval)
+        self.assertEqual(retval, 1)
 
     def test_10_some_file(self):
         ''' Test a basic run '''
@@ -42,15 +50,20 @@ class TestMain(unittest.TestCase):
                                return_value='some1') as mock_ingest_yaml_file, \
                 mock.patch.object(slapaclsuite, 'validate_input',
                                   return_value='some2') as mock_validate_input, \
-                mock.patch.object(slapaclsuite, 'generate_commands',
-                                  return_value='some3') as mock_generate_commands, \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3') as mock_iter_commands, \
                 mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
             retval = slapaclsuite.__main__.main(['scriptname', 'somefile.yaml'])
         mock_ingest_yaml_file.assert_called_once_with('somefile.yaml')
-        mock_validate_input.assert_called_once_with('some1', verbose=False)
-        mock_generate_commands.assert_called_once_with('some2')
-        mock_run_tests.assert_called_once_with('some3', verbose=False, noop=False)
-        self.assertTrue(retval)
+        mock_validate_input.assert_called_once_with('some1', verbose=False,
+                                                    jobs=1, cache_dir=default_cache_dir(),
+                                                    base_dir=os.getcwd())
+        mock_iter_commands.assert_called_once_with('some2', batch=False, sample=None)
+        mock_run_tests.assert_called_once_with('some3', verbose=False, noop=False,
+                                               jobs=os.cpu_count() or 1,
+                                               cache=mock.ANY, total=None, stop=mock.ANY,
+                                               backend=None, record=mock.ANY, schedule=None)
+        self.assertEqual(retval, 0)
 
     def test_11_noop(self):
         ''' Test a basic noop run '''
@@ -58,15 +71,20 @@ class TestMain(unittest.TestCase):
                                return_value='some1') as mock_ingest_yaml_file, \
                 mock.patch.object(slapaclsuite, 'validate_input',
                                   return_value='some2') as mock_validate_input, \
-                mock.patch.object(slapaclsuite, 'generate_commands',
-                                  return_value='some3') as mock_generate_commands, \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3') as mock_iter_commands, \
                 mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
             retval = slapaclsuite.__main__.main(['scriptname', '--noop', 'somefile.yaml'])
         mock_ingest_yaml_file.assert_called_once_with('somefile.yaml')
-        mock_validate_input.assert_called_once_with('some1', verbose=False)
-        mock_generate_commands.assert_called_once_with('some2')
-        mock_run_tests.assert_called_once_with('some3', verbose=False, noop=True)
-        self.assertTrue(retval)
+        mock_validate_input.assert_called_once_with('some1', verbose=False,
+                                                    jobs=1, cache_dir=default_cache_dir(),
+                                                    base_dir=os.getcwd())
+        mock_iter_commands.assert_called_once_with('some2', batch=False, sample=None)
+        mock_run_tests.assert_called_once_with('some3', verbose=False, noop=True,
+                                               jobs=os.cpu_count() or 1,
+                                               cache=mock.ANY, total=None, stop=mock.ANY,
+                                               backend=None, record=mock.ANY, schedule=None)
+        self.assertEqual(retval, 0)
 
     def test_12_verbose(self):
         ''' Test a basic verbose run '''
@@ -74,12 +92,551 @@ class TestMain(unittest.TestCase):
                                return_value='some1') as mock_ingest_yaml_file, \
                 mock.patch.object(slapaclsuite, 'validate_input',
                                   return_value='some2') as mock_validate_input, \
-                mock.patch.object(slapaclsuite, 'generate_commands',
-                                  return_value='some3') as mock_generate_commands, \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3') as mock_iter_commands, \
                 mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
             retval = slapaclsuite.__main__.main(['scriptname', '--verbose', 'somefile.yaml'])
         mock_ingest_yaml_file.assert_called_once_with('somefile.yaml')
-        mock_validate_input.assert_called_once_with('some1', verbose=True)
-        mock_generate_commands.assert_called_once_with('some2')
-        mock_run_tests.assert_called_once_with('some3', verbose=True, noop=False)
-        self.assertTrue(retval)
+        mock_validate_input.assert_called_once_with('some1', verbose=True,
+                                                    jobs=1, cache_dir=default_cache_dir(),
+                                                    base_dir=os.getcwd())
+        mock_iter_commands.assert_called_once_with('some2', batch=False, sample=None)
+        mock_run_tests.assert_called_once_with('some3', verbose=True, noop=False,
+                                               jobs=os.cpu_count() or 1,
+                                               cache=mock.ANY, total=None, stop=mock.ANY,
+                                               backend=None, record=mock.ANY, schedule=None)
+        self.assertEqual(retval, 0)
+
+    def test_13_jobs(self):
+        ''' Test a run with an explicit worker count '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2') as mock_validate_input, \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3'), \
+                mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
+            retval = slapaclsuite.__main__.main(['scriptname', '--jobs', '4', '--validate-jobs',
+                                                 '2', 'somefile.yaml'])
+        mock_validate_input.assert_called_once_with('some1', verbose=False, jobs=2,
+                                                    cache_dir=mock.ANY, base_dir=os.getcwd())
+        mock_run_tests.assert_called_once_with('some3', verbose=False, noop=False, jobs=4,
+                                               cache=mock.ANY, total=None, stop=mock.ANY,
+                                               backend=None, record=mock.ANY, schedule=None)
+        self.assertEqual(retval, 0)
+
+    def test_14_bad_jobs(self):
+        ''' A worker count below 1 is a usage error '''
+        with mock.patch('sys.stderr', new=StringIO()) as fake_out, \
+                self.assertRaises(SystemExit) as callreturn:
+            slapaclsuite.__main__.main(['scriptname', '--jobs', '0', 'somefile.yaml'])
+        self.assertEqual(callreturn.exception.code, 2)
+        self.assertIn('must be 1 or greater', fake_out.getvalue())
+
+    def test_15_batch(self):
+        ''' Test a run that batches requestattrs '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3') as mock_iter_commands, \
+                mock.patch.object(slapaclsuite, 'run_tests'):
+            retval = slapaclsuite.__main__.main(['scriptname', '--batch', 'somefile.yaml'])
+        mock_iter_commands.assert_called_once_with('some2', batch=True, sample=None)
+        self.assertEqual(retval, 0)
+
+    def test_16_cache_options(self):
+        ''' The result cache is on by default, and can be refreshed or turned off '''
+        for (args, refresh) in [([], False), (['--refresh-cache'], True), (['--no-cache'], None)]:
+            with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                                   return_value='some1'), \
+                    mock.patch.object(slapaclsuite, 'validate_input',
+                                      return_value='some2'), \
+                    mock.patch.object(slapaclsuite, 'iter_commands',
+                                      return_value='some3'), \
+                    mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
+                retval = slapaclsuite.__main__.main(['scriptname', '--cache-dir', '/nonexistent'] +
+                                                    args + ['somefile.yaml'])
+            self.assertEqual(retval, 0)
+            cache = mock_run_tests.call_args[1]['cache']
+            if refresh is None:
+                self.assertIsNone(cache)
+            else:
+                self.assertEqual(cache.directory, '/nonexistent')
+                self.assertEqual(cache.refresh, refresh)
+
+    def test_17_cache_options_exclusive(self):
+        ''' --no-cache and --refresh-cache contradict each other '''
+        with mock.patch('sys.stderr', new=StringIO()), \
+                self.assertRaises(SystemExit) as callreturn:
+            slapaclsuite.__main__.main(['scriptname', '--no-cache', '--refresh-cache',
+                                        'somefile.yaml'])
+        self.assertEqual(callreturn.exception.code, 2)
+
+    def test_18_incremental(self):
+        ''' An incremental run hands the work to run_incremental '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'iter_commands') as mock_iter_commands, \
+                mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests, \
+                mock.patch.object(slapaclsuite, 'run_incremental') as mock_run_incremental:
+            retval = slapaclsuite.__main__.main(['scriptname', '--incremental', '--no-cache',
+                                                 '--state-file', '/tmp/state.json',
+                                                 'somefile.yaml'])
+        mock_iter_commands.assert_not_called()
+        mock_run_tests.assert_not_called()
+        mock_run_incremental.assert_called_once_with('some2', '/tmp/state.json',
+                                                     verbose=False, noop=False,
+                                                     jobs=os.cpu_count() or 1,
+                                                     cache=None, batch=False,
+                                                     progress=False, timings=None,
+                                                     stop=mock.ANY, backend=None)
+        self.assertEqual(retval, 0)
+
+    def test_19_progress(self):
+        ''' With --progress, main counts the commands for run_tests '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'count_commands',
+                                  return_value=42) as mock_count_commands, \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3'), \
+                mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests:
+            retval = slapaclsuite.__main__.main(['scriptname', '--progress', '--no-cache',
+                                                 'somefile.yaml'])
+        mock_count_commands.assert_called_once_with('some2', batch=False)
+        mock_run_tests.assert_called_once_with('some3', verbose=False, noop=False,
+                                               jobs=os.cpu_count() or 1,
+                                               cache=None, total=42, stop=mock.ANY,
+                                               backend=None, record=None, schedule=None)
+        self.assertEqual(retval, 0)
+
+    def test_20_timings(self):
+        ''' --timings times the run and prints a report; --timings-json writes one '''
+        with tempfile.TemporaryDirectory() as workdir:
+            json_file = os.path.join(workdir, 'timings.json')
+            with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                                   return_value='some1'), \
+                    mock.patch.object(slapaclsuite, 'validate_input',
+                                      return_value='some2'), \
+                    mock.patch.object(slapaclsuite, 'iter_commands',
+                                      return_value=['some3']), \
+                    mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests, \
+                    mock.patch('sys.stdout', new=StringIO()) as fake_out:
+                retval = slapaclsuite.__main__.main(['scriptname', '--timings', '--no-cache',
+                                                     '--timings-json', json_file,
+                                                     'somefile.yaml'])
+            with open(json_file) as json_fh:
+                report = json.load(json_fh)
+        self.assertEqual(retval, 0)
+        self.assertIsInstance(mock_run_tests.call_args[1]['timings'], slapaclsuite.Timings)
+        self.assertIn('# Timings', fake_out.getvalue())
+        self.assertEqual(list(report['phases']), ['ingest', 'validate', 'run'])
+
+    def test_21_exit_status(self):
+        ''' failures, and runs that were stopped early, exit non-zero '''
+        def stopped(*_args, **kwargs):
+            ''' pretend the breaker tripped '''
+            kwargs['stop'].reason = 'stopped'
+            return ['ERROR']
+        for (run_tests, expected) in [(mock.Mock(return_value=['PASS', 'PASS']), 0),
+                                      (mock.Mock(return_value=['PASS', 'FAIL']), 1),
+                                      (mock.Mock(side_effect=stopped), 3)]:
+            with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                                   return_value='some1'), \
+                    mock.patch.object(slapaclsuite, 'validate_input',
+                                      return_value='some2'), \
+                    mock.patch.object(slapaclsuite, 'iter_commands',
+                                      return_value='some3'), \
+                    mock.patch.object(slapaclsuite, 'run_tests', new=run_tests):
+                retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                     '--maxfail', '5', '--breaker', '0',
+                                                     'somefile.yaml'])
+            self.assertEqual(retval, expected)
+            stop = run_tests.call_args[1]['stop']
+            self.assertEqual((stop.maxfail, stop.breaker), (5, 0))
+
+    def test_22_native_backend(self):
+        ''' --backend native hands run_tests a NativeBackend, and --cross-check needs one '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value='some3'), \
+                mock.patch.object(slapaclsuite, 'run_tests',
+                                  return_value=['PASS']) as mock_run_tests, \
+                mock.patch.object(NativeBackend, 'cross_check',
+                                  return_value=[(['slapacl', 'x'], ['ALLOWED'],
+                                                 ['DENIED'])]), \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                 '--backend', 'native', '--cross-check', '5',
+                                                 'somefile.yaml'])
+        backend = mock_run_tests.call_args[1]['backend']
+        self.assertIsInstance(backend, NativeBackend)
+        self.assertEqual(backend.sample_size, 5)
+        self.assertIn('DISAGREE # slapacl x', fake_out.getvalue())
+        self.assertEqual(retval, 1)
+
+        with mock.patch('sys.stderr', new=StringIO()) as fake_err, \
+                self.assertRaises(SystemExit) as callreturn:
+            slapaclsuite.__main__.main(['scriptname', '--cross-check', '5', 'somefile.yaml'])
+        self.assertEqual(callreturn.exception.code, 2)
+        self.assertIn('--cross-check needs --backend native', fake_err.getvalue())
+
+    def test_23_acl_coverage(self):
+        ''' --acl-coverage reports on the rules and runs nothing '''
+        for (covered, expected) in [(True, 0), (False, 1)]:
+            with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                                   return_value='some1'), \
+                    mock.patch.object(slapaclsuite, 'validate_input',
+                                      return_value='some2'), \
+                    mock.patch.object(slapaclsuite, 'run_tests') as mock_run_tests, \
+                    mock.patch.object(slapaclsuite.__main__, 'report_coverage',
+                                      return_value=covered) as mock_report:
+                retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                     '--acl-coverage', 'somefile.yaml'])
+            self.assertEqual(retval, expected)
+            mock_report.assert_called_once_with('some2', cache_dir=None)
+            mock_run_tests.assert_not_called()
+
+    def test_24_impact(self):
+        ''' --impact hands both trees to run_impact, and can not be --incremental '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'run_impact',
+                                  return_value=['PASS']) as mock_run_impact:
+            retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                 '--impact', 'old.d', 'new.d', 'somefile.yaml'])
+        self.assertEqual(retval, 0)
+        self.assertEqual(mock_run_impact.call_args[0], ('some2', 'old.d', 'new.d'))
+        self.assertIsNone(mock_run_impact.call_args[1]['index_dir'])
+
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                               return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input',
+                                  return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'run_impact',
+                                  side_effect=slapaclsuite.__main__.Unsupported('bad')), \
+                mock.patch('sys.stderr', new=StringIO()) as fake_err:
+            retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                 '--impact', 'old.d', 'new.d', 'somefile.yaml'])
+        self.assertEqual(retval, 1)
+        self.assertIn('--impact: bad', fake_err.getvalue())
+
+        with mock.patch('sys.stderr', new=StringIO()), \
+                self.assertRaises(SystemExit) as callreturn:
+            slapaclsuite.__main__.main(['scriptname', '--incremental', '--impact', 'a', 'b',
+                                        'somefile.yaml'])
+        self.assertEqual(callreturn.exception.code, 2)
+
+    def test_25_suite_cache(self):
+        ''' an unchanged test file is not read or validated again '''
+        with tempfile.TemporaryDirectory() as workdir:
+            test_file = os.path.join(workdir, 'suite.yaml')
+            with open(test_file, 'w') as test_fh:
+                test_fh.write('tests: []\n')
+            admin = AdministrativeSectionValidator()
+            admin.validate(None)
+            for (ingest_calls, extra) in [(1, []), (0, []), (1, ['--refresh-cache'])]:
+                with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                                       return_value='some1') as mock_ingest, \
+                        mock.patch.object(slapaclsuite, 'validate_input',
+                                          return_value={'administrative': admin,
+                                                        'tests': 'validated'}), \
+                        mock.patch.object(slapaclsuite, 'iter_commands',
+                                          return_value='some3'), \
+                        mock.patch.object(slapaclsuite, 'run_tests',
+                                          return_value=[]) as mock_run_tests:
+                    slapaclsuite.__main__.main(['scriptname', '--cache-dir', workdir] +
+                                               extra + [test_file])
+                self.assertEqual(mock_ingest.call_count, ingest_calls)
+                mock_run_tests.assert_called_once()
+
+    def test_26_several_files(self):
+        ''' several files, directories, or an include: go through load_suite '''
+        with tempfile.TemporaryDirectory() as workdir:
+            test_file = os.path.join(workdir, 'suite.yaml')
+            with open(test_file, 'w') as test_fh:
+                test_fh.write('include: [more.yaml]\n')
+            for (args, ingest_calls) in [(['a.yaml', 'b.yaml'], 0), ([workdir], 0),
+                                         ([test_file], 1)]:
+                with mock.patch.object(slapaclsuite, 'ingest_yaml_file',
+                                       return_value={'include': ['more.yaml']}) as mock_ingest, \
+                        mock.patch.object(slapaclsuite, 'load_suite',
+                                          return_value='some2') as mock_load_suite, \
+                        mock.patch.object(slapaclsuite, 'iter_commands',
+                                          return_value='some3'), \
+                        mock.patch.object(slapaclsuite, 'run_tests',
+                                          return_value=[]) as mock_run_tests:
+                    slapaclsuite.__main__.main(['scriptname', '--no-cache', '-j', '2'] + args)
+                self.assertEqual(mock_ingest.call_count, ingest_calls)
+                mock_load_suite.assert_called_once_with(args, cache_dir=None, jobs=2,
+                                                        verbose=False, refresh=False,
+                                                        timings=mock.ANY, validate_jobs=1)
+                self.assertEqual(mock_run_tests.call_args[0][0], 'some3')
+
+        with mock.patch.object(slapaclsuite, 'load_suite', side_effect=IOError('no such')), \
+                mock.patch('sys.stderr', new=StringIO()) as fake_err:
+            retval = slapaclsuite.__main__.main(['scriptname', 'a.yaml', 'b.yaml'])
+        self.assertEqual(retval, 1)
+        self.assertIn('no such', fake_err.getvalue())
+
+        with mock.patch.object(slapaclsuite, 'load_suite',
+                               side_effect=ValueError('defined differently')), \
+                mock.patch('sys.stderr', new=StringIO()) as fake_err:
+            retval = slapaclsuite.__main__.main(['scriptname', 'a.yaml', 'b.yaml'])
+        self.assertEqual(retval, 1)
+        self.assertIn('defined differently', fake_err.getvalue())
+
+    def test_27_sample(self):
+        ''' --sample hands iter_commands a seeded Sampler, and says how to replay it '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file', return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input', return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'iter_commands',
+                                  return_value=iter(['some3'])) as mock_iter_commands, \
+                mock.patch.object(slapaclsuite, 'run_tests',
+                                  return_value=[]) as mock_run_tests, \
+                mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            retval = slapaclsuite.__main__.main(['scriptname', '--no-cache', '--progress',
+                                                 '--sample', 'stratified', '--sample-seed', '9',
+                                                 'somefile.yaml'])
+        self.assertEqual(retval, 0)
+        sample = mock_iter_commands.call_args[1]['sample']
+        self.assertEqual((sample.strategy, sample.fraction, sample.seed), ('stratified', 0.1, 9))
+        self.assertEqual(mock_run_tests.call_args[0][0], ['some3'])
+        self.assertEqual(mock_run_tests.call_args[1]['total'], 1)
+        self.assertIn('--sample stratified --sample-fraction 0.1 --sample-seed 9',
+                      fake_out.getvalue())
+
+        for args in (['--sample', 'random', '--incremental'],
+                     ['--sample', 'random', '--sample-fraction', '0'],
+                     ['--sample', 'everything']):
+            with mock.patch('sys.stderr', new=StringIO()), \
+                    self.assertRaises(SystemExit) as callreturn:
+                slapaclsuite.__main__.main(['scriptname'] + args + ['somefile.yaml'])
+            self.assertEqual(callreturn.exception.code, 2)
+
+    def test_28_shard(self):
+        ''' --shard runs a share of the commands, and --results-jsonl keeps them to merge '''
+        commands = [(f'test{x}', {'script': ['slapacl', str(x)], 'path': [],
+                                  'expects': 'ALLOWED'}) for x in range(20)]
+        with tempfile.TemporaryDirectory() as workdir:
+            results_file = os.path.join(workdir, 'results.jsonl')
+            with mock.patch.object(slapaclsuite, 'ingest_yaml_file', return_value='some1'), \
+                    mock.patch.object(slapaclsuite, 'validate_input', return_value='some2'), \
+                    mock.patch.object(slapaclsuite, 'iter_commands', return_value=commands), \
+                    mock.patch.object(slapaclsuite, 'run_tests',
+                                      side_effect=lambda x, **_: list(x)) as mock_run_tests, \
+                    mock.patch('sys.stdout', new=StringIO()) as fake_out:
+                retval = slapaclsuite.__main__.main(['scriptname', '--no-cache', '--progress',
+                                                     '--shard', '2/3',
+                                                     '--results-jsonl', results_file,
+                                                     'somefile.yaml'])
+            with open(results_file) as results_fh:
+                summary = json.loads(results_fh.read())['summary']
+        run = mock_run_tests.call_args[0][0]
+        self.assertEqual(mock_run_tests.call_args[1]['total'], len(run))
+        self.assertEqual(mock_run_tests.call_args[1]['record'].__self__.index, 2)
+        self.assertIn(f'# shard 2/3: {len(run)} of 20 commands', fake_out.getvalue())
+        self.assertEqual((summary['shard'], summary['shards'], summary['commands']), (2, 3, 20))
+        self.assertEqual(retval, 1)
+
+        for args in (['--shard', '4/3'], ['--shard', 'two'],
+                     ['--shard', '1/2', '--incremental']):
+            with mock.patch('sys.stderr', new=StringIO()), \
+                    self.assertRaises(SystemExit) as callreturn:
+                slapaclsuite.__main__.main(['scriptname'] + args + ['somefile.yaml'])
+            self.assertEqual(callreturn.exception.code, 2)
+
+    def test_29_merge(self):
+        ''' slapaclsuite-merge reports the shards as one run, with its exit status '''
+        def result(status, description='test'):
+            ''' one line of a results file '''
+            return {'description': description, 'command': description, 'argv': ['slapacl'],
+                    'expected': 'ALLOWED', 'actual': 'DENIED', 'status': status,
+                    'duration': 0.1, 'stderr': None, 'cached': False, 'position': 0,
+                    'index': 0}
+
+        def summary(shard, stopped=None):
+            ''' the last line of a results file '''
+            return {'summary': {'shard': shard, 'shards': 2, 'plan': 'abc',
+                                'assignment': 'def', 'backend': 'slapacl', 'commands': 2,
+                                'stopped': stopped}}
+
+        with tempfile.TemporaryDirectory() as workdir:
+            def write(name, *lines):
+                ''' a results file '''
+                filename = os.path.join(workdir, name)
+                with open(filename, 'w') as output_fh:
+                    output_fh.writelines(json.dumps(x) + '\n' for x in lines)
+                return filename
+
+            passed = write('1.jsonl', dict(result('PASS'), index=1), summary(1))
+            failed = write('2.jsonl', result('FAIL', 'broken'), summary(2))
+            clean = write('3.jsonl', result('PASS', 'fine'), summary(2))
+            stopped = write('4.jsonl', summary(2, stopped='stopped (--maxfail)'))
+            outputs = []
+            for (files, expected) in [([passed, clean], 0), ([failed, passed], 1),
+                                      ([passed, stopped], 3), ([passed], 1)]:
+                with mock.patch('sys.stdout', new=StringIO()) as fake_out, \
+                        mock.patch('sys.stderr', new=StringIO()) as fake_err:
+                    retval = slapaclsuite.__main__.merge_main(['merge'] + files)
+                self.assertEqual(retval, expected)
+                outputs.append(fake_out.getvalue() + fake_err.getvalue())
+            history_file = os.path.join(workdir, 'durations.json')
+            with mock.patch('sys.stdout', new=StringIO()):
+                slapaclsuite.__main__.merge_main(['merge', '--history-file', history_file,
+                                                  failed, passed])
+            with open(history_file) as history_fh:
+                self.assertEqual(len(json.load(history_fh)['durations']['slapacl']), 2)
+        self.assertEqual(outputs[1].splitlines(),
+                         ['FAIL # broken', 'slapacl', '# expected "ALLOWED", but got "DENIED"',
+                          '# 2 shards, 2 commands, 2 checks: 1 PASS, 1 FAIL'])
+        self.assertIn('# shard 2: stopped (--maxfail)', outputs[2])
+        self.assertIn('Missing the results of shard(s) 2 of 2', outputs[3])
+
+    def test_30_duration_shards(self):
+        ''' runs keep a history of durations, and --shard-by duration plans from it '''
+        commands = [(f'test{x}', {'script': ['slapacl', '-u', str(x)], 'path': [],
+                                  'expects': 'ALLOWED'}) for x in range(20)]
+
+        def run_tests(commands, record=None, **_kwargs):
+            ''' every command passes, in a second '''
+            for (description, entry) in commands:
+                record(Result(description, description, entry['script'], 'ALLOWED',
+                              'ALLOWED', 'PASS', 1.0, None, False, 0))
+            return ['PASS']
+
+        with tempfile.TemporaryDirectory() as workdir:
+            history_file = os.path.join(workdir, 'durations.json')
+            outputs = []
+            for shard in ('1/2', '2/2'):
+                with mock.patch.object(slapaclsuite, 'ingest_yaml_file', return_value='some1'), \
+                        mock.patch.object(slapaclsuite, 'validate_input',
+                                          return_value='some2'), \
+                        mock.patch.object(slapaclsuite, 'iter_commands',
+                                          return_value=commands), \
+                        mock.patch.object(slapaclsuite, 'run_tests', new=run_tests), \
+                        mock.patch('sys.stdout', new=StringIO()) as fake_out:
+                    retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                         '--history-file', history_file,
+                                                         '--shard', shard, '--shard-by',
+                                                         'duration', 'somefile.yaml'])
+                self.assertEqual(retval, 0)
+                outputs.append(fake_out.getvalue())
+            with open(history_file) as history_fh:
+                durations = json.load(history_fh)['durations']['slapacl']
+        # Nothing was timed for the first shard, so both are guessed alike.
+        self.assertIn('# shard 1/2: expected to take 0.5s; the longest shard 0.5s', outputs[0])
+        self.assertIn('# shard 1/2: 10 of 20 commands', outputs[0])
+        # Half the commands now take a second; the rest are guessed at that.
+        self.assertIn('# shard 2/2: expected to take 10.0s; the longest shard 10.0s',
+                      outputs[1])
+        self.assertEqual(len(durations), 20)
+
+        for args in (['--shard', '1/2', '--shard-by', 'duration'],
+                     ['--shard', '1/2', '--history-file', 'history.json', '--last-failed']):
+            with mock.patch('sys.stderr', new=StringIO()), \
+                    self.assertRaises(SystemExit) as callreturn:
+                slapaclsuite.__main__.main(['scriptname'] + args + ['somefile.yaml'])
+            self.assertEqual(callreturn.exception.code, 2)
+
+    def test_31_schedule(self):
+        ''' --schedule longest-first hands run_tests what to expect of each command '''
+        with mock.patch.object(slapaclsuite, 'ingest_yaml_file', return_value='some1'), \
+                mock.patch.object(slapaclsuite, 'validate_input', return_value='some2'), \
+                mock.patch.object(slapaclsuite, 'iter_commands', return_value='some3'), \
+                mock.patch.object(slapaclsuite, 'run_tests', return_value=[]) as mock_run_tests:
+            retval = slapaclsuite.__main__.main(['scriptname', '--no-cache', '-j', '4',
+                                                 '--schedule', 'longest-first',
+                                                 'somefile.yaml'])
+        self.assertEqual(retval, 0)
+        schedule = mock_run_tests.call_args[1]['schedule']
+        self.assertIsInstance(schedule.__self__, History)
+        self.assertIsNone(schedule.__self__.filename)
+
+    def test_32_failed_first(self):
+        ''' --failed-first, --changed-first and --last-failed go by the last run '''
+        commands = [(f'test{x}', {'script': ['slapacl', str(x)], 'path': [],
+                                  'expects': 'ALLOWED'}) for x in range(5)]
+        with tempfile.TemporaryDirectory() as workdir:
+            history_file = os.path.join(workdir, 'history.json')
+            history = History(history_file)
+            for (description, entry) in commands[:4]:
+                history.record(Result(description, description, entry['script'], 'ALLOWED',
+                                      'DENIED' if description == 'test2' else 'ALLOWED',
+                                      'FAIL' if description == 'test2' else 'PASS', 1.0,
+                                      None, False, 0))
+            history.save()
+
+            runs = {}
+            for args in (['--failed-first'], ['--changed-first'],
+                         ['--failed-first', '--changed-first'], ['--last-failed']):
+                with mock.patch.object(slapaclsuite, 'ingest_yaml_file', return_value='some1'), \
+                        mock.patch.object(slapaclsuite, 'validate_input',
+                                          return_value='some2'), \
+                        mock.patch.object(slapaclsuite, 'iter_commands',
+                                          return_value=iter(commands)), \
+                        mock.patch.object(slapaclsuite, 'run_tests',
+                                          return_value=[]) as mock_run_tests:
+                    retval = slapaclsuite.__main__.main(['scriptname', '--no-cache',
+                                                         '--history-file', history_file,
+                                                         '--progress'] + args +
+                                                        ['somefile.yaml'])
+                self.assertEqual(retval, 0)
+                runs[' '.join(args)] = [x[0] for x in mock_run_tests.call_args[0][0]]
+                self.assertEqual(mock_run_tests.call_args[1]['total'],
+                                 len(runs[' '.join(args)]))
+        self.assertEqual(runs, {
+            '--failed-first': ['test2', 'test0', 'test1', 'test3', 'test4'],
+            '--changed-first': ['test4', 'test0', 'test1', 'test2', 'test3'],
+            '--failed-first --changed-first': ['test2', 'test4', 'test0', 'test1', 'test3'],
+            '--last-failed': ['test2'],
+        })
+
+        for args in (['--last-failed', '--no-cache'], ['--failed-first', '--incremental'],
+                     ['--changed-first', '--schedule', 'longest-first']):
+            with mock.patch('sys.stderr', new=StringIO()), \
+                    self.assertRaises(SystemExit) as callreturn:
+                slapaclsuite.__main__.main(['scriptname'] + args + ['somefile.yaml'])
+            self.assertEqual(callreturn.exception.code, 2)
+
+    def test_33_last_failed_keeps_history(self):
+        ''' fixing one check over many --last-failed runs forgets nothing about the rest '''
+        commands = [(f'test{x}', {'script': ['slapacl', str(x)], 'path': [],
+                                  'expects': 'ALLOWED'}) for x in range(5)]
+
+        def run_tests(commands, record=None, **_kwargs):
+            ''' test2 keeps failing; the rest pass '''
+            for (description, entry) in commands:
+                status = 'FAIL' if description == 'test2' else 'PASS'
+                record(Result(description, description, entry['script'], 'ALLOWED',
+                              'ALLOWED', status, 1.0, None, False, 0))
+            return ['PASS']
+
+        with tempfile.TemporaryDirectory() as workdir:
+            history_file = os.path.join(workdir, 'history.json')
+            for args in [[]] + [['--last-failed']] * (PRUNE_AFTER + 5):
+                with mock.patch.object(slapaclsuite, 'ingest_yaml_file', return_value='some1'), \
+                        mock.patch.object(slapaclsuite, 'validate_input',
+                                          return_value='some2'), \
+                        mock.patch.object(slapaclsuite, 'iter_commands',
+                                          return_value=iter(commands)), \
+                        mock.patch.object(slapaclsuite, 'run_tests', new=run_tests), \
+                        mock.patch('sys.stdout', new=StringIO()):
+                    slapaclsuite.__main__.main(['scriptname', '--no-cache', '--history-file',
+                                                history_file] + args + ['somefile.yaml'])
+            history = History(history_file)
+            self.assertEqual([x[0] for x in last_failed(commands, history)], ['test2'])
+            self.assertEqual([x[0] for x in prioritize(commands, history, changed_first=True)],
+                             [x[0] for x in commands])
+            self.assertEqual(history.estimate(commands[0]), 1.0)